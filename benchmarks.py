@@ -0,0 +1,827 @@
+import argparse
+import bz2
+import gzip
+import http.client
+import json
+import lzma
+import os
+import platform
+import random
+import resource
+import shutil
+import tempfile
+import threading
+import time
+import timeit
+import tracemalloc
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from multiprocessing import get_context
+from urllib.parse import urlencode
+
+import unbabel_cli
+
+# largest input file of the pipeline benchmark: the stream mode keeps the memory bounded, but the synthetic file
+# takes about 235 bytes per event on disk and is read once per stage and repetition
+MAX_PIPELINE_EVENTS = 10 ** 7
+
+
+def generate_timestamps(events_number):
+    """
+    :param events_number: number of timestamp strings to be generated
+    :return: list of timestamp strings (%Y-%m-%d %H:%M:%S.%f), a few seconds apart as in a real events file
+    """
+    start = datetime(2018, 12, 26, 18, 11, 8, 509654)
+    return [(start + timedelta(seconds=i * 3.7)).strftime(unbabel_cli.TIMESTAMP_FORMAT) for i in range(events_number)]
+
+
+def write_events_file(events_number, directory):
+    """
+    :param events_number: number of events to be written
+    :param directory: directory where the events file is created
+    :return: path of a json file with events_number events (one every 3.7 seconds, 4 clients)
+    """
+    input_file = os.path.join(directory, 'events.json')
+    with open(input_file, 'w') as f:
+        for index, timestamp in enumerate(generate_timestamps(events_number)):
+            f.write(json.dumps({'timestamp': timestamp, 'translation_id': '5aa5b2f39f7254a75aa' + str(index),
+                                'source_language': 'en', 'target_language': 'fr',
+                                'client_name': ['easyjet', 'booking', 'uniplaces', 'taxi-eats'][index % 4],
+                                'event_name': 'translation_delivered', 'nr_words': 30, 'duration': index % 97}) + '\n')
+    return input_file
+
+
+LANGUAGES = ['en', 'fr', 'de', 'es', 'pt', 'it', 'nl', 'pl', 'ru', 'ja', 'zh', 'ko', 'ar', 'tr', 'sv', 'da']
+
+
+def generate_events(events_number, span_minutes=None, clients=4, languages=2, skew=0.0, disorder=0.0, seed=0):
+    """
+    :param events_number: number of events to be generated
+    :param span_minutes: time span of the events (default: one event every 3.7 seconds)
+    :param clients: number of distinct client names
+    :param languages: number of distinct languages (source and target languages of every event are different)
+    :param skew: exponent of the zipf distribution of the clients and languages (0 for uniform)
+    :param disorder: fraction of the events written up to 5 minutes later than their timestamp (out of order)
+    :param seed: seed of the random generator (the same arguments always generate the same events)
+    :return: a generator of dict, one per event, with the structure of the input file lines
+    """
+    generator = random.Random(seed)
+    if span_minutes is None:
+        span_minutes = events_number * 3.7 / 60
+    start = datetime(2018, 12, 26, 18, 11, 8, 509654)
+    step = timedelta(minutes=span_minutes) / max(events_number, 1)
+    client_names = ['client-' + str(index) for index in range(clients)]
+    language_codes = (LANGUAGES + ['l' + str(index) for index in range(len(LANGUAGES), languages)])[:languages]
+    client_weights = [1 / (rank + 1) ** skew for rank in range(clients)]
+    language_weights = [1 / (rank + 1) ** skew for rank in range(languages)]
+    for index in range(events_number):
+        timestamp = start + step * index
+        if disorder and generator.random() < disorder:
+            timestamp -= timedelta(seconds=generator.uniform(0, 300))
+        source_language, target_language = generator.choices(language_codes, language_weights, k=2)
+        if source_language == target_language and languages > 1:
+            target_language = language_codes[(language_codes.index(source_language) + 1) % languages]
+        yield {'timestamp': timestamp.strftime(unbabel_cli.TIMESTAMP_FORMAT),
+               'translation_id': '%020x' % generator.getrandbits(80),
+               'source_language': source_language,
+               'target_language': target_language,
+               'client_name': generator.choices(client_names, client_weights)[0],
+               'event_name': 'translation_delivered',
+               'nr_words': generator.randint(1, 500),
+               'duration': generator.randint(1, 100)}
+
+
+def write_synthetic_file(input_file, events_number, **generator_options):
+    """
+    :param input_file: path of the json file to be written
+    :param events_number: number of events to be written
+    :param generator_options: options of generate_events (span_minutes, clients, languages, skew, disorder, seed)
+    :return: the events of generate_events written to the input file, one per line
+    """
+    with open(input_file, 'w') as f:
+        for event in generate_events(events_number, **generator_options):
+            f.write(json.dumps(event) + '\n')
+
+
+def best_time(function, repeat):
+    """
+    :param function: function (without arguments) to be timed
+    :param repeat: number of times the function is executed
+    :return: the best wall time (in seconds) of the executions
+    """
+    return min(timeit.repeat(function, number=1, repeat=repeat))
+
+
+def bench_timestamp_parsing(events_number, repeat):
+    """
+    :param events_number: number of timestamps to be parsed
+    :param repeat: number of times each parser is executed
+    :return: dict with the best time and the timestamps per second of datetime.strptime (the previous path)
+             and of parse_timestamp
+    """
+    timestamps = generate_timestamps(events_number)
+    strptime_time = best_time(lambda: [datetime.strptime(timestamp, unbabel_cli.TIMESTAMP_FORMAT)
+                                       for timestamp in timestamps], repeat)
+    parse_time = best_time(lambda: [unbabel_cli.parse_timestamp(timestamp) for timestamp in timestamps], repeat)
+    return {'events': events_number,
+            'strptime_seconds': strptime_time,
+            'strptime_per_second': events_number / strptime_time,
+            'parse_timestamp_seconds': parse_time,
+            'parse_timestamp_per_second': events_number / parse_time,
+            'speedup': strptime_time / parse_time}
+
+
+def bench_engines(events_number, repeat):
+    """
+    :param events_number: number of events to be aggregated (one every 3.7 seconds)
+    :param repeat: number of times each engine is executed
+    :return: dict with the best time of the per minute aggregation and of each available moving average engine
+             (window of 60 minutes) on the aggregated minutes
+    """
+    events_list = [{'timestamp': unbabel_cli.parse_timestamp(timestamp), 'duration': index % 97}
+                   for index, timestamp in enumerate(generate_timestamps(events_number))]
+    results = {'events': events_number,
+               'aggregate_minutes_seconds': best_time(lambda: unbabel_cli.aggregate_minutes(events_list), repeat)}
+    rollup = unbabel_cli.aggregate_minutes(events_list)
+    for engine, moving_average in sorted(unbabel_cli.ENGINES.items()):
+        if engine == 'numpy' and unbabel_cli.np is None:
+            continue
+        results[engine + '_seconds'] = best_time(lambda: moving_average(rollup, 60), repeat)
+    return results
+
+
+def sorted_window_percentiles(events_list, window_size, percentiles):
+    """
+    :param events_list: list of dict sorted per timestamp (in microseconds since EPOCH)
+    :param window_size: time window (in minutes)
+    :param percentiles: list of percentiles of each window
+    :return: list of the percentiles of the window of every minute, sorting the durations of each window (the
+             baseline of the FenwickTree of MetricsWindow)
+    """
+    results_list = []
+    window = deque()
+    head = 0
+    minute = events_list[0]['timestamp'] - events_list[0]['timestamp'] % unbabel_cli.MICROSECONDS_PER_MINUTE
+    while head < len(events_list) or window:
+        while head < len(events_list) and events_list[head]['timestamp'] <= minute:
+            window.append(events_list[head])
+            head += 1
+        while window and window[0]['timestamp'] < minute - window_size * unbabel_cli.MICROSECONDS_PER_MINUTE:
+            window.popleft()
+        durations = sorted(event['duration'] for event in window)
+        results_list.append([durations[max(-(-percentile * len(durations) // 100), 1) - 1] if durations else 0
+                             for percentile in percentiles])
+        minute += unbabel_cli.MICROSECONDS_PER_MINUTE
+    return results_list
+
+
+def bench_metrics(events_number, repeat):
+    """
+    :param events_number: number of events to be analysed (one every 3.7 seconds, random durations up to 10000)
+    :param repeat: number of times each computation is executed
+    :return: dict with the best time of the moving average alone, of the avg,p50,p90,p99,max,breach>=5000 metrics
+             (MetricsWindow) and of the same percentiles sorting the durations of each window, with a window of 60
+             minutes (about 970 events per window)
+    """
+    generator = random.Random(0)
+    events_list = [{'timestamp': unbabel_cli.parse_timestamp(timestamp), 'duration': generator.randint(0, 10000)}
+                   for timestamp in generate_timestamps(events_number)]
+    metrics = unbabel_cli.check_metrics('avg,p50,p90,p99,max,breach>=5000')
+    return {'events': events_number,
+            'average_seconds': best_time(lambda: unbabel_cli.minute_moving_average(
+                unbabel_cli.aggregate_minutes(events_list), 60), repeat),
+            'metrics_seconds': best_time(lambda: list(unbabel_cli.metrics_moving_average(events_list, 60, metrics)),
+                                         repeat),
+            'sorted_windows_seconds': best_time(lambda: sorted_window_percentiles(events_list, 60, [50, 90, 99]),
+                                                repeat)}
+
+
+def bench_weighted(events_number, repeat):
+    """
+    :param events_number: number of events to be aggregated (one every 3.7 seconds, with their number of words)
+    :param repeat: number of times each computation is executed
+    :return: dict with the best time of the per minute aggregation without and with the sums of words and weighted
+             durations, the bytes per minute of both rollups, and the best time of the moving average alone and of
+             the average, weighted average and seconds per word (window of 60 minutes)
+    """
+    events_list = [{'timestamp': unbabel_cli.parse_timestamp(timestamp), 'duration': index % 97,
+                    'nr_words': index % 499 + 1}
+                   for index, timestamp in enumerate(generate_timestamps(events_number))]
+    metrics = unbabel_cli.check_metrics('avg,weighted_avg,seconds_per_word')
+    rollup = unbabel_cli.aggregate_minutes(events_list, True)
+    return {'events': events_number,
+            'aggregate_minutes_seconds': best_time(lambda: unbabel_cli.aggregate_minutes(events_list), repeat),
+            'aggregate_words_seconds': best_time(lambda: unbabel_cli.aggregate_minutes(events_list, True), repeat),
+            'rollup_bytes_per_minute': len(unbabel_cli.aggregate_minutes(events_list).to_bytes()) / len(rollup),
+            'words_rollup_bytes_per_minute': len(rollup.to_bytes()) / len(rollup),
+            'average_seconds': best_time(lambda: unbabel_cli.minute_moving_average(rollup, 60), repeat),
+            'weighted_metrics_seconds': best_time(
+                lambda: unbabel_cli.rollup_metrics_moving_average(rollup, [60], metrics), repeat)}
+
+
+def bench_workers(events_number, repeat):
+    """
+    :param events_number: number of events of the input file
+    :param repeat: number of times each measure is executed
+    :return: dict with the best time of the single process pipeline (import, validate, aggregate and moving
+             average) and of the parallel pipeline for 1, 2, 4, ... workers (up to the number of cpus)
+    """
+    def single_process(input_file):
+        events_list = list(unbabel_cli.validate_events(unbabel_cli.import_events(input_file), unbabel_cli.EVENT_KEYS,
+                                                       'strict', Counter()))
+        return unbabel_cli.minute_moving_average(unbabel_cli.aggregate_minutes(events_list), 60)
+
+    def parallel(input_file, workers):
+        minute_totals = unbabel_cli.parallel_aggregate_events(input_file, workers, unbabel_cli.EVENT_KEYS, 'strict',
+                                                              None, None, None)
+        return unbabel_cli.minute_moving_average(minute_totals, 60)
+
+    results = {'events': events_number}
+    with tempfile.TemporaryDirectory() as directory:
+        input_file = write_events_file(events_number, directory)
+        results['single_process_seconds'] = best_time(lambda: single_process(input_file), repeat)
+        workers = 1
+        while workers <= (os.cpu_count() or 1):
+            results[str(workers) + '_workers_seconds'] = best_time(lambda: parallel(input_file, workers), repeat)
+            results[str(workers) + '_workers_speedup'] = (results['single_process_seconds'] /
+                                                          results[str(workers) + '_workers_seconds'])
+            workers *= 2
+    return results
+
+
+def bench_codec(events_number, repeat):
+    """
+    :param events_number: number of lines of the input file (and of the output)
+    :param repeat: number of times each measure is executed
+    :return: dict with the lines per second read line by line with json.loads (the previous path) and with
+             import_events, and written with json.dump(default=str) (the previous path) and with perform_export
+    """
+    output_list = [{'date': datetime(2018, 12, 26, 18, 11) + timedelta(minutes=index),
+                    'average_delivery_time': index % 97 if index % 3 else index / 7} for index in range(events_number)]
+
+    def read_lines(input_file):
+        with open(input_file) as f:
+            return [json.loads(line) for line in f]
+
+    def write_lines(output_file):
+        with open(output_file, 'w') as outfile:
+            for line in output_list:
+                json.dump(line, outfile, default=str)
+                outfile.write('\n')
+
+    def export_lines(output_file):
+        # perform_export does not overwrite an output file
+        if os.path.exists(output_file):
+            os.remove(output_file)
+        unbabel_cli.perform_export(output_list, output_file)
+
+    results = {'events': events_number, 'json_codec': unbabel_cli.JSON_CODEC}
+    with tempfile.TemporaryDirectory() as directory:
+        input_file = write_events_file(events_number, directory)
+        output_file = os.path.join(directory, 'output.json')
+        for name, function in (('json_loads', lambda: read_lines(input_file)),
+                               ('import_events', lambda: unbabel_cli.import_events(input_file)),
+                               ('json_dump', lambda: write_lines(output_file)),
+                               ('perform_export', lambda: export_lines(output_file))):
+            results[name + '_lines_per_second'] = events_number / best_time(function, repeat)
+    results['read_speedup'] = results['import_events_lines_per_second'] / results['json_loads_lines_per_second']
+    results['write_speedup'] = results['perform_export_lines_per_second'] / results['json_dump_lines_per_second']
+    return results
+
+
+def decompress_first(input_file):
+    """
+    :param input_file: path of a compressed events file
+    :return: the imported events, after decompressing the file to a temporary json file (the previous approach)
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        decompressed_file = os.path.join(directory, 'events.json')
+        with unbabel_cli.open_input(input_file) as f, open(decompressed_file, 'wb') as outfile:
+            shutil.copyfileobj(f, outfile)
+        return unbabel_cli.import_events(decompressed_file)
+
+
+def timed_peak_memory(function, *args):
+    """
+    :param function: function to be measured
+    :param args: arguments of the function
+    :return: tuple with the wall time (in seconds) of function(*args) and the peak RSS (in megabytes) of the process
+    """
+    start = time.perf_counter()
+    function(*args)
+    wall_time = time.perf_counter() - start
+    # ru_maxrss is in kilobytes on linux
+    return wall_time, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def measure_in_process(function, *args):
+    """
+    :param function: function to be measured (defined at module level)
+    :param args: arguments of the function
+    :return: timed_peak_memory of function(*args), executed in a new process so that peak RSS is not shared
+    """
+    with ProcessPoolExecutor(1, mp_context=get_context('spawn')) as executor:
+        return executor.submit(timed_peak_memory, function, *args).result()
+
+
+
+
+def lines_aggregate_groups(input_file):
+    """
+    :param input_file: path of the events file
+    :return: the groups of the events, imported as a list of dict first (lines reader)
+    """
+    events_list = list(unbabel_cli.validate_events(unbabel_cli.import_events(input_file), unbabel_cli.EVENT_KEYS,
+                                                   'strict', Counter()))
+    return unbabel_cli.aggregate_groups(events_list)
+
+
+def mmap_aggregate_groups(input_file):
+    """
+    :param input_file: path of the events file
+    :return: the groups of the events, read from the memory-mapped file (mmap reader)
+    """
+    return unbabel_cli.mmap_aggregate_groups(input_file, unbabel_cli.EVENT_KEYS, 'strict', Counter())[0]
+
+
+def shuffle_lines(input_file, output_file):
+    """
+    :param input_file: path of the events file
+    :param output_file: path of the file to be written
+    :return: the lines of the input file written in random order (seed 0) to the output file
+    """
+    with open(input_file) as f:
+        lines = f.readlines()
+    random.Random(0).shuffle(lines)
+    with open(output_file, 'w') as f:
+        f.writelines(lines)
+
+
+def in_memory_sort_averages(input_file):
+    """
+    :param input_file: path of the events file
+    :return: the moving average (window of 10 minutes) of the events, sorted in memory (batch mode with group by)
+    """
+    events = unbabel_cli.compact_events(unbabel_cli.validate_events(unbabel_cli.stream_lines(input_file),
+                                                                    unbabel_cli.EVENT_KEYS, 'strict', Counter()))
+    for _ in unbabel_cli.stream_moving_average(unbabel_cli.sort_events_timestamp(list(events)), 10):
+        pass
+
+
+def memory_limit_sort_averages(input_file, memory_limit=16):
+    """
+    :param input_file: path of the events file
+    :param memory_limit: megabytes of events kept in memory
+    :return: the moving average (window of 10 minutes) of the events, sorted by external_sort_events (stream mode with
+             a memory limit)
+    """
+    events = unbabel_cli.stream_check_events(unbabel_cli.stream_lines(input_file), unbabel_cli.EVENT_KEYS,
+                                             check_order=False)
+    events = unbabel_cli.external_sort_events(unbabel_cli.compact_events(events), memory_limit)
+    for _ in unbabel_cli.stream_moving_average(events, 10):
+        pass
+
+
+def bench_external_sort(events_number, repeat):
+    """
+    :param events_number: number of events of the input files
+    :param repeat: number of times each measure is executed
+    :return: dict with the best wall time and the peak RSS of the moving average of an almost sorted input file
+             (10% of the events up to 5 minutes late) and of a shuffled one, sorting the events in memory and with a
+             memory limit of 16 megabytes (reorder buffer and external merge sort, respectively)
+    """
+    results = {'events': events_number}
+    with tempfile.TemporaryDirectory() as directory:
+        almost_sorted_file = os.path.join(directory, 'almost_sorted.json')
+        write_synthetic_file(almost_sorted_file, events_number, disorder=0.1)
+        shuffled_file = os.path.join(directory, 'shuffled.json')
+        # shuffled in another process, so that the peak RSS inherited by the measures is not the one of the lines
+        measure_in_process(shuffle_lines, almost_sorted_file, shuffled_file)
+        for name, input_file in (('almost_sorted', almost_sorted_file), ('shuffled', shuffled_file)):
+            for sort, function in (('in_memory', in_memory_sort_averages),
+                                   ('memory_limit', memory_limit_sort_averages)):
+                measures = [measure_in_process(function, input_file) for _ in range(repeat)]
+                results[name + '_' + sort + '_seconds'] = min(wall_time for wall_time, _ in measures)
+                results[name + '_' + sort + '_peak_rss_mb'] = max(peak_rss for _, peak_rss in measures)
+    return results
+
+
+def bench_reader(events_number, repeat):
+    """
+    :param events_number: number of events of the input file
+    :param repeat: number of times each measure is executed
+    :return: dict with the best wall time and the peak RSS of reading, checking and aggregating per group the input
+             file with the lines reader and with the mmap reader
+    """
+    results = {'events': events_number}
+    with tempfile.TemporaryDirectory() as directory:
+        input_file = write_events_file(events_number, directory)
+        for name, function in (('lines', lines_aggregate_groups), ('mmap', mmap_aggregate_groups)):
+            measures = [measure_in_process(function, input_file) for _ in range(repeat)]
+            results[name + '_seconds'] = min(wall_time for wall_time, _ in measures)
+            results[name + '_peak_rss_mb'] = max(peak_rss for _, peak_rss in measures)
+    return results
+
+
+def traced_memory(function):
+    """
+    :param function: function (without arguments) which builds a list
+    :return: tuple with the list and the memory (in bytes) allocated by the function and still in use
+    """
+    tracemalloc.start()
+    try:
+        result = function()
+        memory = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    return result, memory
+
+
+def bench_events_memory(events_number, repeat):
+    """
+    :param events_number: number of events of the input file
+    :param repeat: not used (memory measures do not change between executions)
+    :return: dict with the memory per event of the validated events kept as dicts (import_events, the previous
+             representation) and as compact Event objects
+    """
+    def dict_events(input_file):
+        return list(unbabel_cli.validate_events(unbabel_cli.import_events(input_file), unbabel_cli.EVENT_KEYS, 'strict',
+                                                Counter()))
+
+    def compact_events(input_file):
+        return list(unbabel_cli.compact_events(unbabel_cli.validate_events(
+            unbabel_cli.stream_lines(input_file), unbabel_cli.EVENT_KEYS, 'strict', Counter())))
+
+    results = {'events': events_number}
+    with tempfile.TemporaryDirectory() as directory:
+        input_file = write_events_file(events_number, directory)
+        for name, function in (('dict', dict_events), ('event', compact_events)):
+            events_list, memory = traced_memory(lambda: function(input_file))
+            results[name + '_bytes_per_event'] = memory / len(events_list)
+            del events_list
+    results['reduction'] = results['dict_bytes_per_event'] / results['event_bytes_per_event']
+    return results
+
+
+def bench_event_store(events_number, repeat):
+    """
+    :param events_number: number of events of the input file
+    :param repeat: number of times each measure is executed
+    :return: dict with the time to load the EventStore and the queries per second of random queries (window size,
+             filters and a range of one hour), the first time each filter combination is queried and afterwards
+    """
+    generator = random.Random(0)
+    clients = [None, 'easyjet', 'booking', 'uniplaces', 'taxi-eats']
+    with tempfile.TemporaryDirectory() as directory:
+        input_file = write_events_file(events_number, directory)
+        results = {'events': events_number,
+                   'load_seconds': best_time(lambda: unbabel_cli.EventStore.from_file(input_file), repeat)}
+        store = unbabel_cli.EventStore.from_file(input_file)
+    first_minute = unbabel_cli.micros_to_datetime(store.rollup().minute(store.rollup().first))
+    span_minutes = len(store.rollup())
+    queries = []
+    for _ in range(1000):
+        start = first_minute + timedelta(minutes=generator.randrange(span_minutes))
+        queries.append({'window': generator.choice([1, 5, 10, 60]), 'client': generator.choice(clients),
+                        'source': generator.choice([None, 'en']), 'start': start, 'end': start + timedelta(hours=1)})
+
+    def run_queries(event_store):
+        for query in queries:
+            event_store.moving_average(**query)
+
+    results['first_queries_per_second'] = len(queries) / best_time(
+        lambda: run_queries(unbabel_cli.EventStore(store.groups)), repeat)
+    results['queries_per_second'] = len(queries) / best_time(lambda: run_queries(store), repeat)
+    return results
+
+
+def load_test(port, paths, clients):
+    """
+    :param port: port of the server (on localhost)
+    :param paths: paths to be requested, split between the clients
+    :param clients: number of concurrent clients (threads with a keep-alive connection each)
+    :return: tuple with the sorted latencies (in seconds) of the requests and the wall time of the test
+    """
+    latencies = []
+
+    def client(client_paths):
+        connection = http.client.HTTPConnection('127.0.0.1', port)
+        client_latencies = []
+        for path in client_paths:
+            start = time.perf_counter()
+            connection.request('GET', path)
+            response = connection.getresponse()
+            response.read()
+            client_latencies.append(time.perf_counter() - start)
+            assert response.status == 200, path
+        connection.close()
+        latencies.extend(client_latencies)
+
+    threads = [threading.Thread(target=client, args=(paths[index::clients],)) for index in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sorted(latencies), time.perf_counter() - start
+
+
+def bench_server(events_number, repeat):
+    """
+    :param events_number: number of events of the input file
+    :param repeat: number of times each of the 200 distinct queries is requested (by 4 concurrent clients)
+    :return: dict with the p50 and p99 latencies (in milliseconds) and the requests per second of the serve
+             subcommand, with the query cache and without it (every request computed)
+    """
+    generator = random.Random(0)
+    clients = [None, 'easyjet', 'booking', 'uniplaces', 'taxi-eats']
+    results = {'events': events_number}
+    with tempfile.TemporaryDirectory() as directory:
+        input_file = write_events_file(events_number, directory)
+        for name, cache_entries in (('cached', unbabel_cli.SERVER_CACHE_ENTRIES), ('uncached', 0)):
+            server = unbabel_cli.AverageServer(('127.0.0.1', 0), input_file, cache_entries=cache_entries)
+            thread = threading.Thread(target=server.serve_forever)
+            thread.start()
+            try:
+                rollup = server.store.rollup()
+                first_minute = unbabel_cli.micros_to_datetime(rollup.minute(rollup.first))
+                queries = []
+                for _ in range(200):
+                    query = {'window': generator.choice([1, 5, 10, 60]),
+                             'start': str(first_minute + timedelta(minutes=generator.randrange(len(rollup))))}
+                    query['end'] = str(datetime.fromisoformat(query['start']) + timedelta(hours=1))
+                    client = generator.choice(clients)
+                    if client is not None:
+                        query['client'] = client
+                    queries.append('/average?' + urlencode(query))
+                paths = queries * repeat
+                generator.shuffle(paths)
+                latencies, wall_time = load_test(server.server_address[1], paths, 4)
+            finally:
+                server.shutdown()
+                server.server_close()
+                thread.join()
+            results[name + '_p50_ms'] = latencies[len(latencies) // 2] * 1000
+            results[name + '_p99_ms'] = latencies[min(len(latencies) * 99 // 100, len(latencies) - 1)] * 1000
+            results[name + '_requests_per_second'] = len(latencies) / wall_time
+    return results
+
+
+def bench_time_range(events_number, repeat):
+    """
+    :param events_number: number of events of the input file (one every 3.7 seconds)
+    :param repeat: number of times each measure is executed
+    :return: dict with the best time to compute the moving average (window of 60 minutes) of the 6 hours in the
+             middle of the input file, reading the whole file, reading it until the end of the range (sorted input)
+             and starting on the offset index
+    """
+    def range_moving_average(input_file, first_minute, last_minute, sorted_input):
+        events, indexed = unbabel_cli.range_stream_events(input_file, first_minute, last_minute, 60)
+        events = unbabel_cli.validate_events(events, unbabel_cli.EVENT_KEYS, 'strict', Counter())
+        events = unbabel_cli.range_events(events, first_minute, last_minute, 60, sorted_input or indexed)
+        groups = unbabel_cli.aggregate_groups(unbabel_cli.compact_events(events))
+        rollup = unbabel_cli.merge_rollups(group['rollup'] for group in groups)
+        return unbabel_cli.minute_moving_average(rollup, 60, first_minute, last_minute)
+
+    results = {'events': events_number}
+    with tempfile.TemporaryDirectory() as directory:
+        input_file = write_events_file(events_number, directory)
+        middle = unbabel_cli.parse_timestamp(generate_timestamps(events_number)[events_number // 2])
+        first_minute = middle - middle % unbabel_cli.MICROSECONDS_PER_MINUTE
+        last_minute = first_minute + 6 * 60 * unbabel_cli.MICROSECONDS_PER_MINUTE
+        results['full_scan_seconds'] = best_time(
+            lambda: range_moving_average(input_file, first_minute, last_minute, False), repeat)
+        results['sorted_seconds'] = best_time(
+            lambda: range_moving_average(input_file, first_minute, last_minute, True), repeat)
+        results['index_build_seconds'] = best_time(lambda: unbabel_cli.write_offset_index(input_file), 1)
+        results['indexed_seconds'] = best_time(
+            lambda: range_moving_average(input_file, first_minute, last_minute, False), repeat)
+    results['indexed_speedup'] = results['full_scan_seconds'] / results['indexed_seconds']
+    return results
+
+
+def bench_windows(events_number, repeat):
+    """
+    :param events_number: number of events of the input file (one every 3.7 seconds)
+    :param repeat: number of times each measure is executed
+    :return: dict with the best time to compute the series of the 1, 5, 15 and 60 minutes windows with one run per
+             window size (reading, checking and aggregating the input file each time) and with a single run (one
+             ingest, one merged rollup and its prefix sums shared by every window size)
+    """
+    window_sizes = [1, 5, 15, 60]
+
+    def merged_rollup(input_file):
+        events = unbabel_cli.validate_events(unbabel_cli.stream_lines(input_file), unbabel_cli.EVENT_KEYS, 'strict',
+                                             Counter())
+        groups = unbabel_cli.aggregate_groups(unbabel_cli.compact_events(events))
+        return unbabel_cli.merge_rollups(group['rollup'] for group in groups)
+
+    def separate_runs(input_file):
+        return [unbabel_cli.minute_moving_average(merged_rollup(input_file), window_size)
+                for window_size in window_sizes]
+
+    results = {'events': events_number, 'window_sizes': window_sizes}
+    with tempfile.TemporaryDirectory() as directory:
+        input_file = write_events_file(events_number, directory)
+        results['separate_runs_seconds'] = best_time(lambda: separate_runs(input_file), repeat)
+        results['single_run_seconds'] = best_time(
+            lambda: unbabel_cli.multi_window_moving_average(merged_rollup(input_file), window_sizes), repeat)
+        rollup = merged_rollup(input_file)
+        results['separate_engines_seconds'] = best_time(
+            lambda: [unbabel_cli.minute_moving_average(rollup, window_size) for window_size in window_sizes], repeat)
+        results['multi_window_engine_seconds'] = best_time(
+            lambda: unbabel_cli.multi_window_moving_average(rollup, window_sizes), repeat)
+    results['speedup'] = results['separate_runs_seconds'] / results['single_run_seconds']
+    return results
+
+
+def bench_compression(events_number, repeat):
+    """
+    :param events_number: number of events of the input file
+    :param repeat: number of times each measure is executed
+    :return: dict with the best wall time and the peak RSS of import_events on each compressed input file, read as a
+             stream or decompressed to a temporary file first
+    """
+    compressors = {'.gz': gzip.compress, '.bz2': bz2.compress, '.xz': lzma.compress}
+    if unbabel_cli.zstandard is not None:
+        compressors['.zst'] = unbabel_cli.zstandard.ZstdCompressor().compress
+    results = {'events': events_number}
+    with tempfile.TemporaryDirectory() as directory:
+        input_file = write_events_file(events_number, directory)
+        with open(input_file, 'rb') as f:
+            content = f.read()
+        results['json_size'] = len(content)
+        for extension, compress in sorted(compressors.items()):
+            compressed_file = input_file + extension
+            with open(compressed_file, 'wb') as f:
+                f.write(compress(content))
+            for name, function in (('stream', unbabel_cli.import_events), ('decompress_first', decompress_first)):
+                measures = [measure_in_process(function, compressed_file) for _ in range(repeat)]
+                results[extension[1:] + '_' + name + '_seconds'] = min(wall_time for wall_time, _ in measures)
+                results[extension[1:] + '_' + name + '_peak_rss_mb'] = max(peak_rss for _, peak_rss in measures)
+    return results
+
+
+def pipeline_stages(input_file, output_file, memory_limit):
+    """
+    :param input_file: path of the events file
+    :param output_file: path where the results are exported (replaced on every run)
+    :param memory_limit: megabytes of events kept in memory by external_sort_events
+    :return: list of (name, function) tuples of the stages of the stream mode, each function taking the output
+             generator of the previous stage (None for the first one)
+    """
+    def export(results_list):
+        if os.path.exists(output_file):
+            os.remove(output_file)
+        unbabel_cli.perform_export(results_list, output_file)
+
+    return [('stream_lines', lambda _: unbabel_cli.stream_lines(input_file)),
+            ('check_events', lambda lines: unbabel_cli.stream_check_events(lines, unbabel_cli.EVENT_KEYS,
+                                                                           check_order=False)),
+            ('external_sort_events', lambda events: unbabel_cli.external_sort_events(
+                unbabel_cli.compact_events(events), memory_limit)),
+            ('filter_events', lambda events: unbabel_cli.stream_filter_events(events, 'client-0', None, None)),
+            ('moving_average', lambda events: unbabel_cli.stream_moving_average(events, 10)),
+            ('perform_export', export)]
+
+
+def time_pipeline(stages, events_number, repeat):
+    """
+    :param stages: list of (name, function) tuples returned by pipeline_stages
+    :param events_number: number of events of the input file
+    :param repeat: number of times each measure is executed (the best time is kept)
+    :return: dict with the measures of every stage: the stages run interleaved (one record at a time), so the
+             pipeline is drained up to each stage and the time of a stage is the difference with the previous one
+    """
+    measures = {}
+    previous_seconds = 0
+    records_in = events_number
+    for index, (name, _) in enumerate(stages):
+        best_seconds = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            records = None
+            for _, function in stages[:index + 1]:
+                records = function(records)
+            # the export consumes the records itself
+            records_out = records_in if records is None else sum(1 for _ in records)
+            seconds = time.perf_counter() - start
+            if best_seconds is None or seconds < best_seconds:
+                best_seconds = seconds
+        seconds = max(best_seconds - previous_seconds, 0)
+        measures[name] = {'seconds': seconds, 'records_in': records_in, 'records_out': records_out,
+                          'records_per_second': records_in / seconds if seconds else None}
+        previous_seconds = best_seconds
+        records_in = records_out
+    return measures
+
+
+def bench_pipeline(sizes, repeat, generator_options, memory_limit=16):
+    """
+    :param sizes: list of numbers of events of the input files (up to MAX_PIPELINE_EVENTS)
+    :param repeat: number of times each stage is executed (the best time is kept)
+    :param generator_options: options of generate_events (span_minutes, clients, languages, skew, disorder, seed)
+    :param memory_limit: megabytes of events kept in memory by external_sort_events
+    :return: dict with the stages of the stream mode timed separately for every size: stream_lines,
+             check_events (stream_check_events), external_sort_events (with the memory limit), filter_events
+             (stream_filter_events on the most frequent client), moving_average (stream_moving_average, window of 10
+             minutes) and perform_export; the memory stays bounded whatever the size
+    """
+    results = {'python': platform.python_version(), 'json_codec': unbabel_cli.JSON_CODEC,
+               'numpy': unbabel_cli.np is not None, 'generator': generator_options, 'memory_limit': memory_limit,
+               'sizes': {}}
+    with tempfile.TemporaryDirectory() as directory:
+        for events_number in sizes:
+            input_file = os.path.join(directory, 'events.json')
+            output_file = os.path.join(directory, 'output.json')
+            write_synthetic_file(input_file, events_number, **generator_options)
+            stages = time_pipeline(pipeline_stages(input_file, output_file, memory_limit), events_number, repeat)
+            results['sizes'][str(events_number)] = {
+                'events': events_number, 'file_size': os.path.getsize(input_file),
+                'total_seconds': sum(stage['seconds'] for stage in stages.values()), 'stages': stages}
+            os.remove(input_file)
+    return results
+
+
+def compare_results(results, baseline):
+    """
+    :param results: dict returned by bench_pipeline
+    :param baseline: dict returned by bench_pipeline on a previous version (e.g. loaded from its --output file)
+    :return: dict with the ratio of the time of every stage (and of the total) to the baseline for every size
+             measured in both (above 1 is a regression)
+    """
+    ratios = {}
+    for size, measures in results['sizes'].items():
+        baseline_measures = baseline.get('sizes', {}).get(size)
+        if baseline_measures is None:
+            continue
+        ratios[size] = {name: stage['seconds'] / baseline_measures['stages'][name]['seconds']
+                        for name, stage in measures['stages'].items()
+                        if name in baseline_measures['stages'] and baseline_measures['stages'][name]['seconds']}
+        ratios[size]['total'] = measures['total_seconds'] / baseline_measures['total_seconds']
+    return ratios
+
+
+BENCHMARKS = {'compression': bench_compression,
+              'codec': bench_codec,
+              'timestamps': bench_timestamp_parsing,
+              'engines': bench_engines,
+              'event_store': bench_event_store,
+              'events_memory': bench_events_memory,
+              'external_sort': bench_external_sort,
+              'metrics': bench_metrics,
+              'reader': bench_reader,
+              'server': bench_server,
+              'time_range': bench_time_range,
+              'weighted': bench_weighted,
+              'windows': bench_windows,
+              'workers': bench_workers}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('benchmark', choices=sorted(list(BENCHMARKS) + ['pipeline']), help="benchmark to be executed")
+    parser.add_argument('--events', default=100000, type=int, dest="events",
+                        help="number of events to be used on the benchmark")
+    parser.add_argument('--repeat', default=5, type=int, dest="repeat",
+                        help="number of times each measure is repeated (the best one is reported)")
+    parser.add_argument('--output', default=None, type=str, dest="output",
+                        help="path of a json file where the results are saved")
+    pipeline_options = parser.add_argument_group('pipeline benchmark options')
+    pipeline_options.add_argument('--sizes', default='1000,10000,100000', type=str, dest="sizes",
+                                  help="comma separated numbers of events (e.g. 1e3,1e4,1e5,1e6, up to 1e7)")
+    pipeline_options.add_argument('--span_minutes', default=None, type=float, dest="span_minutes",
+                                  help="time span of the events (default: one event every 3.7 seconds)")
+    pipeline_options.add_argument('--clients', default=4, type=int, dest="clients",
+                                  help="number of distinct client names")
+    pipeline_options.add_argument('--languages', default=2, type=int, dest="languages",
+                                  help="number of distinct languages")
+    pipeline_options.add_argument('--skew', default=0.0, type=float, dest="skew",
+                                  help="exponent of the zipf distribution of clients and languages (0 for uniform)")
+    pipeline_options.add_argument('--disorder', default=0.0, type=float, dest="disorder",
+                                  help="fraction of the events out of timestamp order (up to 5 minutes late)")
+    pipeline_options.add_argument('--seed', default=0, type=int, dest="seed",
+                                  help="seed of the synthetic events generator")
+    pipeline_options.add_argument('--baseline', default=None, type=str, dest="baseline",
+                                  help="path of the saved results of a previous version, to be compared with")
+
+    args = parser.parse_args()
+
+    if args.benchmark == 'pipeline':
+        options = {'span_minutes': args.span_minutes, 'clients': args.clients, 'languages': args.languages,
+                   'skew': args.skew, 'disorder': args.disorder, 'seed': args.seed}
+        sizes = [int(float(size)) for size in args.sizes.split(',')]
+        if not all(0 < size <= MAX_PIPELINE_EVENTS for size in sizes):
+            parser.error("sizes must be between 1 and " + str(MAX_PIPELINE_EVENTS))
+        results = bench_pipeline(sizes, args.repeat, options)
+        if args.baseline is not None:
+            with open(args.baseline) as f:
+                results['baseline_ratios'] = compare_results(results, json.load(f))
+    else:
+        results = BENCHMARKS[args.benchmark](args.events, args.repeat)
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=4)
+    print(json.dumps(results, indent=4))
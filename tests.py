@@ -1,7 +1,55 @@
 import unittest
 import unbabel_cli
 import os
+import asyncio
+import bz2
 import datetime
+import gzip
+import io
+import json
+import lzma
+import random
+import shutil
+import tempfile
+import threading
+import urllib.error
+import urllib.request
+from unittest import mock
+
+
+def random_events(seed, events_number):
+    """
+    :param seed: seed of the random generator (so that failures can be reproduced)
+    :param events_number: number of events to be generated
+    :return: list of dict with random timestamps (some of them on exact minutes) and durations, sorted per timestamp
+    """
+    generator = random.Random(seed)
+    start = datetime.datetime(2018, 12, 26, 18, 0)
+    events_list = []
+    for _ in range(events_number):
+        timestamp = start + datetime.timedelta(minutes=generator.randint(0, 120))
+        if generator.random() < 0.7:
+            timestamp += datetime.timedelta(seconds=generator.randint(0, 59), microseconds=generator.randint(0, 999999))
+        events_list.append({'timestamp': timestamp, 'duration': generator.randint(0, 100)})
+    return sorted(events_list, key=lambda k: k['timestamp'])
+
+
+def micros_events(events_list):
+    """
+    :param events_list: list of dict with timestamps as datetime
+    :return: a copy of the list with timestamps in microseconds since EPOCH (as the validated events)
+    """
+    return [dict(event, timestamp=unbabel_cli.datetime_to_micros(event['timestamp'])) for event in events_list]
+
+
+def reference_moving_average(events_list, window_size):
+    """
+    :param events_list: list of dict with timestamps in microseconds since EPOCH (as the validated events)
+    :param window_size: time window (in minutes) to be considered on the moving average calculation
+    :return: the output of moving_average, the reference implementation, on the events with datetime timestamps
+    """
+    return unbabel_cli.moving_average([dict(event, timestamp=unbabel_cli.micros_to_datetime(event['timestamp']))
+                                       for event in events_list], window_size)
 
 
 class TestUnbabel_cli(unittest.TestCase):
@@ -183,6 +231,25 @@ class TestUnbabel_cli(unittest.TestCase):
             unbabel_cli.check_extension('unbabel_cli_output', 'output')
             self.assertEqual(cm.exception, 1)
 
+    def test_input_compression(self):
+        self.assertEqual(unbabel_cli.input_compression('events.json'), None)
+        self.assertEqual(unbabel_cli.input_compression('events.json.gz'), '.gz')
+        self.assertEqual(unbabel_cli.input_compression('EVENTS.JSON.XZ'), '.xz')
+        self.assertEqual(unbabel_cli.input_compression('events.gz'), None)
+
+        self.assertEqual(unbabel_cli.check_extension('events.json.bz2', 'input'), None)
+        with self.assertRaises(SystemExit) as cm:
+            unbabel_cli.check_extension('events.txt.gz', 'input')
+            self.assertEqual(cm.exception, 1)
+        with self.assertRaises(SystemExit) as cm:
+            unbabel_cli.check_extension('output.json.gz', 'output')
+            self.assertEqual(cm.exception, 1)
+
+        self.assertEqual(unbabel_cli.check_uncompressed_input('events.json', 'workers'), None)
+        with self.assertRaises(SystemExit) as cm:
+            unbabel_cli.check_uncompressed_input('events.json.gz', 'workers')
+            self.assertEqual(cm.exception, 1)
+
     def test_check_existence(self):
         result = unbabel_cli.check_existence('events.json')
         self.assertTrue(result)
@@ -190,6 +257,19 @@ class TestUnbabel_cli(unittest.TestCase):
         result = unbabel_cli.check_existence('not_exists.json')
         self.assertFalse(result)
 
+    def test_iter_lines(self):
+        with open('events.json', 'rb') as f:
+            expected = f.read().splitlines()
+        for block_size in (1, 7, 64, unbabel_cli.READ_BLOCK_SIZE):
+            with open('events.json', 'rb') as f:
+                self.assertEqual(list(unbabel_cli.iter_lines(f, block_size)), expected)
+
+    def test_json_codecs(self):
+        with open('events.json', 'rb') as f:
+            lines = f.read().splitlines()
+        for codec, loads in unbabel_cli.JSON_CODECS.items():
+            self.assertEqual([loads(line) for line in lines], [json.loads(line) for line in lines], codec)
+
     def test_import_events(self):
         with self.assertRaises(SystemExit) as cm:
             unbabel_cli.import_events('not_exists.json')
@@ -203,6 +283,36 @@ class TestUnbabel_cli(unittest.TestCase):
         #    unbabel_cli.import_events('cannot_read.json')
         #    self.assertEqual(cm.exception, 1)
 
+    def test_import_events_compressed(self):
+        with open('events.json', 'rb') as f:
+            content = f.read()
+        compressors = {'.gz': gzip.compress, '.bz2': bz2.compress, '.xz': lzma.compress}
+        if unbabel_cli.zstandard is not None:
+            compressors['.zst'] = unbabel_cli.zstandard.ZstdCompressor().compress
+        with tempfile.TemporaryDirectory() as directory:
+            for extension, compress in compressors.items():
+                input_file = os.path.join(directory, 'events.json' + extension)
+                with open(input_file, 'wb') as f:
+                    f.write(compress(content))
+                self.assertEqual(unbabel_cli.import_events(input_file), self.events_list)
+                self.assertEqual(list(unbabel_cli.stream_check_events(unbabel_cli.stream_lines(input_file),
+                                                                      self.dict_keys)),
+                                 micros_events(self.convert_events_timestamp))
+
+            # truncated or corrupt archives
+            for extension, compress in compressors.items():
+                for name, data in (('truncated', compress(content)[:-10]), ('corrupt', compress(content)[:20] +
+                                                                          bytes(100) + compress(content)[20:])):
+                    input_file = os.path.join(directory, name + '.json' + extension)
+                    with open(input_file, 'wb') as f:
+                        f.write(data)
+                    with self.assertRaises(SystemExit) as cm:
+                        unbabel_cli.import_events(input_file)
+                        self.assertEqual(cm.exception, 1)
+                    with self.assertRaises(SystemExit) as cm:
+                        list(unbabel_cli.stream_lines(input_file))
+                        self.assertEqual(cm.exception, 1)
+
     def test_check_window_size(self):
         result = unbabel_cli.check_window_size(10)
         self.assertEqual(result, None)
@@ -219,6 +329,43 @@ class TestUnbabel_cli(unittest.TestCase):
             unbabel_cli.convert_events_timestamp(self.timestamp_error)
             self.assertEqual(cm.exception, 1)
 
+    def test_parse_timestamp(self):
+        result = unbabel_cli.parse_timestamp('2018-12-26 18:11:08.509654')
+        self.assertEqual(result, unbabel_cli.datetime_to_micros(datetime.datetime(2018, 12, 26, 18, 11, 8, 509654)))
+        self.assertEqual(unbabel_cli.micros_to_datetime(result), datetime.datetime(2018, 12, 26, 18, 11, 8, 509654))
+
+        # layouts accepted by datetime.strptime are still accepted
+        result = unbabel_cli.parse_timestamp('2018-12-26 18:11:08.5')
+        self.assertEqual(result, unbabel_cli.datetime_to_micros(datetime.datetime(2018, 12, 26, 18, 11, 8, 500000)))
+
+        for timestamp in ['2018-12-26', '2018-13-26 18:11:08.509654', '2018-12-26 18:11:60.509654',
+                          '2018-12-26T18:11:08.509654', '2018-12-26 18:11:08.50965a', '20_8-12-26 18:11:08.509654',
+                          '+018-12-26 18:11:08.509654', '2018-12-26 18: 1:08.509654',
+                          '2018-12-26 18:11:08.50965\u0663']:
+            with self.assertRaises(ValueError):
+                unbabel_cli.parse_timestamp(timestamp)
+
+        # a timestamp is accepted (with the same value) only if datetime.strptime accepts it
+        valid_timestamp = '2018-12-26 18:11:08.509654'
+        for index in range(len(valid_timestamp)):
+            for character in ('0', '9', ' ', '+', '-', '_', 'a', '\uff11', '\u0663'):
+                timestamp = valid_timestamp[:index] + character + valid_timestamp[index + 1:]
+                try:
+                    expected = unbabel_cli.datetime_to_micros(
+                        datetime.datetime.strptime(timestamp, unbabel_cli.TIMESTAMP_FORMAT))
+                except ValueError:
+                    expected = None
+                try:
+                    result = unbabel_cli.parse_timestamp(timestamp)
+                except ValueError:
+                    result = None
+                self.assertEqual(result, expected, timestamp)
+
+        for seed in range(5):
+            for event in random_events(seed, 100):
+                self.assertEqual(unbabel_cli.parse_timestamp(event['timestamp'].strftime('%Y-%m-%d %H:%M:%S.%f')),
+                                 unbabel_cli.datetime_to_micros(event['timestamp']))
+
     def test_check_event_name(self):
         result = unbabel_cli.check_event_name(self.events_list)
         self.assertEqual(result, None)
@@ -251,6 +398,141 @@ class TestUnbabel_cli(unittest.TestCase):
             unbabel_cli.check_events(self.keys_error, self.dict_keys)
             self.assertEqual(cm.exception, 1)
 
+        # already converted timestamps (e.g. with microsecond 0) are not parsed again
+        events_list = [dict(self.events_list[0], timestamp=datetime.datetime(2018, 12, 26, 18, 11))]
+        result = unbabel_cli.check_events(events_list, self.dict_keys)
+        self.assertEqual(result, None)
+        self.assertEqual(events_list[0]['timestamp'],
+                         unbabel_cli.datetime_to_micros(datetime.datetime(2018, 12, 26, 18, 11)))
+
+    def test_check_event(self):
+        self.assertEqual(unbabel_cli.check_event(self.events_list[0], self.dict_keys), None)
+        self.assertEqual(self.events_list[0]['timestamp'],
+                         unbabel_cli.datetime_to_micros(self.convert_events_timestamp[0]['timestamp']))
+        self.assertEqual(unbabel_cli.check_event(dict(self.keys_error[0]), self.dict_keys), 'missing keys')
+        self.assertEqual(unbabel_cli.check_event(dict(self.timestamp_error[0]), self.dict_keys), 'invalid timestamp')
+        self.assertEqual(unbabel_cli.check_event(dict(self.name_error[0]), self.dict_keys), 'invalid event name')
+        self.assertEqual(unbabel_cli.check_event(dict(self.duration_error_1[0]), self.dict_keys), 'invalid duration')
+        self.assertEqual(unbabel_cli.check_event(dict(self.duration_error_2[0]), self.dict_keys), 'invalid duration')
+        # nr_words is only checked when the words are used
+        for nr_words in (-1, 2.5, None, '30'):
+            self.assertEqual(unbabel_cli.check_event(dict(self.events_list[1], nr_words=nr_words), self.dict_keys),
+                             None)
+            self.assertEqual(unbabel_cli.check_event(dict(self.events_list[1], nr_words=nr_words), self.dict_keys,
+                                                     True), 'invalid nr_words')
+
+    def test_event_bounds(self):
+        # durations and numbers of words which would overflow the per minute totals are rejected by both readers
+        events_list = [dict(self.events_list[0], duration=unbabel_cli.MAX_DURATION, nr_words=unbabel_cli.MAX_NR_WORDS),
+                       dict(self.events_list[0], duration=2 ** 62), dict(self.events_list[0], duration=2 ** 62),
+                       dict(self.events_list[1], nr_words=2 ** 62), dict(self.events_list[1], nr_words=2 ** 62)]
+        self.assertEqual(unbabel_cli.check_event(dict(events_list[0]), self.dict_keys, True), None)
+        self.assertEqual(unbabel_cli.check_event(dict(events_list[1]), self.dict_keys), 'invalid duration')
+        self.assertEqual(unbabel_cli.check_event(dict(events_list[3]), self.dict_keys), None)
+        self.assertEqual(unbabel_cli.check_event(dict(events_list[3]), self.dict_keys, True), 'invalid nr_words')
+        with tempfile.TemporaryDirectory() as directory:
+            input_file = os.path.join(directory, 'events.json')
+            with open(input_file, 'w') as f:
+                f.write('\n'.join(json.dumps(event) for event in events_list +
+                                  [dict(self.events_list[0], duration=10 ** 30)]))
+            for words in (False, True):
+                expected_rejections = unbabel_cli.Counter()
+                expected = unbabel_cli.aggregate_groups(unbabel_cli.validate_events(
+                    unbabel_cli.stream_lines(input_file), self.dict_keys, 'strict', expected_rejections, words), words)
+                rejections = unbabel_cli.Counter()
+                result = unbabel_cli.mmap_aggregate_groups(input_file, self.dict_keys, 'strict', rejections, words)[0]
+                self.assertEqual(rejections, expected_rejections)
+                self.assertEqual(rejections['invalid duration'], 3)
+                self.assertEqual(rejections['invalid nr_words'], 2 if words else 0)
+                self.assertEqual([list(group['rollup'].items()) for group in result],
+                                 [list(group['rollup'].items()) for group in expected])
+
+    def test_validate_events(self):
+        invalid_events = [dict(event) for event in self.keys_error + self.timestamp_error + self.name_error +
+                          self.duration_error_1 + self.duration_error_2]
+
+        rejections = unbabel_cli.Counter()
+        result = list(unbabel_cli.validate_events(self.events_list + invalid_events, self.dict_keys, 'strict',
+                                                  rejections))
+        self.assertEqual(result, micros_events(self.convert_events_timestamp))
+        self.assertEqual(rejections, {'missing keys': 1, 'invalid timestamp': 1, 'invalid event name': 1,
+                                      'invalid duration': 2})
+
+        # invalid numbers of words are only rejected when the words are used
+        for words, expected_rejections in ((False, {}), (True, {'invalid nr_words': 1})):
+            rejections = unbabel_cli.Counter()
+            result = list(unbabel_cli.validate_events([dict(self.convert_events_timestamp[1], nr_words='30')],
+                                                      self.dict_keys, 'strict', rejections, words))
+            self.assertEqual(len(result), 1 - len(expected_rejections))
+            self.assertEqual(rejections, expected_rejections)
+
+        # off only converts timestamps
+        rejections = unbabel_cli.Counter()
+        result = list(unbabel_cli.validate_events([dict(event) for event in self.name_error + self.timestamp_error],
+                                                  self.dict_keys, 'off', rejections))
+        self.assertEqual(len(result), 1)
+        self.assertEqual(rejections, {'invalid timestamp': 1})
+
+        # sample checks the first event out of VALIDATION_SAMPLE_RATE
+        rejections = unbabel_cli.Counter()
+        result = list(unbabel_cli.validate_events([dict(event) for event in self.name_error * 2], self.dict_keys,
+                                                  'sample', rejections))
+        self.assertEqual(len(result), 1)
+        self.assertEqual(rejections, {'invalid event name': 1})
+
+        # lines are decoded, whatever the validation
+        with open('events.json', 'rb') as f:
+            lines = [f.readline().rstrip(b'\n'), b'not json', '{"timestamp": ', b'[1, 2]', '"event"']
+        for validation in ('strict', 'sample', 'off'):
+            rejections = unbabel_cli.Counter()
+            result = list(unbabel_cli.validate_events(lines, self.dict_keys, validation, rejections))
+            self.assertEqual(result, micros_events(self.convert_events_timestamp[:1]))
+            self.assertEqual(rejections, {'invalid json': 2, 'missing keys': 2})
+
+    def test_compact_events(self):
+        events_list = micros_events(self.convert_events_timestamp)
+        result = list(unbabel_cli.compact_events(dict(event) for event in events_list))
+        self.assertEqual(len(result), len(events_list))
+        for event, compact_event in zip(events_list, result):
+            for key in ('timestamp', 'duration', 'client_name', 'source_language', 'target_language'):
+                self.assertEqual(compact_event[key], event[key])
+            with self.assertRaises(KeyError):
+                compact_event['translation_id']
+            with self.assertRaises(AttributeError):
+                compact_event.translation_id = '5aa5b2f39f7254a75aa5'
+        # the strings of the groups are shared by the events
+        self.assertIs(result[0].client_name, result[1].client_name)
+        self.assertIs(result[0].target_language, result[2].target_language)
+        self.assertEqual(result[0],
+                         unbabel_cli.Event(*(events_list[0][key] for key in unbabel_cli.Event.__slots__[:-1])))
+        self.assertNotEqual(result[0], result[1])
+        # the number of words is only kept when the words are used
+        self.assertEqual(result[0].nr_words, 0)
+        self.assertEqual(next(unbabel_cli.compact_events([dict(events_list[0])], True)),
+                         unbabel_cli.Event(*(events_list[0][key] for key in unbabel_cli.Event.__slots__)))
+
+        # compact events go through the same filters, sort and moving averages as the dicts
+        self.assertEqual(unbabel_cli.minute_moving_average(unbabel_cli.aggregate_minutes(
+            unbabel_cli.filter_events(result, 'easyjet', None, None)), 10),
+                         reference_moving_average(unbabel_cli.filter_events(events_list, 'easyjet', None, None), 10))
+        self.assertEqual(list(unbabel_cli.group_moving_average(unbabel_cli.sort_events_timestamp(result), 10,
+                                                               ['client_name'])),
+                         list(unbabel_cli.group_moving_average(events_list, 10, ['client_name'])))
+        self.assertEqual(dict(unbabel_cli.aggregate_groups(result)[0]['rollup'].items()),
+                         dict(unbabel_cli.aggregate_groups(events_list)[0]['rollup'].items()))
+
+    def test_report_rejections(self):
+        result = unbabel_cli.report_rejections(unbabel_cli.Counter({'invalid duration': 2}), 3)
+        self.assertEqual(result, None)
+
+        with self.assertRaises(SystemExit) as cm:
+            unbabel_cli.report_rejections(unbabel_cli.Counter(), 0)
+            self.assertEqual(cm.exception, 1)
+
+        with self.assertRaises(SystemExit) as cm:
+            unbabel_cli.report_rejections(unbabel_cli.Counter({'invalid duration': 2}), 0)
+            self.assertEqual(cm.exception, 1)
+
     def test_sort_events_timestamp(self):
         result = unbabel_cli.sort_events_timestamp(self.events_not_sorted)
         self.assertEqual(result, self.convert_events_timestamp)
@@ -322,6 +604,1054 @@ class TestUnbabel_cli(unittest.TestCase):
         print(result)
         self.assertEqual(result, self.output_list_20)
 
+    def test_average_delivery_time(self):
+        self.assertEqual(unbabel_cli.average_delivery_time(0, 0), 0)
+        self.assertEqual(unbabel_cli.average_delivery_time(40, 2), 20)
+        self.assertIsInstance(unbabel_cli.average_delivery_time(40, 2), int)
+        self.assertEqual(unbabel_cli.average_delivery_time(51, 2), 25.5)
+
+    def test_check_engine(self):
+        result = unbabel_cli.check_engine('python')
+        self.assertEqual(result, None)
+
+        if unbabel_cli.np is None:
+            with self.assertRaises(SystemExit) as cm:
+                unbabel_cli.check_engine('numpy')
+                self.assertEqual(cm.exception, 1)
+
+    def test_stream_lines(self):
+        with self.assertRaises(SystemExit) as cm:
+            list(unbabel_cli.stream_lines('not_exists.json'))
+            self.assertEqual(cm.exception, 1)
+
+        result = unbabel_cli.stream_check_events(unbabel_cli.stream_lines('events.json'), self.dict_keys)
+        expected = micros_events(self.convert_events_timestamp)
+        self.assertEqual(next(result), expected[0])
+        self.assertEqual(list(result), expected[1:])
+
+    def test_stream_check_events(self):
+        result = list(unbabel_cli.stream_check_events(iter(self.events_list), self.dict_keys))
+        self.assertEqual(result, micros_events(self.convert_events_timestamp))
+
+        with self.assertRaises(SystemExit) as cm:
+            list(unbabel_cli.stream_check_events(iter(self.empty_list), self.dict_keys))
+            self.assertEqual(cm.exception, 1)
+
+        with self.assertRaises(SystemExit) as cm:
+            list(unbabel_cli.stream_check_events(iter(self.keys_error), self.dict_keys))
+            self.assertEqual(cm.exception, 1)
+
+        events_not_sorted = [dict(event, timestamp=str(event['timestamp'])) for event in self.events_not_sorted]
+        with self.assertRaises(SystemExit) as cm:
+            list(unbabel_cli.stream_check_events(iter(events_not_sorted), self.dict_keys))
+            self.assertEqual(cm.exception, 1)
+
+    def test_stream_export_failure(self):
+        # an event out of order stops the stream mode after some records were exported: the output file is not
+        # created (nor an existing one overwritten) and the temporary file is removed
+        events_not_sorted = [dict(event, timestamp=str(event['timestamp'])) for event in self.events_not_sorted]
+        with tempfile.TemporaryDirectory() as directory:
+            for output_format in ('jsonl', 'csv', 'columnar'):
+                output_file = os.path.join(directory, 'output' + unbabel_cli.OUTPUT_EXTENSIONS[output_format])
+                events = unbabel_cli.stream_check_events(iter([dict(event) for event in events_not_sorted]),
+                                                         self.dict_keys)
+                with self.assertRaises(SystemExit) as cm:
+                    unbabel_cli.perform_export(unbabel_cli.stream_moving_average(events, 10), output_file,
+                                               output_format)
+                    self.assertEqual(cm.exception, 1)
+                self.assertEqual(os.listdir(directory), [])
+            with open(os.path.join(directory, 'existing.json'), 'w') as f:
+                f.write('existing\n')
+            with self.assertRaises(SystemExit) as cm:
+                unbabel_cli.write_jsonl(unbabel_cli.stream_moving_average(unbabel_cli.stream_check_events(
+                    iter([dict(event) for event in events_not_sorted]), self.dict_keys), 10),
+                    os.path.join(directory, 'existing.json'))
+                self.assertEqual(cm.exception, 1)
+            with open(os.path.join(directory, 'existing.json')) as f:
+                self.assertEqual(f.read(), 'existing\n')
+            self.assertEqual(os.listdir(directory), ['existing.json'])
+
+    def test_stream_filter_events(self):
+        result = list(unbabel_cli.stream_filter_events(iter(self.events_list), 'booking', 'en', 'fr'))
+        self.assertEqual(result, self.events_filter_client)
+
+        result = list(unbabel_cli.stream_filter_events(iter(self.events_list), None, None, 'it'))
+        self.assertEqual(result, [])
+
+    def test_stream_moving_average(self):
+        result = list(unbabel_cli.stream_moving_average(iter(micros_events(self.convert_events_timestamp)), 10))
+        self.assertEqual(result, self.output_list)
+
+        result = list(unbabel_cli.stream_moving_average(iter(micros_events(self.convert_events_timestamp)), 20))
+        self.assertEqual(result, self.output_list_20)
+
+        with self.assertRaises(SystemExit) as cm:
+            list(unbabel_cli.stream_moving_average(iter(self.empty_list), 10))
+            self.assertEqual(cm.exception, 1)
+
+        for seed in range(20):
+            events_list = random_events(seed, random.Random(seed).randint(1, 200))
+            for window_size in (1, 10):
+                self.assertEqual(list(unbabel_cli.stream_moving_average(iter(micros_events(events_list)), window_size)),
+                                 unbabel_cli.moving_average(events_list, window_size),
+                                 'seed ' + str(seed) + ', window size ' + str(window_size))
+
+    def test_tail_window(self):
+        tail_window = unbabel_cli.TailWindow(10, 0)
+        result = []
+        for event in micros_events(self.convert_events_timestamp):
+            result.extend(tail_window.push(event['timestamp'], event['duration']))
+        # minutes are emitted as soon as a newer event arrives
+        self.assertEqual(result, self.output_list[:13])
+        result.extend(tail_window.close())
+        self.assertEqual(result, self.output_list)
+
+        for seed in range(20):
+            generator = random.Random(seed)
+            events_list = micros_events(random_events(seed, generator.randint(1, 200)))
+            # events arrive up to 3 minutes late
+            arrivals = sorted(events_list, key=lambda event: event['timestamp'] +
+                              generator.randint(0, 180) * 1000000)
+            tail_window = unbabel_cli.TailWindow(10, 180)
+            result = []
+            for event in arrivals:
+                result.extend(tail_window.push(event['timestamp'], event['duration']))
+            result.extend(tail_window.close())
+            self.assertEqual(result, reference_moving_average(events_list, 10), 'seed ' + str(seed))
+            self.assertEqual(tail_window.dropped_events, 0)
+            self.assertLessEqual(len(tail_window.minutes), 10 + 5)
+
+        # events later than the lateness are dropped
+        tail_window = unbabel_cli.TailWindow(10, 0)
+        events_list = micros_events(self.events_not_sorted)
+        for event in events_list:
+            list(tail_window.push(event['timestamp'], event['duration']))
+        self.assertEqual(tail_window.dropped_events, 1)
+
+    def test_tail_events(self):
+        with tempfile.TemporaryDirectory() as directory:
+            input_file = os.path.join(directory, 'events.json')
+            output_file = os.path.join(directory, 'output.json')
+            shutil.copy('events.json', input_file)
+            with open(input_file, 'a') as f:
+                f.write('\n{"timestamp": "2018-12-26 18:24:19.903159"}\nnot json\n')
+
+            async def tail():
+                task = asyncio.ensure_future(unbabel_cli.tail_events(input_file, 10, 0, output_file, self.dict_keys,
+                                                                     'strict', None, None, None, poll_interval=0.01))
+                await asyncio.sleep(0.2)
+                with open(input_file, 'a') as f:
+                    f.write(json.dumps(dict(self.events_list[2], timestamp='2018-12-26 18:30:00.000000')) + '\n')
+                await asyncio.sleep(0.2)
+                task.cancel()
+
+            asyncio.run(tail())
+            with open(output_file) as f:
+                result = [json.loads(line) for line in f]
+            expected = [dict(dict_entry, date=str(dict_entry['date'])) for dict_entry in self.output_list]
+            self.assertEqual(result[:14], expected)
+            self.assertEqual(len(result), 19)
+
+    def test_tail_events_validation(self):
+        with tempfile.TemporaryDirectory() as directory:
+            input_file = os.path.join(directory, 'events.json')
+            output_file = os.path.join(directory, 'output.json')
+            # the second event is only rejected when it is checked
+            with open(input_file, 'w') as f:
+                for index, event in enumerate(self.events_list):
+                    f.write(json.dumps(dict(event, event_name='translation_requested') if index == 1 else event) + '\n')
+                f.write(json.dumps(dict(self.events_list[2], timestamp='2018-12-26 18:40:00.000000')) + '\n')
+
+            async def tail(validation):
+                task = asyncio.ensure_future(unbabel_cli.tail_events(input_file, 10, 0, output_file, self.dict_keys,
+                                                                     validation, None, None, None, poll_interval=0.01))
+                await asyncio.sleep(0.2)
+                task.cancel()
+
+            expected = [dict(dict_entry, date=str(dict_entry['date'])) for dict_entry in self.output_list]
+            for validation, checked in (('strict', True), ('sample', False), ('off', False)):
+                asyncio.run(tail(validation))
+                with open(output_file) as f:
+                    result = [json.loads(line) for line in f]
+                os.remove(output_file)
+                self.assertEqual(result[:14] == expected, not checked, validation)
+
+    def test_check_tail(self):
+        result = unbabel_cli.check_tail(60, False, None, None, None)
+        self.assertEqual(result, None)
+
+        with self.assertRaises(SystemExit) as cm:
+            unbabel_cli.check_tail(-1, False, None, None, None)
+            self.assertEqual(cm.exception, 1)
+
+        with self.assertRaises(SystemExit) as cm:
+            unbabel_cli.check_tail(0, True, None, None, None)
+            self.assertEqual(cm.exception, 1)
+
+    def test_check_group_by(self):
+        result = unbabel_cli.check_group_by('client_name,target_language')
+        self.assertEqual(result, ['client_name', 'target_language'])
+
+        with self.assertRaises(SystemExit) as cm:
+            unbabel_cli.check_group_by('client_name,nr_words')
+            self.assertEqual(cm.exception, 1)
+
+        with self.assertRaises(SystemExit) as cm:
+            unbabel_cli.check_group_by('client_name,client_name')
+            self.assertEqual(cm.exception, 1)
+
+    def test_group_moving_average(self):
+        events_list = micros_events(self.convert_events_timestamp)
+        result = list(unbabel_cli.group_moving_average(iter(events_list), 10, ['client_name']))
+        for client_name in ('easyjet', 'booking'):
+            client_events = [event for event in events_list if event['client_name'] == client_name]
+            expected = [dict(client_name=client_name, **dict_entry)
+                        for dict_entry in reference_moving_average(client_events, 10)]
+            self.assertEqual([dict_entry for dict_entry in result if dict_entry['client_name'] == client_name],
+                             expected)
+        self.assertEqual(len(result), 8)
+
+        # a single group is the same as no group
+        result = list(unbabel_cli.group_moving_average(iter(events_list), 10, ['source_language', 'target_language']))
+        self.assertEqual(result, [dict(source_language='en', target_language='fr', **dict_entry)
+                                  for dict_entry in self.output_list])
+
+        with self.assertRaises(SystemExit) as cm:
+            list(unbabel_cli.group_moving_average(iter(self.empty_list), 10, ['client_name']))
+            self.assertEqual(cm.exception, 1)
+
+    def test_check_metrics(self):
+        self.assertEqual(unbabel_cli.check_metrics('avg'), None)
+        self.assertEqual(unbabel_cli.check_metrics('avg,p50,p99.9,max,breach>=30'),
+                         [('avg', None), ('percentile', 50), ('percentile', 99.9), ('max', None), ('breach', 30)])
+        for metrics in ('p0', 'p101', 'median', 'breach>=1.5', 'avg,avg'):
+            with self.assertRaises(SystemExit) as cm:
+                unbabel_cli.check_metrics(metrics)
+                self.assertEqual(cm.exception, 1)
+        self.assertEqual(unbabel_cli.check_metrics('weighted_avg,seconds_per_word'),
+                         [('weighted_avg', None), ('seconds_per_word', None)])
+        percentiles = [('percentile', 50)]
+        self.assertEqual(unbabel_cli.check_metrics_mode([('weighted_avg', None)], 'mmap', False, 2, None, False), None)
+        invalid_modes = [(percentiles, 'lines', True, None), (percentiles, 'mmap', False, None),
+                         (percentiles, 'lines', False, 2), ([('weighted_avg', None)], 'lines', True, None)]
+        for metrics, reader, stream, workers in invalid_modes:
+            with self.assertRaises(SystemExit) as cm:
+                unbabel_cli.check_metrics_mode(metrics, reader, stream, workers, None, False)
+                self.assertEqual(cm.exception, 1)
+        # the metrics are only computed by the python engine
+        with self.assertRaises(SystemExit) as cm:
+            unbabel_cli.check_metrics_mode([('weighted_avg', None)], 'lines', False, None, None, False, 'numpy')
+            self.assertEqual(cm.exception, 1)
+        with self.assertRaises(SystemExit) as cm:
+            unbabel_cli.check_output_format('columnar', None, False, None, [('max', None)])
+            self.assertEqual(cm.exception, 1)
+
+    def test_fenwick_tree(self):
+        generator = random.Random(5)
+        counts = [0] * 37
+        tree = unbabel_cli.FenwickTree(len(counts))
+        for _ in range(500):
+            rank = generator.randrange(len(counts))
+            delta = 1 if counts[rank] == 0 or generator.random() < 0.6 else -1
+            counts[rank] += delta
+            tree.add(rank, delta)
+            values = sorted(rank for rank, count in enumerate(counts) for _ in range(count))
+            for k in range(1, len(values) + 1):
+                self.assertEqual(tree.find(k), values[k - 1])
+            for rank in range(len(counts) + 1):
+                self.assertEqual(tree.count_below(rank), sum(counts[:rank]))
+
+    def test_metrics_moving_average(self):
+        metrics = unbabel_cli.check_metrics('avg,p50,p90,p99,max,breach>=50')
+        for seed in range(5):
+            events_list = micros_events(random_events(seed, 300))
+            for event in events_list:
+                event['client_name'] = ('easyjet', 'booking')[event['duration'] % 2]
+            for window_size in (1, 10):
+                result = list(unbabel_cli.metrics_moving_average(events_list, window_size, metrics))
+                self.assertEqual([{'date': dict_entry['date'], 'average_delivery_time': dict_entry[
+                    'average_delivery_time']} for dict_entry in result],
+                    reference_moving_average(events_list, window_size))
+                # compared with sorting the durations of each window
+                for dict_entry in result:
+                    minute = unbabel_cli.datetime_to_micros(dict_entry['date'])
+                    durations = sorted(event['duration'] for event in events_list if minute - window_size *
+                                       unbabel_cli.MICROSECONDS_PER_MINUTE <= event['timestamp'] <= minute)
+                    for percentile in (50, 90, 99):
+                        expected = durations[max(-(-percentile * len(durations) // 100), 1) - 1] if durations else 0
+                        self.assertEqual(dict_entry['p' + str(percentile) + '_delivery_time'], expected)
+                    self.assertEqual(dict_entry['max_delivery_time'], durations[-1] if durations else 0)
+                    self.assertEqual(dict_entry['breaches_50'], len([value for value in durations if value >= 50]))
+
+                # grouped: the metrics of each group are the ones of its events
+                result = list(unbabel_cli.metrics_moving_average(events_list, window_size, metrics, ['client_name']))
+                for client_name in ('easyjet', 'booking'):
+                    client_events = [event for event in events_list if event['client_name'] == client_name]
+                    self.assertEqual([dict_entry for dict_entry in result if dict_entry['client_name'] == client_name],
+                                     [dict(client_name=client_name, **dict_entry) for dict_entry in
+                                      unbabel_cli.metrics_moving_average(client_events, window_size, metrics)])
+
+            # the numbers of words are not read when no metric needs them
+            self.assertEqual(list(unbabel_cli.metrics_moving_average(
+                [dict(event, nr_words='30') for event in events_list], 10, metrics)),
+                list(unbabel_cli.metrics_moving_average(events_list, 10, metrics)))
+
+        with self.assertRaises(SystemExit) as cm:
+            list(unbabel_cli.metrics_moving_average([], 10, metrics))
+            self.assertEqual(cm.exception, 1)
+
+    def test_check_memory_limit(self):
+        self.assertEqual(unbabel_cli.check_memory_limit(64, True), None)
+        for memory_limit, stream in ((0, True), (64, False)):
+            with self.assertRaises(SystemExit) as cm:
+                unbabel_cli.check_memory_limit(memory_limit, stream)
+                self.assertEqual(cm.exception, 1)
+
+    def test_reorder_records(self):
+        events_list = sorted(unbabel_cli.compact_events(
+            dict(event, client_name='easyjet', source_language='en', target_language='fr')
+            for event in micros_events(random_events(1, 300))), key=lambda event: (event.timestamp, event.duration))
+        # every event is displaced at most 3 positions
+        almost_sorted = list(events_list)
+        for index in range(0, len(almost_sorted) - 3, 4):
+            almost_sorted[index], almost_sorted[index + 3] = almost_sorted[index + 3], almost_sorted[index]
+        timestamps = [event.timestamp for event in almost_sorted]
+        late = []
+        heap = sorted(timestamps[:3])
+        self.assertEqual(list(unbabel_cli.reorder_records(heap, iter(timestamps[3:]), late)), sorted(timestamps))
+        self.assertEqual(late, [])
+        heap = timestamps[:1]
+        records = iter(timestamps[1:])
+        reordered = list(unbabel_cli.reorder_records(heap, records, late))
+        self.assertEqual(reordered, sorted(reordered))
+        self.assertEqual(len(late), 1)
+        self.assertLess(late[0], reordered[-1])
+        self.assertEqual(sorted(reordered + late + heap + list(records)), sorted(timestamps))
+        # an almost sorted input goes through the reorder buffer as a single run, a shuffled one is sorted in runs
+        shuffled = list(events_list)
+        random.Random(1).shuffle(shuffled)
+        for events, single_run in ((almost_sorted, True), (shuffled, False)):
+            with mock.patch.object(unbabel_cli, 'SORT_RECORD_BYTES', 1024 * 1024 // 3), \
+                    mock.patch.object(unbabel_cli, 'read_sorted_run', wraps=unbabel_cli.read_sorted_run) as read:
+                self.assertEqual([event.timestamp for event in unbabel_cli.external_sort_events(iter(events), 1)],
+                                 sorted(timestamps))
+                self.assertEqual(read.call_count == 1, single_run)
+
+    def test_external_sort_events(self):
+        events_list = list(unbabel_cli.compact_events(
+            dict(event, client_name=('easyjet', 'booking')[index % 2], source_language='en', target_language='fr')
+            for index, event in enumerate(micros_events(random_events(2, 500)))))
+        shuffled = list(events_list)
+        random.Random(2).shuffle(shuffled)
+        expected = sorted(events_list, key=lambda event: (event.timestamp, event.duration, event.client_name))
+        # in memory, with a few sorted runs and with more runs than the merge fan-in (merged in several passes)
+        for record_bytes, fanin in ((unbabel_cli.SORT_RECORD_BYTES, 256), (1024 * 1024 // 100, 256),
+                                    (1024 * 1024 // 10, 4)):
+            with mock.patch.object(unbabel_cli, 'SORT_RECORD_BYTES', record_bytes), \
+                    mock.patch.object(unbabel_cli, 'SORT_MERGE_FANIN', fanin):
+                self.assertEqual(list(unbabel_cli.external_sort_events(iter(shuffled), 1)), expected)
+
+    def test_aggregate_minutes(self):
+        events_list = micros_events(self.convert_events_timestamp)
+        events_list.append(dict(events_list[0], timestamp=unbabel_cli.datetime_to_micros(
+            datetime.datetime(2018, 12, 26, 18, 11)), duration=10))
+        result = unbabel_cli.aggregate_minutes(events_list)
+        minute = unbabel_cli.datetime_to_micros(datetime.datetime(2018, 12, 26, 18, 11))
+        self.assertEqual(dict(result.items()),
+                         {minute: (30, 2, 10, 1),
+                          minute + 4 * unbabel_cli.MICROSECONDS_PER_MINUTE: (31, 1, 0, 0),
+                          minute + 12 * unbabel_cli.MICROSECONDS_PER_MINUTE: (54, 1, 0, 0)})
+        self.assertEqual(len(result), 13)
+        # the arrays of the words are only filled when the words are used
+        self.assertEqual(len(result.words_sums), 0)
+        result = unbabel_cli.aggregate_minutes(events_list, True)
+        self.assertEqual(dict(result.items()),
+                         {minute: (30, 2, 10, 1, 60, 900, 30, 300),
+                          minute + 4 * unbabel_cli.MICROSECONDS_PER_MINUTE: (31, 1, 0, 0, 30, 930, 0, 0),
+                          minute + 12 * unbabel_cli.MICROSECONDS_PER_MINUTE: (54, 1, 0, 0, 100, 5400, 0, 0)})
+        self.assertEqual(dict(result.items()), dict(unbabel_cli.merge_rollups(
+            group['rollup'] for group in unbabel_cli.aggregate_groups(events_list, True)).items()))
+        # numbers of words which were not checked are not read
+        result = unbabel_cli.aggregate_minutes(dict(event, nr_words='30') for event in events_list)
+        self.assertEqual(dict(result.items()), dict(unbabel_cli.aggregate_minutes(events_list).items()))
+
+        # unsorted events grow the arrays on both sides
+        result = unbabel_cli.aggregate_minutes(reversed(events_list))
+        self.assertEqual(dict(result.items()), dict(unbabel_cli.aggregate_minutes(events_list).items()))
+        self.assertEqual(len(result), 13)
+
+        self.assertEqual(len(unbabel_cli.aggregate_minutes(self.empty_list)), 0)
+
+        result = unbabel_cli.merge_rollups([unbabel_cli.aggregate_minutes(events_list[:2]),
+                                            unbabel_cli.aggregate_minutes(events_list[2:]),
+                                            unbabel_cli.aggregate_minutes(self.empty_list)])
+        self.assertEqual(dict(result.items()), dict(unbabel_cli.aggregate_minutes(events_list).items()))
+
+        # rollups of overlapping, disjoint, earlier and later minutes, added with numpy and without it
+        for seed in range(5):
+            events_list = micros_events(random_events(seed, 300))
+            chunks = [events_list[100:200], events_list[:150], events_list[250:], events_list[120:130], []]
+            expected = unbabel_cli.aggregate_minutes(events_list[:200] + events_list[100:150] + events_list[250:] +
+                                                     events_list[120:130])
+            for np in {unbabel_cli.np, None}:
+                with mock.patch.object(unbabel_cli, 'np', np):
+                    result = unbabel_cli.merge_rollups(unbabel_cli.aggregate_minutes(chunk) for chunk in chunks)
+                self.assertEqual(dict(result.items()), dict(expected.items()))
+                self.assertEqual(len(result), len(expected))
+            # the merged rollup keeps the arrays of the words
+            result = unbabel_cli.merge_rollups(unbabel_cli.aggregate_minutes(chunk, True) for chunk in chunks)
+            self.assertEqual(dict(result.items()), dict(unbabel_cli.aggregate_minutes(
+                events_list[:200] + events_list[100:150] + events_list[250:] + events_list[120:130], True).items()))
+
+    def test_minute_moving_average(self):
+        rollup = unbabel_cli.aggregate_minutes(micros_events(self.convert_events_timestamp))
+        self.assertEqual(unbabel_cli.minute_moving_average(rollup, 10), self.output_list)
+        self.assertEqual(unbabel_cli.minute_moving_average(rollup, 20), self.output_list_20)
+
+        for seed in range(20):
+            events_list = micros_events(random_events(seed, random.Random(seed).randint(1, 200)))
+            rollup = unbabel_cli.aggregate_minutes(random.Random(seed).sample(events_list, len(events_list)))
+            for window_size in (1, 2, 10, 60):
+                self.assertEqual(unbabel_cli.minute_moving_average(rollup, window_size),
+                                 reference_moving_average(events_list, window_size),
+                                 'seed ' + str(seed) + ', window size ' + str(window_size))
+
+    def test_minute_moving_average_range(self):
+        rollup = unbabel_cli.aggregate_minutes(micros_events(self.convert_events_timestamp))
+        start = unbabel_cli.datetime_to_micros(datetime.datetime(2018, 12, 26, 18, 15))
+        end = unbabel_cli.datetime_to_micros(datetime.datetime(2018, 12, 26, 18, 20))
+        self.assertEqual(unbabel_cli.minute_moving_average(rollup, 10, start, end), self.output_list[4:10])
+
+        # minutes outside of the rollup
+        start = unbabel_cli.datetime_to_micros(datetime.datetime(2018, 12, 26, 18, 0))
+        end = unbabel_cli.datetime_to_micros(datetime.datetime(2018, 12, 26, 18, 40))
+        result = unbabel_cli.minute_moving_average(rollup, 10, start, end)
+        self.assertEqual(len(result), 41)
+        self.assertEqual(result[11:25], self.output_list)
+        self.assertEqual(result[40], {'date': datetime.datetime(2018, 12, 26, 18, 40), 'average_delivery_time': 0})
+
+    @unittest.skipIf(unbabel_cli.np is None, "numpy is not installed")
+    def test_numpy_minute_moving_average(self):
+        rollup = unbabel_cli.aggregate_minutes(micros_events(self.convert_events_timestamp))
+        self.assertEqual(unbabel_cli.numpy_minute_moving_average(rollup, 10), self.output_list)
+        self.assertEqual(unbabel_cli.numpy_minute_moving_average(rollup, 20), self.output_list_20)
+
+        for seed in range(20):
+            events_list = micros_events(random_events(seed, random.Random(seed).randint(1, 200)))
+            rollup = unbabel_cli.aggregate_minutes(events_list)
+            for window_size in (1, 2, 10):
+                self.assertEqual(unbabel_cli.numpy_minute_moving_average(rollup, window_size),
+                                 unbabel_cli.minute_moving_average(rollup, window_size),
+                                 'seed ' + str(seed) + ', window size ' + str(window_size))
+                # output ranges inside, around and outside of the minutes with events
+                for start, end in ((5, 20), (-30, 3), (100, 200), (50, 40)):
+                    start = rollup.minute(rollup.first + start)
+                    end = rollup.minute(rollup.first + end)
+                    self.assertEqual(unbabel_cli.numpy_minute_moving_average(rollup, window_size, start, end),
+                                     unbabel_cli.minute_moving_average(rollup, window_size, start, end),
+                                     'seed ' + str(seed) + ', window size ' + str(window_size))
+
+    def test_multi_window_moving_average(self):
+        window_sizes = [1, 5, 15, 60]
+        engines = [unbabel_cli.multi_window_moving_average]
+        if unbabel_cli.np is not None:
+            engines.append(unbabel_cli.numpy_multi_window_moving_average)
+        for seed in range(20):
+            rollup = unbabel_cli.aggregate_minutes(micros_events(random_events(seed, 200)))
+            # output ranges inside, around and outside of the minutes with events
+            for start, end in ((None, None), (5, 20), (-30, 3), (100, 200), (50, 40)):
+                if start is not None:
+                    start = rollup.minute(rollup.first + start)
+                    end = rollup.minute(rollup.first + end)
+                expected = [dict(window_size=window_size, **dict_entry) for window_size in window_sizes
+                            for dict_entry in unbabel_cli.minute_moving_average(rollup, window_size, start, end)]
+                for engine in engines:
+                    self.assertEqual(engine(rollup, window_sizes, start, end), expected, 'seed ' + str(seed))
+
+    def test_rollup_metrics_moving_average(self):
+        metrics = unbabel_cli.check_metrics('avg,weighted_avg,seconds_per_word')
+        for seed in range(10):
+            events_list = micros_events(random_events(seed, 200))
+            for index, event in enumerate(events_list):
+                event['nr_words'] = (index * 7) % 50
+            rollup = unbabel_cli.aggregate_minutes(events_list, True)
+            for start, end in ((None, None), (5, 20), (-30, 3), (100, 200)):
+                if start is not None:
+                    start = rollup.minute(rollup.first + start)
+                    end = rollup.minute(rollup.first + end)
+                result = unbabel_cli.rollup_metrics_moving_average(rollup, [10], metrics, start, end)
+                self.assertEqual([{'date': dict_entry['date'], 'average_delivery_time': dict_entry[
+                    'average_delivery_time']} for dict_entry in result],
+                    unbabel_cli.minute_moving_average(rollup, 10, start, end))
+                # the same sums as the sliding window of the events
+                if start is None:
+                    self.assertEqual(result, list(unbabel_cli.metrics_moving_average(events_list, 10, metrics)))
+                for dict_entry in result:
+                    minute = unbabel_cli.datetime_to_micros(dict_entry['date'])
+                    window = [event for event in events_list
+                              if minute - 10 * unbabel_cli.MICROSECONDS_PER_MINUTE <= event['timestamp'] <= minute]
+                    words = sum(event['nr_words'] for event in window)
+                    self.assertAlmostEqual(dict_entry['weighted_average_delivery_time'],
+                                           sum(event['duration'] * event['nr_words'] for event in window) / words
+                                           if words else 0)
+                    self.assertAlmostEqual(dict_entry['seconds_per_word'],
+                                           sum(event['duration'] for event in window) / words if words else 0)
+
+            # several window sizes: tagged series, one after the other
+            result = unbabel_cli.rollup_metrics_moving_average(rollup, [1, 10], metrics)
+            self.assertEqual(result, [dict(window_size=window_size, **dict_entry) for window_size in (1, 10)
+                                      for dict_entry in unbabel_cli.rollup_metrics_moving_average(rollup, [window_size],
+                                                                                                  metrics)])
+
+    def test_check_window_sizes(self):
+        self.assertEqual(unbabel_cli.check_window_sizes('10'), [10])
+        self.assertEqual(unbabel_cli.check_window_sizes('1,5,15,60'), [1, 5, 15, 60])
+        for window_sizes in ('1,ten', '1,0', '5,5', ''):
+            with self.assertRaises(SystemExit) as cm:
+                unbabel_cli.check_window_sizes(window_sizes)
+                self.assertEqual(cm.exception, 1)
+        self.assertEqual(unbabel_cli.check_window_sizes_mode(False, None, False), None)
+        with self.assertRaises(SystemExit) as cm:
+            unbabel_cli.check_window_sizes_mode(True, None, False)
+            self.assertEqual(cm.exception, 1)
+
+        events_list = micros_events(self.convert_events_timestamp)
+        result = list(unbabel_cli.window_series(
+            lambda window_size: unbabel_cli.group_moving_average(events_list, window_size, ['client_name']), [10, 20]))
+        self.assertEqual(result, [dict(window_size=window_size, **dict_entry) for window_size in (10, 20)
+                                  for dict_entry in unbabel_cli.group_moving_average(events_list, window_size,
+                                                                                     ['client_name'])])
+
+    def test_aggregate_groups(self):
+        result = unbabel_cli.aggregate_groups(micros_events(self.convert_events_timestamp))
+        self.assertEqual([(group['client_name'], group['source_language'], group['target_language'])
+                          for group in result], [('booking', 'en', 'fr'), ('easyjet', 'en', 'fr')])
+        self.assertEqual(dict(result[0]['rollup'].items()),
+                         dict(unbabel_cli.aggregate_minutes(micros_events(self.convert_events_timestamp[2:])).items()))
+
+        result = unbabel_cli.filter_events(result, 'easyjet', 'en', None)
+        self.assertEqual(unbabel_cli.minute_moving_average(unbabel_cli.merge_rollups([result[0]['rollup']]), 10),
+                         reference_moving_average(micros_events(self.convert_events_timestamp[:2]), 10))
+
+    def test_sparse_rollup(self):
+        minute = unbabel_cli.MICROSECONDS_PER_MINUTE
+        # events of a year apart only keep the minutes with events
+        events_list = [dict(event, timestamp=event['timestamp'] + index % 3 * 525600 * minute, nr_words=index % 7,
+                            client_name=['easyjet', 'booking'][index % 2], source_language='en', target_language='fr')
+                       for index, event in enumerate(micros_events(random_events(0, 300)))]
+        for words in (False, True):
+            sparse_rollup = unbabel_cli.SparseRollup(words)
+            for event in events_list:
+                sparse_rollup.add(event['timestamp'], event['duration'], event['nr_words'])
+            rollup = unbabel_cli.aggregate_minutes(events_list, words)
+            self.assertEqual(list(sparse_rollup.items()), list(rollup.items()))
+            self.assertEqual(len(sparse_rollup), len(list(rollup.items())))
+            self.assertLess(len(sparse_rollup), len(rollup))
+            for first_minute in (None, rollup.minute(rollup.first) + 3 * minute):
+                for last_minute in (None, rollup.minute(rollup.last) - 525600 * minute):
+                    self.assertEqual(sparse_rollup.events_count(first_minute, last_minute),
+                                     rollup.events_count(first_minute, last_minute))
+            self.assertEqual(list(unbabel_cli.merge_rollups([sparse_rollup]).items()), list(rollup.items()))
+            data = sparse_rollup.to_bytes()
+            self.assertEqual(list(unbabel_cli.SparseRollup.from_bytes(len(sparse_rollup), data, words).items()),
+                             list(rollup.items()))
+
+        # the totals of the sparse rollups are added to the merged one with or without numpy
+        groups = unbabel_cli.aggregate_groups(dict(event) for event in events_list)
+        expected = list(unbabel_cli.aggregate_minutes(events_list).items())
+        self.assertEqual(list(unbabel_cli.merge_rollups(group['rollup'] for group in groups).items()), expected)
+        with mock.patch.object(unbabel_cli, 'np', None):
+            self.assertEqual(list(unbabel_cli.merge_rollups(group['rollup'] for group in groups).items()), expected)
+        self.assertEqual(unbabel_cli.SparseRollup().events_count(), 0)
+        self.assertEqual(list(unbabel_cli.merge_rollups([unbabel_cli.SparseRollup()]).items()), [])
+
+    def test_merge_groups(self):
+        minute = unbabel_cli.MICROSECONDS_PER_MINUTE
+        events_list = [dict(event, client_name=['easyjet', 'booking', 'ryanair'][index % 3],
+                            source_language=['en', 'fr'][index % 2], target_language=['fr', 'de'][index % 5 == 0])
+                       for index, event in enumerate(micros_events(random_events(0, 300)))]
+        groups = unbabel_cli.aggregate_groups(dict(event) for event in events_list)
+        for group_keys in (['client_name'], ['target_language', 'client_name'], unbabel_cli.GROUP_BY_KEYS):
+            result = unbabel_cli.merge_groups(groups, group_keys)
+            self.assertEqual([group for group, _ in result],
+                             sorted(set(tuple(event[key] for key in group_keys) for event in events_list)))
+            # the rollup of each group has the events of every client and language pair of the group
+            for group, rollup in result:
+                group_events = [event for event in events_list
+                                if tuple(event[key] for key in group_keys) == group]
+                self.assertEqual(dict(rollup.items()), dict(unbabel_cli.aggregate_minutes(group_events).items()))
+
+        rollup = unbabel_cli.aggregate_minutes(events_list)
+        timestamps = sorted(event['timestamp'] for event in events_list)
+        self.assertEqual(rollup.events_count(), len(events_list))
+        self.assertEqual(unbabel_cli.MinuteRollup().events_count(), 0)
+        for first_minute in (None, timestamps[0] - 3 * minute, timestamps[100] - timestamps[100] % minute):
+            for last_minute in (None, timestamps[0] - minute, timestamps[200] - timestamps[200] % minute,
+                                timestamps[-1] + minute):
+                self.assertEqual(rollup.events_count(first_minute, last_minute),
+                                 len([timestamp for timestamp in timestamps
+                                      if (first_minute is None or timestamp >= first_minute) and
+                                      (last_minute is None or timestamp <= last_minute)]))
+
+        self.assertEqual(list(unbabel_cli.group_record({'window_size': 5, 'date': 1}, ['client_name'], ('easyjet',))),
+                         ['window_size', 'client_name', 'date'])
+        self.assertEqual(unbabel_cli.group_record({'date': 1}, ['client_name'], ('easyjet',)),
+                         {'client_name': 'easyjet', 'date': 1})
+
+    def test_mmap_aggregate_groups(self):
+        invalid_events = self.keys_error + self.timestamp_error + self.name_error
+        # escaped strings, other types and spacing are read as json
+        other_events = [dict(self.events_list[0], client_name='caf\u00e9 "quoted"'),
+                        dict(self.events_list[1], nr_words=None),
+                        dict(self.events_list[2], duration=12)]
+        lines = [json.dumps(event) for event in self.events_list + invalid_events + other_events]
+        lines.append(json.dumps(self.events_list[0], separators=(',', ':')))
+        lines.append(json.dumps(self.events_list[1], indent=None, separators=(' , ', ' : ')))
+        # lines which are not json or not an object
+        lines += ['not json', '[1, 2]']
+        with tempfile.TemporaryDirectory() as directory:
+            input_file = os.path.join(directory, 'events.json')
+            for validation in ('strict', 'sample', 'off'):
+                if validation == 'strict':
+                    # invalid durations are only rejected when the events are checked
+                    with open(input_file, 'w') as f:
+                        f.write('\n'.join(lines + [json.dumps(event) for event in self.duration_error_1 +
+                                                    self.duration_error_2 +
+                                                    [dict(self.events_list[0], nr_words='30')]]))
+                else:
+                    with open(input_file, 'w') as f:
+                        f.write('\n'.join(lines))
+                for words in (False, True):
+                    expected_rejections = unbabel_cli.Counter()
+                    expected = unbabel_cli.aggregate_groups(unbabel_cli.validate_events(
+                        unbabel_cli.stream_lines(input_file), self.dict_keys, validation, expected_rejections, words),
+                        words)
+                    rejections = unbabel_cli.Counter()
+                    result, valid_events_count = unbabel_cli.mmap_aggregate_groups(input_file, self.dict_keys,
+                                                                                   validation, rejections, words)
+                    self.assertEqual(rejections, expected_rejections)
+                    self.assertEqual(rejections['invalid json'], 1)
+                    self.assertEqual(valid_events_count, sum(sum(group['rollup'].columns()[1]) for group in expected))
+                    self.assertEqual([(dict(group, rollup=None), list(group['rollup'].items())) for group in result],
+                                     [(dict(group, rollup=None), list(group['rollup'].items())) for group in expected])
+                    self.assertEqual(len(result[0]['rollup'].columns()), 8 if words else 4)
+
+            empty_file = os.path.join(directory, 'empty.json')
+            open(empty_file, 'w').close()
+            self.assertEqual(unbabel_cli.mmap_aggregate_groups(empty_file, self.dict_keys, 'strict',
+                                                               unbabel_cli.Counter()), ([], 0))
+
+    def test_mmap_malformed_lines(self):
+        # lines which are not a single json object, or with duplicate keys, are read as the lines reader does
+        line = json.dumps(self.events_list[0])
+        lines = [line + ' garbage', line + '}', line + line, line.replace('"duration": 20', '"duration": 020'),
+                 line.replace('"duration": 20', '"duration": -0'), line.replace('"nr_words": 30', '"nr_words": 030'),
+                 line[:-1] + ', "duration": 99}', line[:-1] + ', "client_name": "booking"}',
+                 line[:-1] + ', "event_name": "translation_requested"}', line[:-1] + ', "nr_words": 7}',
+                 line[:-1] + ', "note": "duration"}', line[:-1] + ', "extra": {"duration": 1}}',
+                 line[:-1] + ', "extra": [1, 2]}', '\t' + line.replace(', ', ',\t') + ' \r', '{' + line[1:-1],
+                 line.replace('"client_name": "easyjet"', '"client_name": "easy\tjet"'), line]
+        with tempfile.TemporaryDirectory() as directory:
+            input_file = os.path.join(directory, 'events.json')
+            with open(input_file, 'w') as f:
+                f.write('\n'.join(lines))
+            for validation in ('strict', 'sample', 'off'):
+                for words in (False, True):
+                    expected_rejections = unbabel_cli.Counter()
+                    expected = unbabel_cli.aggregate_groups(unbabel_cli.validate_events(
+                        unbabel_cli.stream_lines(input_file), self.dict_keys, validation, expected_rejections, words),
+                        words)
+                    rejections = unbabel_cli.Counter()
+                    result, valid_events_count = unbabel_cli.mmap_aggregate_groups(input_file, self.dict_keys,
+                                                                                   validation, rejections, words)
+                    self.assertEqual(rejections, expected_rejections)
+                    self.assertGreaterEqual(rejections['invalid json'], 6)
+                    self.assertEqual(valid_events_count, sum(group['rollup'].events_count() for group in expected))
+                    self.assertEqual([(dict(group, rollup=None), list(group['rollup'].items())) for group in result],
+                                     [(dict(group, rollup=None), list(group['rollup'].items())) for group in expected])
+
+    def test_check_reader(self):
+        self.assertEqual(unbabel_cli.check_reader('lines', 'events.json.gz', True, 2, None, None, False), None)
+        self.assertEqual(unbabel_cli.check_reader('mmap', 'events.json', False, None, None, None, False), None)
+
+        with self.assertRaises(SystemExit) as cm:
+            unbabel_cli.check_reader('mmap', 'events.json', True, None, None, None, False)
+            self.assertEqual(cm.exception, 1)
+
+        with self.assertRaises(SystemExit) as cm:
+            unbabel_cli.check_reader('mmap', 'events.json.gz', False, None, None, None, False)
+            self.assertEqual(cm.exception, 1)
+
+    def test_rollups_cache(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache_dir = os.path.join(directory, 'cache')
+            input_file = os.path.join(directory, 'events.json')
+            shutil.copy('events.json', input_file)
+            self.assertEqual(unbabel_cli.load_cached_rollups(cache_dir, input_file, 'strict'), None)
+
+            groups = unbabel_cli.aggregate_groups(micros_events(self.convert_events_timestamp))
+            rejections = unbabel_cli.Counter({'invalid duration': 1})
+            unbabel_cli.store_cached_rollups(cache_dir, 1, input_file, 'strict', groups, rejections, 3)
+            result_groups, result_rejections, result_valid_events = \
+                unbabel_cli.load_cached_rollups(cache_dir, input_file, 'strict')
+            self.assertEqual([dict(group, rollup=dict(group['rollup'].items())) for group in result_groups],
+                             [dict(group, rollup=dict(group['rollup'].items())) for group in groups])
+            self.assertEqual(result_rejections, rejections)
+            self.assertEqual(result_valid_events, 3)
+            rollup = unbabel_cli.merge_rollups(group['rollup'] for group in result_groups)
+            self.assertEqual(unbabel_cli.minute_moving_average(rollup, 10), self.output_list)
+
+            # another validation mode has its own entry, and so do the rollups with the sums of words
+            self.assertEqual(unbabel_cli.load_cached_rollups(cache_dir, input_file, 'off'), None)
+            self.assertEqual(unbabel_cli.load_cached_rollups(cache_dir, input_file, 'strict', True), None)
+            self.assertEqual(unbabel_cli.load_cached_rollups(cache_dir, input_file, 'strict', False, 'mmap'), None)
+            groups = unbabel_cli.aggregate_groups(micros_events(self.convert_events_timestamp), True)
+            unbabel_cli.store_cached_rollups(cache_dir, 1, input_file, 'strict', groups, rejections, 3, True)
+            result_groups = unbabel_cli.load_cached_rollups(cache_dir, input_file, 'strict', True)[0]
+            self.assertEqual([dict(group, rollup=dict(group['rollup'].items())) for group in result_groups],
+                             [dict(group, rollup=dict(group['rollup'].items())) for group in groups])
+            self.assertEqual(len(unbabel_cli.load_cached_rollups(cache_dir, input_file, 'strict')[0][0]['rollup']
+                                 .columns()), 4)
+
+            # the entry is no longer valid once the input file changes
+            with open(input_file, 'a') as f:
+                f.write('\n')
+            self.assertEqual(unbabel_cli.load_cached_rollups(cache_dir, input_file, 'strict'), None)
+
+    def test_evict_cache(self):
+        with tempfile.TemporaryDirectory() as directory:
+            for index, name in enumerate(['a.rollup', 'b.rollup', 'c.rollup', 'd.txt']):
+                with open(os.path.join(directory, name), 'wb') as f:
+                    f.write(bytes(400 * 1024))
+                os.utime(os.path.join(directory, name), ns=(index * 10 ** 9, index * 10 ** 9))
+            unbabel_cli.evict_cache(directory, 1)
+            self.assertEqual(sorted(os.listdir(directory)), ['b.rollup', 'c.rollup', 'd.txt'])
+
+    def test_split_input_file(self):
+        result = unbabel_cli.split_input_file('events.json', 1)
+        self.assertEqual(result, [(0, os.path.getsize('events.json'))])
+
+        for chunks_number in (2, 3, 10):
+            result = unbabel_cli.split_input_file('events.json', chunks_number)
+            self.assertEqual(result[0][0], 0)
+            self.assertEqual(result[-1][1], os.path.getsize('events.json'))
+            events_list = [json.loads(line) for start, end in result
+                           for line in unbabel_cli.read_file_range('events.json', start, end)]
+            self.assertEqual(events_list, self.events_list)
+
+    def test_parallel_aggregate_events(self):
+        result = unbabel_cli.parallel_aggregate_events('events.json', 2, self.dict_keys, 'strict', None, None, None)
+        self.assertEqual(dict(result.items()),
+                         dict(unbabel_cli.aggregate_minutes(micros_events(self.convert_events_timestamp)).items()))
+
+        result = unbabel_cli.parallel_aggregate_events('events.json', 2, self.dict_keys, 'strict', None, None, None,
+                                                       True)
+        self.assertEqual(dict(result.items()), dict(unbabel_cli.aggregate_minutes(
+            micros_events(self.convert_events_timestamp), True).items()))
+
+        result = unbabel_cli.parallel_aggregate_events('events.json', 3, self.dict_keys, 'strict', 'booking', 'en',
+                                                       'fr')
+        self.assertEqual(dict(result.items()),
+                         dict(unbabel_cli.aggregate_minutes(micros_events(self.convert_events_timestamp[2:])).items()))
+
+        with self.assertRaises(SystemExit) as cm:
+            unbabel_cli.parallel_aggregate_events('events.json', 2, self.dict_keys, 'strict', 'uniplaces', None, None)
+            self.assertEqual(cm.exception, 1)
+
+        with self.assertRaises(SystemExit) as cm:
+            unbabel_cli.parallel_aggregate_events('not_exists.json', 2, self.dict_keys, 'strict', None, None, None)
+            self.assertEqual(cm.exception, 1)
+
+    def test_check_workers(self):
+        result = unbabel_cli.check_workers(4, None)
+        self.assertEqual(result, None)
+
+        with self.assertRaises(SystemExit) as cm:
+            unbabel_cli.check_workers(0, None)
+            self.assertEqual(cm.exception, 1)
+
+        with self.assertRaises(SystemExit) as cm:
+            unbabel_cli.check_workers(4, ['client_name'])
+            self.assertEqual(cm.exception, 1)
+
+    def test_follow_events(self):
+        with open('events.json') as f:
+            lines = [line.rstrip('\n') + '\n' for line in f]
+        with tempfile.TemporaryDirectory() as directory:
+            input_file = os.path.join(directory, 'events.json')
+            output_file = os.path.join(directory, 'output.json')
+            state_file = os.path.join(directory, 'state.json')
+
+            def follow(window_size=10):
+                unbabel_cli.follow_events(state_file, input_file, window_size, output_file, self.dict_keys, 'strict',
+                                          None, None, None)
+                with open(output_file) as f:
+                    return [json.loads(line) for line in f]
+
+            expected = [dict(dict_entry, date=str(dict_entry['date'])) for dict_entry in self.output_list]
+            with open(input_file, 'w') as f:
+                f.write(lines[0])
+            self.assertEqual(follow(), expected[:2])
+            # the last line is still being written
+            with open(input_file, 'a') as f:
+                f.write(lines[1][:50])
+            self.assertEqual(follow(), expected[:2])
+            with open(input_file, 'a') as f:
+                f.write(lines[1][50:])
+            self.assertEqual(follow(), expected[:6])
+            self.assertEqual(follow(), expected[:6])
+            with open(input_file, 'a') as f:
+                f.write(lines[2])
+            self.assertEqual(follow(), expected)
+
+            with self.assertRaises(SystemExit) as cm:
+                follow(window_size=20)
+                self.assertEqual(cm.exception, 1)
+
+            # an event older than the exported minutes
+            with open(input_file, 'a') as f:
+                f.write(lines[1])
+            with self.assertRaises(SystemExit) as cm:
+                follow()
+                self.assertEqual(cm.exception, 1)
+
+    def test_event_store(self):
+        store = unbabel_cli.EventStore.from_file('events.json')
+        self.assertEqual(store.valid_events_count, 3)
+        self.assertEqual(store.moving_average(10), self.output_list)
+        self.assertEqual(store.moving_average(20), self.output_list_20)
+        self.assertEqual(store.moving_average(10, client='easyjet', source='en', target='fr'),
+                         reference_moving_average(micros_events(self.convert_events_timestamp[:2]), 10))
+        # the merged rollup of a filter combination is kept for the next queries
+        self.assertIs(store.rollup('easyjet'), store.rollup('easyjet'))
+
+        # dates of the output between start and end (both included)
+        end = datetime.datetime(2018, 12, 26, 18, 20)
+        self.assertEqual(store.moving_average(10, start='2018-12-26 18:15:30', end=end), self.output_list[5:10])
+        # clamped to the minutes of the output without start and end
+        self.assertEqual(store.moving_average(10, start='2018-12-26 18:00:00', end='2018-12-26 18:12:00'),
+                         self.output_list[:2])
+        self.assertEqual(store.moving_average(10, start='1000-01-01', end='9999-12-31'), self.output_list)
+        self.assertEqual(store.moving_average(10, start='1000-01-01'), self.output_list)
+        self.assertEqual(store.moving_average(10, end='1000-01-01'), [])
+        # the python engine gives the same output when numpy is not installed
+        with mock.patch.object(unbabel_cli, 'np', None):
+            self.assertEqual(store.moving_average(10, start='1000-01-01'), self.output_list)
+        self.assertEqual(store.moving_average(10, start='2018-12-26 18:25:00', end='2018-12-26 19:00:00'), [])
+        for arguments in ({'window': 0}, {'window': 10, 'client': 'ryanair'}, {'window': 10, 'start': 'yesterday'},
+                          {'window': 10, 'source': 'en', 'target': 'de'}, {'window': True}, {'window': 10.0},
+                          {'window': 10, 'start': '2018-12-26 19:00:00', 'end': '2018-12-26 18:00:00'},
+                          {'window': 10, 'start': '2018-12-26T18:00:00+01:00'},
+                          {'window': 10, 'end': datetime.datetime(2018, 12, 26, 18, tzinfo=datetime.timezone.utc)}):
+            with self.assertRaises(unbabel_cli.EventStoreError):
+                store.moving_average(**arguments)
+
+        rejected_events = [dict(event) for event in self.duration_error_1 + self.name_error]
+        store = unbabel_cli.EventStore.from_events([dict(event) for event in self.events_list] + rejected_events)
+        self.assertEqual(store.rejections, {'invalid duration': 1, 'invalid event name': 1})
+        self.assertEqual(store.moving_average(10), self.output_list)
+
+        with self.assertRaises(unbabel_cli.EventStoreError):
+            unbabel_cli.EventStore.from_events([]).moving_average(10)
+        with self.assertRaises(unbabel_cli.EventStoreError):
+            unbabel_cli.EventStore.from_file('not_exists.json')
+        with self.assertRaises(unbabel_cli.EventStoreError):
+            unbabel_cli.EventStore.from_file('README.md')
+
+    def test_average_server(self):
+        with tempfile.TemporaryDirectory() as directory:
+            input_file = os.path.join(directory, 'events.json')
+            shutil.copyfile('events.json', input_file)
+            server = unbabel_cli.AverageServer(('127.0.0.1', 0), input_file, cache_entries=2)
+            thread = threading.Thread(target=server.serve_forever)
+            thread.start()
+            url = 'http://127.0.0.1:' + str(server.server_address[1])
+
+            def get(path):
+                try:
+                    with urllib.request.urlopen(url + path) as response:
+                        return response.status, response.read().decode()
+                except urllib.error.HTTPError as error:
+                    return error.code, json.loads(error.read())
+
+            try:
+                status, body = get('/average?window=10')
+                self.assertEqual(status, 200)
+                self.assertEqual([json.loads(line) for line in body.splitlines()],
+                                 [dict(line, date=str(line['date'])) for line in self.output_list])
+                status, body = get('/average?window=10&client=easyjet&start=2018-12-26+18:15:00')
+                self.assertEqual(status, 200)
+                self.assertEqual([json.loads(line)['date'] for line in body.splitlines()],
+                                 ['2018-12-26 18:' + str(minute) + ':00' for minute in range(15, 17)])
+
+                # responses are kept in a LRU cache of cache_entries queries
+                self.assertEqual(len(server.responses), 2)
+                get('/average?window=20')
+                self.assertEqual(list(server.responses), [(10, 'easyjet', None, None, '2018-12-26 18:15:00', None),
+                                                          (20, None, None, None, None, None)])
+
+                # the store is loaded again when the input file changes
+                with open(input_file, 'a') as f:
+                    f.write('\n' + json.dumps(dict(self.events_list[0], timestamp='2018-12-26 18:30:00.000000')))
+                status, body = get('/average?window=10')
+                self.assertEqual(len(body.splitlines()), len(self.output_list) + 7)
+                self.assertEqual(len(server.responses), 1)
+                # ranges far from the events are clamped to the minutes with events
+                self.assertEqual(get('/average?window=1&start=1000-01-01&end=9999-12-31')[1].splitlines(),
+                                 get('/average?window=1')[1].splitlines())
+                self.assertEqual(get('/average?window=1&start=9999-01-01'), (200, ''))
+
+                for path in ('/average', '/average?window=0', '/average?window=10&client=ryanair',
+                             '/average?window=10&foo=bar', '/average?window=10&end=never', '/average?window=%C2%B2',
+                             '/average?window=10&start=2018-12-26T18:00:00%2B01:00',
+                             '/average?window=10&start=2018-12-26+19:00:00&end=2018-12-26+18:00:00'):
+                    status, body = get(path)
+                    self.assertEqual(status, 400)
+                    self.assertIn('error', body)
+                self.assertEqual(get('/')[0], 404)
+            finally:
+                server.shutdown()
+                server.server_close()
+                thread.join()
+
+    def test_check_time_range(self):
+        minute = unbabel_cli.MICROSECONDS_PER_MINUTE
+        first_minute = unbabel_cli.datetime_to_micros(datetime.datetime(2018, 12, 26, 18, 15))
+        self.assertEqual(unbabel_cli.check_time_range(None, None), (None, None))
+        self.assertEqual(unbabel_cli.check_time_range('2018-12-26 18:15:00', '2018-12-26 18:20:30.5'),
+                         (first_minute, first_minute + 5 * minute))
+        # the first minute at or after the start
+        self.assertEqual(unbabel_cli.check_time_range('2018-12-26 18:14:00.000001', None), (first_minute, None))
+
+        for start, end in (('yesterday', None), (None, '2018-12-26 25:00:00'),
+                           ('2018-12-26 18:15:00', '2018-12-26 18:14:00'), ('2018-12-26 18:15:00+01:00', None),
+                           (None, '2018-12-26T18:20:00Z')):
+            with self.assertRaises(SystemExit) as cm:
+                unbabel_cli.check_time_range(start, end)
+                self.assertEqual(cm.exception, 1)
+
+        self.assertEqual(unbabel_cli.check_time_range_mode(None, None, False), None)
+        with self.assertRaises(SystemExit) as cm:
+            unbabel_cli.check_time_range_mode(2, None, False)
+            self.assertEqual(cm.exception, 1)
+
+    def test_range_events(self):
+        minute = unbabel_cli.MICROSECONDS_PER_MINUTE
+        events_list = micros_events(random_events(0, 200))
+        first_minute = events_list[0]['timestamp'] - events_list[0]['timestamp'] % minute + 30 * minute
+        last_minute = first_minute + 20 * minute
+        expected = [event for event in events_list
+                    if first_minute - 10 * minute <= event['timestamp'] <= last_minute]
+        self.assertEqual(list(unbabel_cli.range_events(events_list, first_minute, last_minute, 10, True)), expected)
+        self.assertEqual(list(unbabel_cli.range_events(events_list[::-1], first_minute, last_minute, 10, False)),
+                         expected[::-1])
+        self.assertEqual(list(unbabel_cli.range_events(events_list, None, None, 10, True)), events_list)
+
+        # sorted events are not read after the last minute
+        read_events = []
+
+        def read(events):
+            for event in events:
+                read_events.append(event)
+                yield event
+
+        list(unbabel_cli.range_events(read(events_list), None, last_minute, 10, True))
+        self.assertEqual(read_events[:-1], [event for event in events_list if event['timestamp'] <= last_minute])
+
+        # output of a time range, every minute of the range as the batch engines
+        # (ranges starting before the first event and ending after the last one)
+        for first_minute, last_minute in ((first_minute, last_minute),
+                                          (first_minute - 60 * minute, first_minute - 25 * minute),
+                                          (first_minute + 60 * minute, first_minute + 200 * minute)):
+            events = list(unbabel_cli.range_events(events_list, first_minute, last_minute, 10, True))
+            self.assertEqual(list(unbabel_cli.range_results(unbabel_cli.stream_moving_average(
+                events, 10, first_minute, last_minute), first_minute, last_minute)),
+                unbabel_cli.minute_moving_average(unbabel_cli.aggregate_minutes(events_list), 10, first_minute,
+                                                  last_minute))
+
+    def test_offset_index(self):
+        minute = unbabel_cli.MICROSECONDS_PER_MINUTE
+        events_list = random_events(1, 300)
+        with tempfile.TemporaryDirectory() as directory:
+            input_file = os.path.join(directory, 'events.json')
+            offsets = []
+            with open(input_file, 'w') as f:
+                for event in events_list:
+                    offsets.append(f.tell())
+                    f.write(json.dumps(dict(self.events_list[0], duration=event['duration'],
+                                            timestamp=event['timestamp'].strftime(unbabel_cli.TIMESTAMP_FORMAT))) +
+                            '\n')
+            self.assertEqual(unbabel_cli.load_offset_index(input_file), None)
+            unbabel_cli.write_offset_index(input_file)
+            offset_index = unbabel_cli.load_offset_index(input_file)
+            minutes = sorted(set(unbabel_cli.datetime_to_micros(event['timestamp'].replace(second=0, microsecond=0))
+                                 for event in events_list))
+            self.assertEqual(list(offset_index[0]), minutes)
+
+            timestamps = [unbabel_cli.datetime_to_micros(event['timestamp']) for event in events_list]
+            for timestamp in (timestamps[0] - 5 * minute, timestamps[50], timestamps[50] + 1, timestamps[-1]):
+                first_event = min(index for index, event_timestamp in enumerate(timestamps)
+                                  if event_timestamp >= timestamp - timestamp % minute)
+                self.assertEqual(unbabel_cli.index_offset(offset_index, timestamp), offsets[first_event])
+            self.assertEqual(unbabel_cli.index_offset(offset_index, timestamps[-1] + minute), None)
+
+            # reading starts on the first line needed by the first minute
+            first_minute = minutes[60]
+            events, sorted_input = unbabel_cli.range_stream_events(input_file, first_minute, None, 10)
+            self.assertTrue(sorted_input)
+            self.assertEqual(json.loads(next(events))['timestamp'],
+                             events_list[timestamps.index(min(timestamp for timestamp in timestamps
+                                                              if timestamp >= first_minute - 10 * minute))]
+                             ['timestamp'].strftime(unbabel_cli.TIMESTAMP_FORMAT))
+
+            # the index is not used once the input file changes
+            with open(input_file, 'a') as f:
+                f.write(json.dumps(self.events_list[2]) + '\n')
+            self.assertEqual(unbabel_cli.load_offset_index(input_file), None)
+            self.assertFalse(unbabel_cli.range_stream_events(input_file, first_minute, None, 10)[1])
+
+            # an unsorted input file cannot be indexed
+            with open(input_file, 'a') as f:
+                f.write(json.dumps(self.events_list[0]) + '\n')
+            with self.assertRaises(SystemExit) as cm:
+                unbabel_cli.write_offset_index(input_file)
+                self.assertEqual(cm.exception, 1)
+
+    def test_pipeline_stats(self):
+        stats = unbabel_cli.PipelineStats()
+        self.addCleanup(unbabel_cli.tracemalloc.stop)
+        with stats.stage('import_events') as stage:
+            events = list(stats.count(iter(range(10)), stage, 'records_in'))
+            stage['records_out'] = len(events) - 2
+        with self.assertRaises(SystemExit):
+            with stats.stage('perform_export'):
+                unbabel_cli.sys.exit(1)
+        self.assertEqual([stage['stage'] for stage in stats.stages], ['import_events', 'perform_export'])
+        self.assertEqual((stats.stages[0]['records_in'], stats.stages[0]['records_out']), (10, 8))
+        for key in ('wall_time', 'cpu_time', 'records_per_second', 'peak_memory', 'max_rss'):
+            self.assertIn(key, stats.stages[0])
+        self.assertIsNone(stats.stages[1]['records_per_second'])
+
+        report = io.StringIO()
+        stats.report(report)
+        self.assertEqual(json.loads(report.getvalue())['stages'], stats.stages)
+
+        # disabled: nothing is measured nor wrapped
+        stats = unbabel_cli.PipelineStats(enabled=False)
+        records = [1, 2]
+        with stats.stage('import_events') as stage:
+            self.assertIs(stats.count(records, stage, 'records_in'), records)
+        self.assertEqual(stats.stages, [])
+
+    def test_find_lines_end(self):
+        with tempfile.TemporaryDirectory() as directory:
+            input_file = os.path.join(directory, 'events.json')
+            with open(input_file, 'wb') as f:
+                f.write(b'{}\n{}\n{"timest')
+            self.assertEqual(unbabel_cli.find_lines_end(input_file, 0), 6)
+            self.assertEqual(unbabel_cli.find_lines_end(input_file, 6), 6)
+            self.assertEqual(unbabel_cli.find_lines_end(input_file, 3), 6)
+
     def test_check_output_file(self):
         result = unbabel_cli.check_output_file('output_file.json')
         self.assertEqual(result, None)
@@ -334,12 +1664,88 @@ class TestUnbabel_cli(unittest.TestCase):
             unbabel_cli.check_output_file('unbabel_cli_output.json')
             self.assertEqual(cm.exception, 1)
 
+    def test_encode_record(self):
+        records = [{'date': datetime.datetime(2018, 12, 26, 18, 11) + datetime.timedelta(minutes=minute),
+                    'average_delivery_time': value}
+                   for minute in range(0, 3000, 7) for value in (0, 20, 25.5, 1 / 3, 10 ** 20)]
+        records += [{'date': datetime.datetime(2018, 12, 26, 18, 11, 8, 509654), 'average_delivery_time': 1.5},
+                    {'date': datetime.datetime(2018, 12, 26, 18, 11, 8), 'average_delivery_time': float('nan')},
+                    {'client_name': 'easyjet', 'source_language': None, 'target_language': 'fr',
+                     'date': datetime.datetime(2018, 12, 26, 18, 11), 'average_delivery_time': True},
+                    {'client_name': 'caf\u00e9 "quoted"', 'date': datetime.date(2018, 12, 26)}]
+        for record in records:
+            self.assertEqual(unbabel_cli.encode_record(record), json.dumps(record, default=str))
+
+    def test_batches(self):
+        self.assertEqual(list(unbabel_cli.batches(range(7), 3)), [[0, 1, 2], [3, 4, 5], [6]])
+        self.assertEqual(list(unbabel_cli.batches([], 3)), [])
+
+    def test_check_output_format(self):
+        self.assertEqual(unbabel_cli.check_output_format('jsonl', None, False, None), None)
+        self.assertEqual(unbabel_cli.check_output_format('csv', ['client_name'], False, None), None)
+
+        with self.assertRaises(SystemExit) as cm:
+            unbabel_cli.check_output_format('columnar', ['client_name'], False, None)
+            self.assertEqual(cm.exception, 1)
+
+        with self.assertRaises(SystemExit) as cm:
+            unbabel_cli.check_output_format('csv', None, True, None)
+            self.assertEqual(cm.exception, 1)
+
+        with self.assertRaises(SystemExit) as cm:
+            unbabel_cli.check_output_format('csv', None, False, 'state.json')
+            self.assertEqual(cm.exception, 1)
+
+    @unittest.skipIf(unbabel_cli.msgpack is None, "msgpack is not installed")
+    def test_perform_export_msgpack(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output_file = os.path.join(directory, 'output.msgpack')
+            unbabel_cli.perform_export(self.output_list, output_file, 'msgpack')
+            with open(output_file, 'rb') as f:
+                records = list(unbabel_cli.msgpack.Unpacker(f))
+        self.assertEqual(records, [dict(line, date=str(line['date'])) for line in self.output_list])
+
     def test_perform_export(self):
         result = unbabel_cli.perform_export(self.output_list, 'output_file.json')
         self.assertEqual(result, None)
 
         result = unbabel_cli.perform_export(self.output_list, None)
         self.assertEqual(result, None)
+        with open('unbabel_cli_output.json') as f:
+            self.assertEqual(f.read(), ''.join(json.dumps(line, default=str) + '\n' for line in self.output_list))
+
+        with tempfile.TemporaryDirectory() as directory:
+            output_file = os.path.join(directory, 'output.csv')
+            unbabel_cli.perform_export(iter(self.output_list), output_file, 'csv')
+            with open(output_file) as f:
+                lines = f.read().splitlines()
+            self.assertEqual(lines[0], 'average_delivery_time,date')
+            self.assertEqual(lines[1:], [str(line['average_delivery_time']) + ',' + str(line['date'])
+                                         for line in self.output_list])
+
+            output_file = os.path.join(directory, 'output.col')
+            unbabel_cli.perform_export((line for line in self.output_list), output_file, 'columnar')
+            start, step, averages = unbabel_cli.read_columnar(output_file)
+            self.assertEqual(start, self.output_list[0]['date'])
+            self.assertEqual(step, datetime.timedelta(minutes=1))
+            self.assertEqual(list(averages), [line['average_delivery_time'] for line in self.output_list])
+
+            # dates which are not one per minute cannot be stored as a start and a step
+            with self.assertRaises(SystemExit) as cm:
+                unbabel_cli.perform_export(self.output_list[::2], os.path.join(directory, 'gaps.col'), 'columnar')
+                self.assertEqual(cm.exception, 1)
+            # nothing is left behind, an existing output file is kept as it was
+            self.assertEqual(sorted(os.listdir(directory)), ['output.col', 'output.csv'])
+            with self.assertRaises(SystemExit) as cm:
+                unbabel_cli.write_columnar(self.output_list[::2], output_file)
+                self.assertEqual(cm.exception, 1)
+            self.assertEqual(list(unbabel_cli.read_columnar(output_file)[2]),
+                             [line['average_delivery_time'] for line in self.output_list])
+            self.assertEqual(sorted(os.listdir(directory)), ['output.col', 'output.csv'])
+
+            with self.assertRaises(SystemExit) as cm:
+                unbabel_cli.perform_export(self.output_list, os.path.join(directory, 'output.json'), 'csv')
+                self.assertEqual(cm.exception, 1)
 
         # e.g. folder without permission to write
         # with self.assertRaises(SystemExit) as cm:
@@ -1,21 +1,274 @@
 import argparse
+import asyncio
+import atexit
+import bz2
+import cProfile
+import csv
+import gzip
+import hashlib
+import heapq
 import json
+import lzma
+import math
+import mmap
+import operator
 import os
+import re
+import struct
 import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import zlib
+from array import array
+from bisect import bisect_left
+from collections import Counter, OrderedDict, deque
+from contextlib import contextmanager
 from datetime import datetime, timedelta
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import accumulate, islice
+from urllib.parse import parse_qs, urlsplit
+from multiprocessing import Pool
 from statistics import mean
 
+try:
+    import numpy as np
+except ImportError:
+    # the numpy engine is optional, the python one is always available
+    np = None
 
-def check_extension(filename, file_type):
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+try:
+    import zstandard
+except ImportError:
+    # zstd compressed input files are optional
+    zstandard = None
+
+try:
+    import msgpack
+except ImportError:
+    # the msgpack output format is optional
+    msgpack = None
+
+try:
+    import resource
+except ImportError:
+    # the maximum resident set size of the --stats report is only available on unix
+    resource = None
+
+# timestamps are converted to int microseconds since EPOCH (naive datetimes, as in the input file)
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+# minute prefix of the fixed layout of the input file timestamps, only ascii digits (see parse_minute_prefix)
+MINUTE_PREFIX = re.compile(r'\d{4}-\d{2}-\d{2} \d{2}:\d{2}', re.ASCII)
+EPOCH = datetime(1970, 1, 1)
+MICROSECONDS_PER_MINUTE = 60 * 1000000
+# one event out of VALIDATION_SAMPLE_RATE is checked when validation is sample
+VALIDATION_SAMPLE_RATE = 100
+# keys which define the dict structure of an event
+EVENT_KEYS = ["timestamp", "translation_id", "source_language", "target_language", "client_name", "event_name",
+              "nr_words", "duration"]
+# metrics computed from the sums of the per minute rollups (the other ones need the durations of the events, see
+# check_metrics)
+ROLLUP_METRICS = ['avg', 'weighted_avg', 'seconds_per_word']
+# metrics which need the number of words of the events, only then nr_words is checked and summed (see word_metrics)
+WORD_METRICS = ['weighted_avg', 'seconds_per_word']
+# event keys which can be used to group the moving average series (see group_moving_average)
+GROUP_BY_KEYS = ['client_name', 'source_language', 'target_language']
+# seconds between two reads of the input file when there is nothing new on it (see read_lines)
+POLL_INTERVAL = 0.5
+# rollups cache (see load_cached_rollups), kept under CACHE_SIZE megabytes by default
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'unbabel_cli')
+CACHE_SIZE = 512
+CACHE_VERSION = 4
+# available json decoders, the fastest one (JSON_CODEC) is used to read the events (see iter_lines)
+JSON_CODECS = {'json': json.loads}
+if ujson is not None:
+    JSON_CODECS['ujson'] = ujson.loads
+if orjson is not None:
+    JSON_CODECS['orjson'] = orjson.loads
+JSON_CODEC = 'orjson' if orjson is not None else 'ujson' if ujson is not None else 'json'
+json_loads = JSON_CODECS[JSON_CODEC]
+# bytes read at once from the input file
+READ_BLOCK_SIZE = 1 << 20
+# compressed bytes decompressed at once from a zstd input file (see ZstdReader)
+ZSTD_READ_SIZE = 1 << 16
+# "%M:%S" of the dates with no seconds (see format_date)
+MINUTE_SUFFIXES = ['%02d:00' % minute for minute in range(60)]
+# extension of the output file of each output format (see perform_export)
+OUTPUT_EXTENSIONS = {'jsonl': '.json', 'csv': '.csv', 'columnar': '.col', 'msgpack': '.msgpack'}
+# number of output records encoded before each write
+WRITE_BATCH_SIZE = 4096
+# columnar output: magic, first date and step (microseconds) and number of averages, followed by the averages
+# (little-endian float64), so that the file can be memory-mapped
+COLUMNAR_MAGIC = b'UBCOL001'
+COLUMNAR_HEADER = struct.Struct('<8sqqq')
+# fields read by the mmap reader straight from the bytes of a line (see mmap_aggregate_groups)
+TIMESTAMP_FIELD = re.compile(rb'"timestamp"\s*:\s*"([^"]*)"')
+DURATION_FIELD = re.compile(rb'"duration"\s*:\s*(0|[1-9]\d{0,18})\s*[,}]')
+NR_WORDS_FIELD = re.compile(rb'"nr_words"\s*:\s*(0|[1-9]\d{0,18})\s*[,}]')
+EVENT_NAME_FIELD = re.compile(rb'"event_name"\s*:\s*"translation_delivered"')
+GROUP_FIELDS = [re.compile(rb'"' + key.encode() + rb'"\s*:\s*"([^"]*)"') for key in GROUP_BY_KEYS]
+# the fields are only read from the bytes of lines which are a single json object of strings without escapes,
+# numbers, booleans and nulls (the other lines are decoded as json)
+JSON_SPACE = rb'[ \t\r]*+'
+JSON_STRING = rb'"[^"\\\x00-\x1f]*+"'
+JSON_PAIR = JSON_STRING + JSON_SPACE + rb':' + JSON_SPACE + \
+    rb'(?:' + JSON_STRING + rb'|-?+(?:0|[1-9]\d*+)(?:\.\d++)?+(?:[eE][+-]?+\d++)?+|true|false|null)'
+FLAT_OBJECT = re.compile(JSON_SPACE + rb'\{' + JSON_SPACE + rb'(?:' + JSON_PAIR + rb'(?:' + JSON_SPACE + rb',' +
+                         JSON_SPACE + JSON_PAIR + rb')*+)?+' + JSON_SPACE + rb'\}' + JSON_SPACE)
+# sidecar offset index of an input file sorted by timestamp (see write_offset_index): magic, size and
+# modification time of the input file and number of minutes, followed by the minutes and the offsets of their first
+# lines (int64)
+INDEX_EXTENSION = '.idx'
+INDEX_MAGIC = b'UBIDX001'
+INDEX_HEADER = struct.Struct('<8sqqq')
+# external sort of the stream mode (see external_sort_events): estimated memory of a buffered event, compact records
+# of the sorted runs (timestamp, duration and ids of the client name and languages), records read at once from each
+# run and maximum number of runs merged at once
+SORT_RECORD_BYTES = 200
+SORT_RECORD = struct.Struct('<qqiii')
+SORT_READ_RECORDS = 1024
+SORT_MERGE_FANIN = 256
+# serve subcommand: address and number of query results kept (see AverageServer)
+SERVER_HOST = '127.0.0.1'
+SERVER_PORT = 8000
+SERVER_CACHE_ENTRIES = 1024
+# maximum duration (194 days in seconds) and number of words of an event, so that the per minute totals fit in the
+# 64-bit columns of the rollups: a duration * nr_words is below 2**48
+MAX_DURATION = 2 ** 24 - 1
+MAX_NR_WORDS = 2 ** 24 - 1
+# error messages per rejection reason (see check_event)
+REJECTION_MESSAGES = {'invalid json': "input file line is not valid json",
+                      'missing keys': "input file does not follow the expected structure",
+                      'invalid timestamp': "cannot convert timestamp string to a valid datetime",
+                      'invalid event name': "input file should only contain translations delivered",
+                      'invalid duration': "duration has to be a non-negative integer up to " + str(MAX_DURATION),
+                      'invalid nr_words': "nr_words has to be a non-negative integer up to " + str(MAX_NR_WORDS)}
+
+
+class ZstdReader:
+    """
+    Binary file object which decompresses a zstd compressed file as it is read, frame after frame. The stream reader
+    of zstandard ends silently when the file is truncated in the middle of a frame, a ZstdError is raised instead
+    """
+
+    def __init__(self, input_file):
+        """
+        :param input_file: path of a zstd compressed file
+        """
+        self.f = open(input_file, 'rb')
+        self.decompressor = zstandard.ZstdDecompressor()
+        # decompression object of the current frame (None between two frames)
+        self.frame = None
+        self.buffer = b''
+
+    def read(self, size=-1):
+        """
+        :param size: maximum number of decompressed bytes to be read (all of them if negative)
+        :return: the next decompressed bytes (empty at the end of the file);
+                 a ZstdError if the file is corrupt or ends in the middle of a frame
+        """
+        while size < 0 or len(self.buffer) < size:
+            data = self.f.read(ZSTD_READ_SIZE)
+            if not data:
+                if self.frame is not None:
+                    raise zstandard.ZstdError('truncated zstd frame')
+                break
+            while data:
+                if self.frame is None:
+                    self.frame = self.decompressor.decompressobj()
+                self.buffer += self.frame.decompress(data)
+                data = b''
+                if self.frame.eof:
+                    # the bytes after the end of the frame belong to the next one
+                    data = self.frame.unused_data
+                    self.frame = None
+        if size < 0:
+            size = len(self.buffer)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+    def close(self):
+        """
+        :return: the compressed file closed
+        """
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def open_zstd(input_file):
+    """
+    :param input_file: path of a zstd compressed file
+    :return: binary file object which decompresses the file as it is read (see ZstdReader)
+    """
+    return ZstdReader(input_file)
+
+
+# functions which open a compressed input file as a binary stream, per extension (after .json)
+DECOMPRESSORS = {'.gz': gzip.open, '.bz2': bz2.open, '.xz': lzma.open, '.zst': open_zstd}
+# errors raised while reading an input file, also the ones of corrupt or truncated compressed files (bz2 raises
+# OSError or EOFError, gzip also zlib.error)
+INPUT_ERRORS = (IOError, EOFError, zlib.error, lzma.LZMAError) + \
+    ((zstandard.ZstdError,) if zstandard is not None else ())
+
+
+def input_compression(filename):
+    """
+    :param filename: path of the input file
+    :return: the compression extension of the file (see DECOMPRESSORS), None if it is not compressed
+    """
+    for extension in DECOMPRESSORS:
+        if filename.lower().endswith('.json' + extension):
+            return extension
+    return None
+
+
+def open_input(input_file):
+    """
+    :param input_file: path of the input file
+    :return: binary file object of the input file, decompressed as it is read when the file is compressed
+    """
+    compression = input_compression(input_file)
+    if compression is None:
+        return open(input_file, 'rb')
+    return DECOMPRESSORS[compression](input_file)
+
+
+def check_extension(filename, file_type, extension='.json'):
     """
     :param filename: path of the file to be analysed
     :param file_type: states if we are analysing an input or a output file
-    :return: an assertion error if the analysed file extension is not .json
+    :param extension: expected extension of the file
+    :return: an assertion error if the analysed file extension is not the expected one
+             (input files can also be .json.gz, .json.bz2, .json.xz or .json.zst);
+             an error message if the input file is zstd compressed but zstandard is not installed
     """
+    compression = input_compression(filename) if file_type == 'input' else None
+    if compression == '.zst' and zstandard is None:
+        print("Error! zstd compressed input file requires zstandard to be installed")
+        sys.exit(1)
+    if compression is not None:
+        filename = filename[:-len(compression)]
     try:
-        assert filename.lower().endswith(".json")
+        assert filename.lower().endswith(extension)
     except AssertionError:
-        print('Error! ' + file_type + ' file must be a json file')
+        print('Error! ' + file_type + ' file must be a ' + extension[1:] + ' file')
         sys.exit(1)
 
 
@@ -27,6 +280,22 @@ def check_existence(filename):
     return os.path.exists(filename)
 
 
+def iter_lines(f, block_size=READ_BLOCK_SIZE):
+    """
+    :param f: file opened in binary mode
+    :param block_size: number of bytes read at once
+    :return: a generator of the lines (bytes, without the line break) from the current position until the end of the
+             file, read in blocks of block_size bytes
+    """
+    partial_line = b''
+    for block in iter(lambda: f.read(block_size), b''):
+        lines = (partial_line + block).split(b'\n')
+        partial_line = lines.pop()
+        yield from lines
+    if partial_line:
+        yield partial_line
+
+
 def import_events(input_file):
     """
     :param input_file: path of the file to be analysed
@@ -35,21 +304,111 @@ def import_events(input_file):
              a IOError if the json file cannot be open/read;
              a list of dict containing the content of the input file, otherwise
     """
-    imported_list = []
     check_extension(input_file, 'input')
     if not check_existence(input_file):
         print('Error! input file ' + input_file + ' does not exist')
         sys.exit(1)
     try:
-        with open(input_file) as f:
-            for line in f:
-                imported_list.append(json.loads(line))
+        with open_input(input_file) as f:
+            imported_list = [json_loads(line) for line in iter_lines(f)]
         return imported_list
-    except IOError:
+    except INPUT_ERRORS:
+        print("Error! cannot open/read input file")
+        sys.exit(1)
+
+
+def stream_lines(input_file, offset=0):
+    """
+    :param input_file: path of the file to be analysed
+    :param offset: byte offset (beginning of a line) where the reading starts (e.g. found on the offset index)
+    :return: (executes check extension)
+             a message error if the input file does not exist;
+             a IOError if the json file cannot be open/read;
+             a generator of the lines (bytes) of the input file, otherwise (the file is read lazily); the lines are
+             decoded by validate_events, which rejects the ones which are not valid json
+    """
+    check_extension(input_file, 'input')
+    if not check_existence(input_file):
+        print('Error! input file ' + input_file + ' does not exist')
+        sys.exit(1)
+    try:
+        with open_input(input_file) as f:
+            if offset:
+                f.seek(offset)
+            yield from iter_lines(f)
+    except INPUT_ERRORS:
         print("Error! cannot open/read input file")
         sys.exit(1)
 
 
+def check_time_range(start, end):
+    """
+    :param start: first date (iso format string, e.g. 2018-12-26 18:15:00) of the output selected by the user
+    :param end: last date (iso format string) of the output selected by the user
+    :return: tuple with the first and the last minutes (in microseconds since EPOCH) of the output, None when the
+             date was not selected;
+             an error message if a date is not valid, has a timezone or the start is after the end
+    """
+    minutes = []
+    for name, date in (('start', start), ('end', end)):
+        if date is None:
+            minutes.append(None)
+            continue
+        try:
+            date_time = datetime.fromisoformat(date)
+        except ValueError:
+            print("Error! " + name + " must be a date such as 2018-12-26 18:15:00")
+            sys.exit(1)
+        # the timestamps of the input have no timezone either
+        if date_time.tzinfo is not None:
+            print("Error! " + name + " must not have a timezone")
+            sys.exit(1)
+        timestamp = datetime_to_micros(date_time)
+        # first minute at or after start, last minute at or before end
+        offset = (-timestamp if name == 'start' else timestamp) % MICROSECONDS_PER_MINUTE
+        minutes.append(timestamp + offset if name == 'start' else timestamp - offset)
+    if None not in minutes and minutes[0] > minutes[1]:
+        print("Error! start must not be after end")
+        sys.exit(1)
+    return tuple(minutes)
+
+
+def range_events(events, first_minute, last_minute, window_size, sorted_input):
+    """
+    :param events: iterable of validated dict (timestamps in microseconds since EPOCH)
+    :param first_minute: first minute of the output (None for no lower bound)
+    :param last_minute: last minute of the output (None for no upper bound)
+    :param window_size: time window (in minutes) to be considered on the moving average calculation
+    :param sorted_input: true if the events are sorted by timestamp
+    :return: a generator of the events needed by the output minutes (from window_size minutes before the first
+             minute to the last minute); when the events are sorted, the input stops being read after the last minute
+    """
+    lower = None if first_minute is None else first_minute - window_size * MICROSECONDS_PER_MINUTE
+    for event in events:
+        timestamp = event['timestamp']
+        if last_minute is not None and timestamp > last_minute:
+            if sorted_input:
+                return
+            continue
+        if lower is None or timestamp >= lower:
+            yield event
+
+
+def range_results(results_list, first_minute, last_minute):
+    """
+    :param results_list: iterable of dict containing the aggregated output
+    :param first_minute: first minute of the output (None for no lower bound)
+    :param last_minute: last minute of the output (None for no upper bound)
+    :return: a generator of the output dict whose date is between the first and the last minutes
+    """
+    first_date = None if first_minute is None else micros_to_datetime(first_minute)
+    last_date = None if last_minute is None else micros_to_datetime(last_minute)
+    for dict_entry in results_list:
+        if (first_date is None or dict_entry['date'] >= first_date) and \
+                (last_date is None or dict_entry['date'] <= last_date):
+            yield dict_entry
+
+
 def check_window_size(window_size):
     """
     :param window_size: time window to be considered in the moving average calculation
@@ -60,6 +419,115 @@ def check_window_size(window_size):
         sys.exit(1)
 
 
+def check_window_sizes(window_sizes):
+    """
+    :param window_sizes: time window (in minutes) or comma separated time windows selected by the user (e.g. 1,5,15)
+    :return: the list of window sizes (executes the window size checker on each one);
+             an error message if a window size is not an integer or is repeated
+    """
+    window_sizes_list = []
+    for window_size in window_sizes.split(','):
+        try:
+            window_sizes_list.append(int(window_size))
+        except ValueError:
+            print("Error! window size must be an integer: " + window_size)
+            sys.exit(1)
+        check_window_size(window_sizes_list[-1])
+    if len(set(window_sizes_list)) != len(window_sizes_list):
+        print("Error! window sizes must not be repeated: " + window_sizes)
+        sys.exit(1)
+    return window_sizes_list
+
+
+def check_window_sizes_mode(stream, follow_state, tail):
+    """
+    :param stream: if stream mode was selected
+    :param follow_state: path of the follow state file selected by the user (None if not selected)
+    :param tail: if tail mode was selected
+    :return: an error message if several window sizes were combined with stream, follow state or tail (their output
+             is a single series written as the events arrive)
+    """
+    if stream or follow_state is not None or tail:
+        print("Error! several window sizes cannot be combined with stream, follow state or tail")
+        sys.exit(1)
+
+
+def window_series(moving_average, window_sizes):
+    """
+    :param moving_average: function of a window size returning the output records of its series (e.g. the ones of
+                           group_moving_average on a list of events)
+    :param window_sizes: list of time windows (in minutes)
+    :return: a generator of the output records of every window size tagged with their window_size, one series after
+             the other (as multi_window_moving_average)
+    """
+    for window_size in window_sizes:
+        for dict_entry in moving_average(window_size):
+            yield dict(window_size=window_size, **dict_entry)
+
+
+def datetime_to_micros(timestamp):
+    """
+    :param timestamp: datetime to be converted
+    :return: the number of microseconds since EPOCH
+    """
+    return (timestamp - EPOCH) // timedelta(microseconds=1)
+
+
+def micros_to_datetime(timestamp):
+    """
+    :param timestamp: number of microseconds since EPOCH
+    :return: the corresponding datetime
+    """
+    return EPOCH + timedelta(microseconds=timestamp)
+
+
+@lru_cache(maxsize=1024)
+def parse_minute_prefix(prefix):
+    """
+    :param prefix: first 16 characters of a timestamp string (%Y-%m-%d %H:%M), shared by the events of a minute
+    :return: the number of microseconds since EPOCH of the minute;
+             a ValueError if the prefix is not a valid date and time (its fields must be ascii digits, int would
+             also accept signs, spaces, underscores and other digits)
+    """
+    if MINUTE_PREFIX.fullmatch(prefix) is None:
+        raise ValueError(prefix)
+    minute = datetime(int(prefix[0:4]), int(prefix[5:7]), int(prefix[8:10]), int(prefix[11:13]), int(prefix[14:16]))
+    return datetime_to_micros(minute)
+
+
+def parse_timestamp(timestamp):
+    """
+    :param timestamp: timestamp string (%Y-%m-%d %H:%M:%S.%f)
+    :return: the number of microseconds since EPOCH; the fixed layout of the input file (e.g.
+             2018-12-26 18:11:08.509654) is sliced into fields, with the minute prefix cached as nearby events
+             share it, any other layout goes through datetime.strptime;
+             a ValueError (the one of datetime.strptime) if the string is not a valid timestamp
+    """
+    try:
+        if len(timestamp) == 26 and timestamp[16] == ':' and timestamp[19] == '.':
+            seconds = timestamp[17:19]
+            microseconds = timestamp[20:]
+            if seconds.isascii() and seconds.isdigit() and microseconds.isascii() and microseconds.isdigit() and \
+                    int(seconds) < 60:
+                return parse_minute_prefix(timestamp[:16]) + int(seconds) * 1000000 + int(microseconds)
+    except ValueError:
+        pass
+    return datetime_to_micros(datetime.strptime(timestamp, TIMESTAMP_FORMAT))
+
+
+def convert_timestamp(timestamp):
+    """
+    :param timestamp: timestamp string (%Y-%m-%d %H:%M:%S.%f) or an already converted datetime
+    :return: the timestamp as a datetime (already converted values are returned as they are);
+             a ValueError if the conversion failed
+    """
+    if isinstance(timestamp, datetime):
+        return timestamp
+    if not isinstance(timestamp, str):
+        raise ValueError("timestamp must be a string: " + str(timestamp))
+    return micros_to_datetime(parse_timestamp(timestamp))
+
+
 def convert_events_timestamp(events_list):
     """
     :param events_list: list of dict without properly formatted timestamps
@@ -68,7 +536,7 @@ def convert_events_timestamp(events_list):
     """
     try:
         for event in events_list:
-            event['timestamp'] = datetime.strptime(str(event['timestamp']), '%Y-%m-%d %H:%M:%S.%f')
+            event['timestamp'] = convert_timestamp(event['timestamp'])
         return events_list
     except ValueError as ve:
         print("Error! cannot convert timestamp string to a valid datetime: " + str(ve))
@@ -99,26 +567,222 @@ def check_events_durations(events_list):
             sys.exit(1)
 
 
+def check_event_timestamp(event):
+    """
+    :param event: dict to be analysed
+    :return: None if the timestamp of the event was converted to microseconds since EPOCH (in place);
+             the rejection reason, otherwise
+    """
+    try:
+        timestamp = event['timestamp']
+        if isinstance(timestamp, str):
+            event['timestamp'] = parse_timestamp(timestamp)
+        elif isinstance(timestamp, datetime):
+            event['timestamp'] = datetime_to_micros(timestamp)
+        else:
+            return 'invalid timestamp'
+    except (KeyError, ValueError):
+        return 'invalid timestamp'
+    return None
+
+
+def check_event(event, dict_keys_list, words=False):
+    """
+    :param event: dict to be analysed
+    :param dict_keys_list: keys that the dict must have
+    :param words: if the number of words of the event is used (see word_metrics)
+    :return: None if the event has all keys, a valid timestamp (converted to microseconds since EPOCH in place),
+             event name translation_delivered, a non-negative int duration up to MAX_DURATION and, when words is
+             true, a non-negative int nr_words up to MAX_NR_WORDS (if any);
+             the rejection reason, otherwise
+    """
+    if not all(key in event for key in dict_keys_list):
+        return 'missing keys'
+    reason = check_event_timestamp(event)
+    if reason is not None:
+        return reason
+    if event['event_name'] != 'translation_delivered':
+        return 'invalid event name'
+    if not isinstance(event['duration'], int) or not 0 <= event['duration'] <= MAX_DURATION:
+        return 'invalid duration'
+    if words:
+        nr_words = event.get('nr_words', 0)
+        if not isinstance(nr_words, int) or not 0 <= nr_words <= MAX_NR_WORDS:
+            return 'invalid nr_words'
+    return None
+
+
 def check_events(events_list, dict_keys_list):
     """
     :param events_list: list of dict to be analysed
     :param dict_keys_list: keys that the dict entries must have
     :return: an error message if the list is empty;
-             an error message if the list of dict does not follow the expected structure (i.e. contains all keys);
-             the execution of convert event timestamp and check event name and durations, otherwise
+             an error message on the first dict which does not follow the expected structure (i.e. contains all
+             keys), has an invalid timestamp, event name or duration (each dict is checked only once);
+             the dict timestamps are converted to microseconds since EPOCH, otherwise
     """
     if not events_list:
         print("Error! input file is empty")
         sys.exit(1)
-    else:
-        for event in events_list:
-            if all(key in event for key in dict_keys_list):
-                events_list = convert_events_timestamp(events_list)
-                check_event_name(events_list)
-                check_events_durations(events_list)
-            else:
-                print("Error! input file does not follow the expected structure: " + str(event))
-                sys.exit(1)
+    for event in events_list:
+        reason = check_event(event, dict_keys_list)
+        if reason is not None:
+            print("Error! " + REJECTION_MESSAGES[reason] + ": " + str(event))
+            sys.exit(1)
+
+
+def validate_events(events, dict_keys_list, validation, rejections, words=False):
+    """
+    :param events: iterable of dict or of json lines (bytes or str, e.g. the lines of stream_lines) to be analysed
+    :param dict_keys_list: keys that the dict entries must have
+    :param validation: strict (every event is checked), sample (one event out of VALIDATION_SAMPLE_RATE is
+                       checked) or off (no event is checked); timestamps are always converted, lines are always
+                       decoded (invalid json is rejected) and values which are not dict are always rejected (missing
+                       keys)
+    :param rejections: Counter updated with the number of rejected events per rejection reason
+    :param words: if the number of words of the events is used (checked as the other fields, see check_event)
+    :return: a generator of the events which were not rejected (each one is handled only once)
+    """
+    for index, event in enumerate(events):
+        if isinstance(event, (bytes, str)):
+            try:
+                event = json_loads(event)
+            except ValueError:
+                rejections['invalid json'] += 1
+                continue
+        if not isinstance(event, dict):
+            rejections['missing keys'] += 1
+            continue
+        if validation == 'strict' or (validation == 'sample' and index % VALIDATION_SAMPLE_RATE == 0):
+            reason = check_event(event, dict_keys_list, words)
+        else:
+            reason = check_event_timestamp(event)
+        if reason is None:
+            yield event
+        else:
+            rejections[reason] += 1
+
+
+class Event:
+    """
+    Compact representation of a validated event: only the fields used by the KPI, in slots instead of a dict, with
+    the client name and languages interned (shared by all the events of the same group). The fields can also be
+    read as keys (event['timestamp']), as the ones of the dict it replaces
+    """
+
+    __slots__ = ('timestamp', 'duration', 'client_name', 'source_language', 'target_language', 'nr_words')
+
+    def __init__(self, timestamp, duration, client_name, source_language, target_language, nr_words=0):
+        """
+        :param timestamp: timestamp of the event in microseconds since EPOCH
+        :param duration: duration of the event
+        :param client_name: client name of the event
+        :param source_language: source language of the event
+        :param target_language: target language of the event
+        :param nr_words: number of words of the event
+        """
+        self.timestamp = timestamp
+        self.duration = duration
+        self.client_name = client_name
+        self.source_language = source_language
+        self.target_language = target_language
+        self.nr_words = nr_words
+
+    def __getitem__(self, key):
+        """
+        :param key: name of the field
+        :return: the value of the field;
+                 a KeyError if the event has no such field (e.g. fields dropped after validation)
+        """
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+    def get(self, key, default=None):
+        """
+        :param key: name of the field
+        :param default: value returned if the event has no such field
+        :return: the value of the field, as dict.get
+        """
+        return getattr(self, key, default)
+
+    def __eq__(self, other):
+        """
+        :param other: object to be compared
+        :return: true if other is an Event with the same fields
+        """
+        return isinstance(other, Event) and all(getattr(self, key) == getattr(other, key) for key in self.__slots__)
+
+    def __repr__(self):
+        """
+        :return: the event as Event(timestamp=..., ...)
+        """
+        return 'Event(' + ', '.join(key + '=' + repr(getattr(self, key)) for key in self.__slots__) + ')'
+
+
+def compact_events(events, words=False):
+    """
+    :param events: iterable of validated dict (timestamps in microseconds since EPOCH)
+    :param words: if the number of words of the events is kept (0 otherwise, see word_metrics)
+    :return: a generator of Event, one per dict (the other fields of the dict are dropped), with the client names
+             and languages interned
+    """
+    # one object per distinct client name and language
+    names = {}
+    for event in events:
+        client_name = event['client_name']
+        source_language = event['source_language']
+        target_language = event['target_language']
+        nr_words = (event.get('nr_words') or 0) if words else 0
+        yield Event(event['timestamp'], event['duration'], names.setdefault(client_name, client_name),
+                    names.setdefault(source_language, source_language),
+                    names.setdefault(target_language, target_language), nr_words)
+
+
+def report_rejections(rejections, valid_events_count, allow_empty=False):
+    """
+    :param rejections: Counter with the number of rejected events per rejection reason
+    :param valid_events_count: number of events which were not rejected
+    :param allow_empty: if no valid event is not an error (e.g. nothing was appended to the input file)
+    :return: a warning message with the number of rejected events and why, if any;
+             an error message if the input file is empty or if every event was rejected
+    """
+    if rejections:
+        print("Warning! " + str(sum(rejections.values())) + " events rejected: " +
+              ", ".join(str(count) + " " + reason for reason, count in sorted(rejections.items())))
+    if valid_events_count == 0 and not allow_empty:
+        if rejections:
+            print("Error! no valid events found on input file")
+        else:
+            print("Error! input file is empty")
+        sys.exit(1)
+
+
+def stream_check_events(events, dict_keys_list, validation='strict', check_order=True):
+    """
+    :param events: iterable of dict or json lines to be analysed (e.g. the generator returned by stream_lines)
+    :param dict_keys_list: keys that the dict entries must have
+    :param validation: strict, sample or off (see validate_events)
+    :param check_order: if the events must be sorted by timestamp (false when they are sorted afterwards, see
+                        external_sort_events)
+    :return: a generator of the valid dict with timestamps in microseconds since EPOCH, checked one at a time;
+             (executes report rejections once the input is consumed);
+             an error message if an entry is older than the previous one (stream mode needs sorted events)
+    """
+    rejections = Counter()
+    valid_events_count = 0
+    last_timestamp = None
+    for event in validate_events(events, dict_keys_list, validation, rejections):
+        if check_order and last_timestamp is not None and event['timestamp'] < last_timestamp:
+            print("Error! stream mode requires events sorted by timestamp (or a memory limit): " +
+                  str(micros_to_datetime(event['timestamp'])) + " comes after " +
+                  str(micros_to_datetime(last_timestamp)))
+            sys.exit(1)
+        last_timestamp = event['timestamp']
+        valid_events_count += 1
+        yield event
+    report_rejections(rejections, valid_events_count)
 
 
 def sort_events_timestamp(events_list):
@@ -130,6 +794,144 @@ def sort_events_timestamp(events_list):
     return events_list_sorted
 
 
+def check_memory_limit(memory_limit, stream):
+    """
+    :param memory_limit: megabytes of events kept in memory by the sort of the stream mode, selected by the user
+    :param stream: if stream mode was selected
+    :return: an error message if the memory limit is not a positive integer;
+             an error message if stream mode was not selected (batch mode sorts the events in memory)
+    """
+    if memory_limit <= 0:
+        print("Error! memory limit must be greater than 0")
+        sys.exit(1)
+    if not stream:
+        print("Error! memory limit can only be used in stream mode")
+        sys.exit(1)
+
+
+def buffer_events(memory_limit):
+    """
+    :param memory_limit: megabytes of events kept in memory
+    :return: the number of events kept in memory by external_sort_events (see SORT_RECORD_BYTES)
+    """
+    return max(memory_limit * 1024 * 1024 // SORT_RECORD_BYTES, 1)
+
+
+def reorder_records(heap, records, late):
+    """
+    :param heap: heap of the first records (as many as fit in memory), updated in place
+    :param records: iterator of the next records
+    :param late: list where the first record older than the last one emitted is appended
+    :return: a generator of the records in order, the oldest record of the heap being emitted as each new record
+             arrives; it stops at the first record that comes after more newer ones than fit in the heap (which is
+             appended to late and the rest left in the heap and in records)
+    """
+    oldest = None
+    for record in records:
+        if oldest is not None and record < oldest:
+            late.append(record)
+            return
+        oldest = heapq.heappushpop(heap, record)
+        yield oldest
+    while heap:
+        yield heapq.heappop(heap)
+
+
+def write_sorted_run(records, directory):
+    """
+    :param records: iterable of compact records (timestamp, duration, client name id, source language id and target
+                    language id), sorted
+    :param directory: directory of the temporary files
+    :return: the path of the temporary file where the records were written (SORT_RECORD each)
+    """
+    with tempfile.NamedTemporaryFile('wb', dir=directory, suffix='.run', delete=False) as f:
+        for batch in batches(records):
+            f.write(b''.join([SORT_RECORD.pack(*record) for record in batch]))
+    return f.name
+
+
+def read_sorted_run(path):
+    """
+    :param path: path of a file written by write_sorted_run
+    :return: a generator of its records, read SORT_READ_RECORDS at a time
+    """
+    with open(path, 'rb') as f:
+        block = f.read(SORT_READ_RECORDS * SORT_RECORD.size)
+        while block:
+            yield from SORT_RECORD.iter_unpack(block)
+            block = f.read(SORT_READ_RECORDS * SORT_RECORD.size)
+
+
+def merge_sorted_runs(runs, directory):
+    """
+    :param runs: paths of files written by write_sorted_run
+    :param directory: directory of the temporary files
+    :return: the path of the temporary file where the records of the runs were written merged (the runs are removed)
+    """
+    with tempfile.NamedTemporaryFile('wb', dir=directory, suffix='.run', delete=False) as f:
+        for batch in batches(heapq.merge(*[read_sorted_run(run) for run in runs])):
+            f.write(b''.join([SORT_RECORD.pack(*record) for record in batch]))
+    for run in runs:
+        os.remove(run)
+    return f.name
+
+
+def external_sort_events(events, memory_limit):
+    """
+    :param events: iterable of validated events (timestamps in microseconds since EPOCH, int durations)
+    :param memory_limit: megabytes of records kept in memory (see buffer_events)
+    :return: a generator of Event sorted by timestamp, reading the events once: the events are kept as compact
+             records (timestamp, duration and ids of the client name and languages), sorted in memory when they fit,
+             written otherwise in order through a reorder buffer of that size (see reorder_records) to a temporary
+             file read back as a single run, or, from the first event that comes after more newer ones than fit in
+             memory, as runs sorted in memory, which are k-way merged with heapq.merge (runs are merged
+             SORT_MERGE_FANIN at a time, so the number of open files stays bounded)
+    """
+    heap_size = buffer_events(memory_limit)
+    # id of each distinct client name and language, and the reverse
+    ids = {}
+    names = []
+
+    def compact_records(events):
+        for event in events:
+            record = [event['timestamp'], event['duration']]
+            for key in GROUP_BY_KEYS:
+                name = event[key]
+                name_id = ids.get(name)
+                if name_id is None:
+                    name_id = ids[name] = len(names)
+                    names.append(name)
+                record.append(name_id)
+            yield tuple(record)
+    records = compact_records(events)
+    with tempfile.TemporaryDirectory(prefix='unbabel_cli_sort_') as directory:
+        heap = list(islice(records, heap_size))
+        if len(heap) < heap_size:
+            # every event fits in memory
+            heap.sort()
+            merged = heap
+        else:
+            heapq.heapify(heap)
+            late = []
+            runs = [write_sorted_run(reorder_records(heap, records, late), directory)]
+            if late:
+                # an event came after more newer ones than fit in memory: what is buffered and the next events are
+                # written as runs sorted in memory
+                heap.extend(late)
+                heap.sort()
+                runs.append(write_sorted_run(heap, directory))
+                del heap
+                for batch in batches(records, heap_size):
+                    batch.sort()
+                    runs.append(write_sorted_run(batch, directory))
+            while len(runs) > SORT_MERGE_FANIN:
+                merging, runs = runs[:SORT_MERGE_FANIN], runs[SORT_MERGE_FANIN:]
+                runs.append(merge_sorted_runs(merging, directory))
+            merged = heapq.merge(*[read_sorted_run(run) for run in runs])
+        for timestamp, duration, client_id, source_id, target_id in merged:
+            yield Event(timestamp, duration, names[client_id], names[source_id], names[target_id])
+
+
 def check_client(events_list, client_name):
     """
     :param events_list: list of dict to be analysed
@@ -213,6 +1015,24 @@ def filter_events(events_list, client_name, source_language, target_language):
     return events_list_filtered
 
 
+def stream_filter_events(events, client_name, source_language, target_language):
+    """
+    :param events: iterable of dict to be analysed
+    :param client_name: client name to filter events
+    :param source_language: source language to filter events
+    :param target_language: target language to filter events
+    :return: a generator of the dict matching client name, source and target languages (when requested)
+    """
+    for event in events:
+        if client_name is not None and event['client_name'] != client_name:
+            continue
+        if source_language is not None and event['source_language'] != source_language:
+            continue
+        if target_language is not None and event['target_language'] != target_language:
+            continue
+        yield event
+
+
 def find_min_max_timestamp(events_list):
     """
     :param events_list: list of dict to be analysed
@@ -228,10 +1048,11 @@ def find_min_max_timestamp(events_list):
 
 def moving_average(events_list, window_size):
     """
-    :param events_list: list of dict to be analysed
+    :param events_list: list of dict to be analysed (timestamps as datetime)
     :param window_size: time window (in minutes) to be considered on the moving average calculation
     :return: (executes the function which determines the time range to be analysed)
-             a list of dict containing the aggregated output (average delivery time per minute)
+             a list of dict containing the aggregated output (average delivery time per minute);
+             reference implementation of the engines (the events list is filtered for every minute, see ENGINES)
     """
     results_list = []
     min_timestamp, max_timestamp = find_min_max_timestamp(events_list)
@@ -248,74 +1069,2841 @@ def moving_average(events_list, window_size):
     return results_list
 
 
-def check_output_file(output_file):
+def average_delivery_time(duration_sum, events_count):
     """
-    :param output_file: path to where the results gonna be exported
-    :return: (executes de extension checker)
-             an error message if the selected output file already exists (does not overwrite)
+    :param duration_sum: sum of the durations of the events on a window
+    :param events_count: number of events on a window
+    :return: the average delivery time, following the same rules as statistics.mean on a list of int
+             (an int when the division is exact, a float otherwise and 0 when the window is empty)
     """
-    check_extension(output_file, 'output')
-    if check_existence(output_file):
-        print('Error! output file ' + output_file + ' already exists')
-        sys.exit(1)
+    if events_count == 0:
+        return 0
+    if duration_sum % events_count == 0:
+        return duration_sum // events_count
+    return duration_sum / events_count
 
 
-def perform_export(results_list, output_file):
+class Rollup:
     """
-    :param results_list: list of dict containing the aggregated output (average delivery time per list)
-    :param output_file: path to where the results gonna be exported
-    :return: export results to unbabel_cli_output.json, if the user did not select an output file path
-             (overwrite if the file already exists);
-             exports to the user selection (after executing the output file checker), otherwise;
-             an IOError message if it cannot open/write the output file
+    Per minute totals of events, kept in arrays instead of dicts: sum of durations and number of events, plus the
+    same totals for the events on the exact minute (they also belong to the window of that minute), and, only when
+    words is true, the same for the number of words and the durations weighted by them (sum of duration * nr_words).
+    The subclasses define the index of each minute on the arrays (see MinuteRollup and SparseRollup)
     """
-    if output_file is None:
-        output_file = "unbabel_cli_output.json"
-    else:
-        check_output_file(output_file)
-    try:
-        with open(output_file, 'w') as outfile:
-            for line in results_list:
-                json.dump(line, outfile, default=str)
-                outfile.write('\n')
-    except IOError:
-        print("Error! cannot open/write output file")
-        sys.exit(1)
 
+    def __init__(self, words=False):
+        """
+        :param words: if the sums of the number of words are kept (see word_metrics), their arrays stay empty otherwise
+        """
+        self.words = words
+        self.duration_sums = array('q')
+        self.events_counts = array('q')
+        self.edge_duration_sums = array('q')
+        self.edge_events_counts = array('q')
+        self.words_sums = array('q')
+        self.weighted_duration_sums = array('q')
+        self.edge_words_sums = array('q')
+        self.edge_weighted_duration_sums = array('q')
 
-if __name__ == '__main__':
-    # initialize keys which define the dict structure
-    dict_keys = ["timestamp", "translation_id", "source_language", "target_language", "client_name", "event_name",
-                 "nr_words", "duration"]
+    def columns(self):
+        """
+        :return: the arrays of the rollup (sums of durations, numbers of events and the same on the exact minute,
+                 followed by the sums of words, weighted durations and the same on the exact minute if words is true)
+        """
+        if not self.words:
+            return self.duration_sums, self.events_counts, self.edge_duration_sums, self.edge_events_counts
+        return self.duration_sums, self.events_counts, self.edge_duration_sums, self.edge_events_counts, \
+            self.words_sums, self.weighted_duration_sums, self.edge_words_sums, self.edge_weighted_duration_sums
 
-    # create parser to read arguments from command line
-    parser = argparse.ArgumentParser()
-    # add the input arguments
-    parser.add_argument('--input_file', required=True, type=str, dest="input_file",
-                        help="path to a json file containing the stream of events to be analysed")
-    parser.add_argument('--window_size', required=True, type=int, dest="window_size",
-                        help="time window (in minutes) to be considered on the moving average calculation")
-    parser.add_argument('--output_file', default=None, type=str, dest="output_file",
-                        help="path to where the aggregated output is going to be export (json file)")
-    parser.add_argument('--client_name', default=None, type=str, dest="client_name",
-                        help="specify a client name in order to calculated his KPI")
-    parser.add_argument("--source_language", default=None, type=str, dest="source_language",
-                        help="specify a source language in order to calculate its KPI ")
-    parser.add_argument("--target_language", default=None, type=str, dest="target_language",
-                        help="specify a target language in order to calculate its KPI")
+    def index(self, minute):
+        """
+        :param minute: minute (in microseconds since EPOCH, truncated) to be stored
+        :return: the index of the minute on the arrays (defined by the subclasses)
+        """
+        raise NotImplementedError
 
-    args = parser.parse_args()
+    def add(self, timestamp, duration, nr_words=0):
+        """
+        :param timestamp: timestamp of the event in microseconds since EPOCH
+        :param duration: duration of the event
+        :param nr_words: number of words of the event (ignored if words is false)
+        :return: the totals of the minute of the event updated
+        """
+        offset = timestamp % MICROSECONDS_PER_MINUTE
+        index = self.index(timestamp - offset)
+        self.duration_sums[index] += duration
+        self.events_counts[index] += 1
+        if offset == 0:
+            self.edge_duration_sums[index] += duration
+            self.edge_events_counts[index] += 1
+        if self.words:
+            self.words_sums[index] += nr_words
+            self.weighted_duration_sums[index] += duration * nr_words
+            if offset == 0:
+                self.edge_words_sums[index] += nr_words
+                self.edge_weighted_duration_sums[index] += duration * nr_words
 
-    # import events
-    events = import_events(args.input_file)
-    # check required args values
-    check_window_size(args.window_size)
-    check_events(events, dict_keys)
-    # sort events based on timestamp
-    events = sort_events_timestamp(events)
-    # filter events based on optional args
-    events = filter_events(events, args.client_name, args.source_language, args.target_language)
-    # calculates the KPI
-    results = moving_average(events, args.window_size)
-    # exports results to json file
-    perform_export(results, args.output_file)
+    def add_totals(self, minute, totals):
+        """
+        :param minute: minute (in microseconds since EPOCH, truncated)
+        :param totals: totals of the minute (in the order of the columns, missing ones are left unchanged)
+        :return: the totals added to the ones of the minute
+        """
+        index = self.index(minute)
+        for column, value in zip(self.columns(), totals):
+            column[index] += value
+
+
+class MinuteRollup(Rollup):
+    """
+    Rollup with the arrays indexed by minute, from the first to the last minute with events: the memory used is
+    proportional to the time span covered, not to the number of events, and the window sums of a series are read
+    as slices of the arrays (see minute_moving_average)
+    """
+
+    def __init__(self, words=False):
+        """
+        :param words: if the sums of the number of words are kept (see word_metrics), their arrays stay empty otherwise
+        """
+        super().__init__(words)
+        # minute (in microseconds since EPOCH) of the index 0 of the arrays
+        self.start = None
+        # indexes of the first and last minutes with events
+        self.first = self.last = None
+
+    def __len__(self):
+        """
+        :return: number of minutes between the first and the last minutes with events (0 if there is no event)
+        """
+        return 0 if self.start is None else self.last - self.first + 1
+
+    def minute(self, index):
+        """
+        :param index: index of the arrays
+        :return: the minute (in microseconds since EPOCH) of the index
+        """
+        return self.start + index * MICROSECONDS_PER_MINUTE
+
+    def index(self, minute):
+        """
+        :param minute: minute (in microseconds since EPOCH, truncated) to be stored
+        :return: the index of the minute, after growing the arrays if needed (doubling their size, so that
+                 unsorted events are handled in amortized constant time)
+        """
+        if self.start is None:
+            self.start = minute
+            self.first = self.last = 0
+        index = (minute - self.start) // MICROSECONDS_PER_MINUTE
+        capacity = len(self.duration_sums)
+        if index < 0:
+            padding = max(-index, capacity)
+            for column in self.columns():
+                column[0:0] = array('q', bytes(padding * column.itemsize))
+            self.start -= padding * MICROSECONDS_PER_MINUTE
+            self.first += padding
+            self.last += padding
+            index += padding
+        elif index >= capacity:
+            padding = max(index + 1 - capacity, capacity)
+            for column in self.columns():
+                column.frombytes(bytes(padding * column.itemsize))
+        self.first = min(self.first, index)
+        self.last = max(self.last, index)
+        return index
+
+    def merge(self, other):
+        """
+        :param other: MinuteRollup to be added to this one (e.g. the one of another chunk of the input file), or
+                      SparseRollup (e.g. the one of a group, see SparseRollup.add_to), with the same columns
+        :return: the totals of the other rollup added to this one, a slice of each column at once (the arrays are
+                 grown first to cover the minutes of the other rollup), as numpy arrays when numpy is installed
+        """
+        if isinstance(other, SparseRollup):
+            other.add_to(self)
+            return
+        if other.start is None:
+            return
+        self.index(other.minute(other.first))
+        self.index(other.minute(other.last))
+        offset = (other.start - self.start) // MICROSECONDS_PER_MINUTE
+        lower, upper = other.first + offset, other.last + 1 + offset
+        for column, other_column in zip(self.columns(), other.columns()):
+            if np is not None:
+                # views of the arrays, the slice of the column is added in place
+                np.frombuffer(column, dtype=np.int64)[lower:upper] += \
+                    np.frombuffer(other_column, dtype=np.int64)[other.first:other.last + 1]
+            else:
+                column[lower:upper] = array('q', map(operator.add, column[lower:upper],
+                                                     other_column[other.first:other.last + 1]))
+
+    def to_bytes(self):
+        """
+        :return: the arrays of the rollup, from the first to the last minute with events, as bytes (see from_bytes)
+        """
+        if self.start is None:
+            return b''
+        return b''.join(column[self.first:self.last + 1].tobytes() for column in self.columns())
+
+    @classmethod
+    def from_bytes(cls, start, minutes_number, data, words=False):
+        """
+        :param start: first minute (in microseconds since EPOCH) of the rollup
+        :param minutes_number: number of minutes of the rollup
+        :param data: bytes returned by to_bytes
+        :param words: if the rollup which returned data kept the sums of words
+        :return: the MinuteRollup stored in data
+        """
+        rollup = cls(words)
+        if minutes_number == 0:
+            return rollup
+        rollup.start = start
+        rollup.first, rollup.last = 0, minutes_number - 1
+        column_size = minutes_number * rollup.duration_sums.itemsize
+        for index, column in enumerate(rollup.columns()):
+            column.frombytes(data[index * column_size:(index + 1) * column_size])
+        return rollup
+
+    def events_count(self, first_minute=None, last_minute=None):
+        """
+        :param first_minute: minute (in microseconds since EPOCH, truncated) of the oldest events to be counted (None
+                             for no lower bound)
+        :param last_minute: minute (in microseconds since EPOCH, truncated) of the newest events to be counted, only
+                            the ones on the exact minute (None for no upper bound)
+        :return: number of events with a timestamp between first_minute and last_minute (both included)
+        """
+        if self.start is None:
+            return 0
+        lower = self.first if first_minute is None else max((first_minute - self.start) // MICROSECONDS_PER_MINUTE,
+                                                            self.first)
+        if last_minute is None:
+            return sum(self.events_counts[lower:self.last + 1])
+        upper = (last_minute - self.start) // MICROSECONDS_PER_MINUTE
+        if upper > self.last:
+            return sum(self.events_counts[lower:self.last + 1])
+        edge_events_count = self.edge_events_counts[upper] if lower <= upper else 0
+        return sum(self.events_counts[lower:max(upper, 0)]) + edge_events_count
+
+    def items(self):
+        """
+        :return: a generator of (minute, totals of the minute in the order of the columns) of the minutes with events
+        """
+        if self.start is None:
+            return
+        for index in range(self.first, self.last + 1):
+            if self.events_counts[index] > 0:
+                yield self.minute(index), tuple(column[index] for column in self.columns())
+
+
+class SparseRollup(Rollup):
+    """
+    Rollup of the minutes with events only (e.g. of one client and language pair): each minute gets the next index of
+    the arrays when it is first seen, kept in a dict keyed by minute. The memory used is proportional to the number
+    of minutes with events, not to the time span covered, so the rollups of many groups spread over a long time fit
+    in memory; the selected ones are added to a MinuteRollup to compute their series (see merge_rollups)
+    """
+
+    def __init__(self, words=False):
+        """
+        :param words: if the sums of the number of words are kept (see word_metrics), their arrays stay empty otherwise
+        """
+        super().__init__(words)
+        # index of each minute (in microseconds since EPOCH) on the arrays, and the minute of each index
+        self.indexes = {}
+        self.minutes = array('q')
+
+    def __len__(self):
+        """
+        :return: number of minutes with events
+        """
+        return len(self.minutes)
+
+    def index(self, minute):
+        """
+        :param minute: minute (in microseconds since EPOCH, truncated) to be stored
+        :return: the index of the minute, appended to the arrays when it is new
+        """
+        index = self.indexes.get(minute)
+        if index is None:
+            index = self.indexes[minute] = len(self.minutes)
+            self.minutes.append(minute)
+            for column in self.columns():
+                column.append(0)
+        return index
+
+    def add_to(self, rollup):
+        """
+        :param rollup: MinuteRollup with the same columns
+        :return: the totals of this rollup added to the ones of the same minutes of rollup (its arrays are grown
+                 first to cover the minutes), as numpy arrays when numpy is installed
+        """
+        if not self.minutes:
+            return
+        rollup.index(min(self.minutes))
+        rollup.index(max(self.minutes))
+        if np is not None:
+            # the minutes are distinct, so each index of the rollup is added once
+            indexes = (np.frombuffer(self.minutes, dtype=np.int64) - rollup.start) // MICROSECONDS_PER_MINUTE
+            for column, other_column in zip(rollup.columns(), self.columns()):
+                np.frombuffer(column, dtype=np.int64)[indexes] += np.frombuffer(other_column, dtype=np.int64)
+        else:
+            for other_index, minute in enumerate(self.minutes):
+                index = (minute - rollup.start) // MICROSECONDS_PER_MINUTE
+                for column, other_column in zip(rollup.columns(), self.columns()):
+                    column[index] += other_column[other_index]
+
+    def to_bytes(self):
+        """
+        :return: the minutes and the arrays of the rollup as bytes (see from_bytes)
+        """
+        return b''.join(column.tobytes() for column in (self.minutes,) + self.columns())
+
+    @classmethod
+    def from_bytes(cls, minutes_number, data, words=False):
+        """
+        :param minutes_number: number of minutes of the rollup
+        :param data: bytes returned by to_bytes
+        :param words: if the rollup which returned data kept the sums of words
+        :return: the SparseRollup stored in data
+        """
+        rollup = cls(words)
+        column_size = minutes_number * rollup.minutes.itemsize
+        for index, column in enumerate((rollup.minutes,) + rollup.columns()):
+            column.frombytes(data[index * column_size:(index + 1) * column_size])
+        rollup.indexes = {minute: index for index, minute in enumerate(rollup.minutes)}
+        return rollup
+
+    def events_count(self, first_minute=None, last_minute=None):
+        """
+        :param first_minute: minute (in microseconds since EPOCH, truncated) of the oldest events to be counted (None
+                             for no lower bound)
+        :param last_minute: minute (in microseconds since EPOCH, truncated) of the newest events to be counted, only
+                            the ones on the exact minute (None for no upper bound)
+        :return: number of events with a timestamp between first_minute and last_minute (both included)
+        """
+        if first_minute is None and last_minute is None:
+            return sum(self.events_counts)
+        events_count = 0
+        for minute, minute_events_count, edge_events_count in zip(self.minutes, self.events_counts,
+                                                                  self.edge_events_counts):
+            if first_minute is not None and minute < first_minute:
+                continue
+            if last_minute is None or minute < last_minute:
+                events_count += minute_events_count
+            elif minute == last_minute:
+                events_count += edge_events_count
+        return events_count
+
+    def items(self):
+        """
+        :return: a generator of (minute, totals of the minute in the order of the columns) of the minutes with events,
+                 sorted by minute
+        """
+        for minute in sorted(self.indexes):
+            index = self.indexes[minute]
+            yield minute, tuple(column[index] for column in self.columns())
+
+
+def aggregate_minutes(events, words=False):
+    """
+    :param events: iterable of dict to be analysed (timestamps in microseconds since EPOCH, in any order)
+    :param words: if the number of words of the events is summed too (see word_metrics)
+    :return: the MinuteRollup with the per minute totals of the events
+    """
+    rollup = MinuteRollup(words)
+    duration_sums, events_counts, edge_duration_sums, edge_events_counts = rollup.columns()[:4]
+    words_sums, weighted_duration_sums, edge_words_sums, edge_weighted_duration_sums = \
+        rollup.words_sums, rollup.weighted_duration_sums, rollup.edge_words_sums, rollup.edge_weighted_duration_sums
+    last_minute = index = None
+    for event in events:
+        timestamp = event['timestamp']
+        duration = event['duration']
+        offset = timestamp % MICROSECONDS_PER_MINUTE
+        # consecutive events usually share the minute, its index only changes when the arrays grow
+        if timestamp - offset != last_minute:
+            last_minute = timestamp - offset
+            index = rollup.index(last_minute)
+        duration_sums[index] += duration
+        events_counts[index] += 1
+        if offset == 0:
+            edge_duration_sums[index] += duration
+            edge_events_counts[index] += 1
+        if words:
+            nr_words = event.get('nr_words') or 0
+            words_sums[index] += nr_words
+            weighted_duration_sums[index] += duration * nr_words
+            if offset == 0:
+                edge_words_sums[index] += nr_words
+                edge_weighted_duration_sums[index] += duration * nr_words
+    return rollup
+
+
+def merge_rollups(rollups):
+    """
+    :param rollups: iterable of MinuteRollup or SparseRollup with the same columns (e.g. one per chunk of the input
+                    file or one per group)
+    :return: a MinuteRollup with the per minute totals of all the events (and the same columns)
+    """
+    merged_rollup = None
+    for rollup in rollups:
+        if merged_rollup is None:
+            merged_rollup = MinuteRollup(rollup.words)
+        merged_rollup.merge(rollup)
+    return MinuteRollup() if merged_rollup is None else merged_rollup
+
+
+def aggregate_groups(events, words=False):
+    """
+    :param events: iterable of dict to be analysed (timestamps in microseconds since EPOCH, in any order)
+    :param words: if the number of words of the events is summed too (see word_metrics)
+    :return: list of dict, one per client name, source and target language, with the SparseRollup of its events
+             ('rollup' key); the list can be filtered with filter_events and the rollups merged with merge_rollups;
+             each event is added to the rollup of its group as it is read, so the events are not kept
+    """
+    groups_rollups = {}
+    for event in events:
+        group = (event['client_name'], event['source_language'], event['target_language'])
+        rollup = groups_rollups.get(group)
+        if rollup is None:
+            rollup = groups_rollups[group] = SparseRollup(words)
+        rollup.add(event['timestamp'], event['duration'], event.get('nr_words') or 0)
+    return [dict(zip(GROUP_BY_KEYS, group), rollup=rollup) for group, rollup in sorted(groups_rollups.items())]
+
+
+def merge_groups(groups, group_keys):
+    """
+    :param groups: list of dict with the client name, languages and SparseRollup ('rollup' key) of every group (see
+                   aggregate_groups)
+    :param group_keys: event keys which define the groups of the output (see check_group_by)
+    :return: a generator of (values of the group keys, MinuteRollup) tuples sorted by group, the rollups of the groups
+             with the same values of the group keys merged when the tuple is read (one merged rollup at a time)
+    """
+    groups_rollups = {}
+    for group in groups:
+        groups_rollups.setdefault(tuple(group[key] for key in group_keys), []).append(group['rollup'])
+    for group, rollups in sorted(groups_rollups.items()):
+        yield group, merge_rollups(rollups)
+
+
+def group_record(dict_entry, group_keys, group):
+    """
+    :param dict_entry: output record of the series of a group
+    :param group_keys: event keys which define the groups (see check_group_by)
+    :param group: values of the group keys of the series
+    :return: the output record tagged with the group keys, after its window_size (if any, see window_series)
+    """
+    if 'window_size' in dict_entry:
+        return dict(window_size=dict_entry['window_size'], **dict(zip(group_keys, group)),
+                    **{key: value for key, value in dict_entry.items() if key != 'window_size'})
+    return dict(zip(group_keys, group), **dict_entry)
+
+
+def mmap_aggregate_groups(input_file, dict_keys_list, validation, rejections, words=False):
+    """
+    :param input_file: path of the file to be analysed (not compressed)
+    :param dict_keys_list: keys that the dict entries must have
+    :param validation: strict, sample or off (see validate_events)
+    :param rejections: Counter updated with the number of rejected events per rejection reason
+    :param words: if the number of words of the events is checked and summed too (see word_metrics)
+    :return: (executes check extension)
+             a message error if the input file does not exist;
+             a IOError if the json file cannot be open/read;
+             tuple with the same groups as aggregate_groups on the valid events and the number of valid events;
+             the file is memory-mapped and the timestamp, duration, number of words (if words is true), client name
+             and languages are read from the bytes of each line, without building the dict of the event, when the
+             line is a single json object without nested values, escaped strings nor duplicate keys (see
+             FLAT_OBJECT); the other lines, and the fields of other types, are decoded as json and checked by
+             check_event, so the valid events are the same as with the lines reader
+    """
+    check_extension(input_file, 'input')
+    if not check_existence(input_file):
+        print('Error! input file ' + input_file + ' does not exist')
+        sys.exit(1)
+    fields = ['timestamp', 'duration', 'event_name'] + GROUP_BY_KEYS + (['nr_words'] if words else [])
+    field_keys = [b'"' + key.encode() + b'"' for key in fields]
+    key_patterns = [re.compile(rb'"' + re.escape(key.encode()) + rb'"\s*:') for key in dict_keys_list
+                    if key not in fields]
+    client_field, source_field, target_field = GROUP_FIELDS
+    groups_rollups = {}
+    # rollups per client name and languages as read from the bytes of the lines, decoded once per group
+    raw_groups_rollups = {}
+    valid_events_count = 0
+    try:
+        with open(input_file, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return [], 0
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                size = len(mm)
+                start = index = 0
+                while start < size:
+                    end = mm.find(b'\n', start)
+                    if end == -1:
+                        end = size
+                    checked = validation == 'strict' or (validation == 'sample' and
+                                                         index % VALIDATION_SAMPLE_RATE == 0)
+                    index += 1
+                    line = mm[start:end]
+                    timestamp = TIMESTAMP_FIELD.search(line)
+                    duration = DURATION_FIELD.search(line)
+                    nr_words = NR_WORDS_FIELD.search(line) if words else None
+                    client = client_field.search(line)
+                    source = source_field.search(line)
+                    target = target_field.search(line)
+                    simple = timestamp and duration and (nr_words or not words) and client and source and target \
+                        and FLAT_OBJECT.fullmatch(line) is not None
+                    if simple:
+                        # json keeps the last value of a duplicate key (the read fields must appear only once)
+                        for key in field_keys:
+                            simple = simple and line.count(key) == 1
+                    if simple and checked:
+                        simple = EVENT_NAME_FIELD.search(line) is not None
+                        for pattern in key_patterns:
+                            simple = simple and pattern.search(line) is not None
+                    if simple:
+                        event_duration = int(duration.group(1))
+                        event_nr_words = int(nr_words.group(1)) if words else 0
+                        # values out of bounds are checked (and rejected) as json
+                        simple = event_duration <= MAX_DURATION and event_nr_words <= MAX_NR_WORDS
+                    if simple:
+                        try:
+                            event_timestamp = parse_timestamp(timestamp.group(1).decode())
+                        except ValueError:
+                            rejections['invalid timestamp'] += 1
+                            start = end + 1
+                            continue
+                        raw_group = (client.group(1), source.group(1), target.group(1))
+                        rollup = raw_groups_rollups.get(raw_group)
+                        if rollup is None:
+                            group = tuple(name.decode() for name in raw_group)
+                            rollup = groups_rollups.get(group)
+                            if rollup is None:
+                                rollup = groups_rollups[group] = SparseRollup(words)
+                            raw_groups_rollups[raw_group] = rollup
+                        rollup.add(event_timestamp, event_duration, event_nr_words)
+                    else:
+                        try:
+                            event = json_loads(line)
+                            if not isinstance(event, dict):
+                                reason = 'missing keys'
+                            elif checked:
+                                reason = check_event(event, dict_keys_list, words)
+                            else:
+                                reason = check_event_timestamp(event)
+                        except ValueError:
+                            reason = 'invalid json'
+                        if reason is not None:
+                            rejections[reason] += 1
+                            start = end + 1
+                            continue
+                        group = (event['client_name'], event['source_language'], event['target_language'])
+                        rollup = groups_rollups.get(group)
+                        if rollup is None:
+                            rollup = groups_rollups[group] = SparseRollup(words)
+                        rollup.add(event['timestamp'], event['duration'], event.get('nr_words') or 0)
+                    valid_events_count += 1
+                    start = end + 1
+    except IOError:
+        print("Error! cannot open/read input file")
+        sys.exit(1)
+    return [dict(zip(GROUP_BY_KEYS, group), rollup=rollup)
+            for group, rollup in sorted(groups_rollups.items(), key=lambda item: item[0])], valid_events_count
+
+
+def minute_moving_average(rollup, window_size, start=None, end=None):
+    """
+    :param rollup: MinuteRollup with the per minute totals of the events (not empty)
+    :param window_size: time window (in minutes) to be considered on the moving average calculation
+    :param start: first minute (in microseconds since EPOCH) of the output (default: first minute with events)
+    :param end: last minute (in microseconds since EPOCH) of the output (default: last minute with events + 1)
+    :return: a list of dict containing the aggregated output (average delivery time per minute);
+             same output as moving_average, reading only the rollup arrays: the window of a minute has the
+             events of the window_size minutes before it plus the events on the exact minute
+    """
+    results_list = []
+    duration_sums, events_counts, edge_duration_sums, edge_events_counts = rollup.columns()[:4]
+    capacity = len(duration_sums)
+    first_index = rollup.first if start is None else (start - rollup.start) // MICROSECONDS_PER_MINUTE
+    last_index = rollup.last + 1 if end is None else (end - rollup.start) // MICROSECONDS_PER_MINUTE
+    # window of the first minute, then the minute leaving the window is replaced by the one entering it
+    window_indexes = range(max(first_index - window_size, 0), min(first_index, capacity))
+    duration_sum = sum(duration_sums[index] for index in window_indexes)
+    events_count = sum(events_counts[index] for index in window_indexes)
+    iterator = rollup.minute(first_index)
+    for index in range(first_index, last_index + 1):
+        in_range = 0 <= index < capacity
+        edge_duration_sum = edge_duration_sums[index] if in_range else 0
+        edge_events_count = edge_events_counts[index] if in_range else 0
+        dict_entry = {'date': micros_to_datetime(iterator),
+                      'average_delivery_time': average_delivery_time(duration_sum + edge_duration_sum,
+                                                                     events_count + edge_events_count)}
+        results_list.append(dict_entry)
+        if in_range:
+            duration_sum += duration_sums[index]
+            events_count += events_counts[index]
+        if 0 <= index - window_size < capacity:
+            duration_sum -= duration_sums[index - window_size]
+            events_count -= events_counts[index - window_size]
+        iterator = iterator + MICROSECONDS_PER_MINUTE
+    return results_list
+
+
+def padded_values(column, lower, upper):
+    """
+    :param column: array of a MinuteRollup
+    :param lower: first index (can be negative)
+    :param upper: index after the last one (can be after the end of the array)
+    :return: list of the values of the column from lower to upper - 1, zeros outside of the array
+    """
+    values = column[max(lower, 0):max(min(upper, len(column)), 0)].tolist()
+    prefix = min(max(-lower, 0), upper - lower)
+    return [0] * prefix + values + [0] * (upper - lower - prefix - len(values))
+
+
+def multi_window_moving_average(rollup, window_sizes, start=None, end=None):
+    """
+    :param rollup: MinuteRollup with the per minute totals of the events (not empty)
+    :param window_sizes: list of time windows (in minutes) to be considered on the moving average calculation
+    :param start: first minute (in microseconds since EPOCH) of the output (default: first minute with events)
+    :param end: last minute (in microseconds since EPOCH) of the output (default: last minute with events + 1)
+    :return: a list of dict containing the aggregated output (average delivery time per minute tagged with its
+             window_size) of every window size, one series after the other; each series is the same as the output
+             of minute_moving_average with its window size, but the window sums of every window size come from the
+             same prefix sums of the rollup arrays and the dates are built once
+    """
+    duration_sums, events_counts, edge_duration_sums, edge_events_counts = rollup.columns()[:4]
+    first_index = rollup.first if start is None else (start - rollup.start) // MICROSECONDS_PER_MINUTE
+    last_index = rollup.last + 1 if end is None else (end - rollup.start) // MICROSECONDS_PER_MINUTE
+    lower_index = first_index - max(window_sizes)
+    # prefix sums of the minutes lower_index to last_index - 1: the window of the output minute at offset i has
+    # the minutes between the positions i and i + max(window_sizes) - window_size of the prefix sums
+    cumulative_durations = list(accumulate(padded_values(duration_sums, lower_index, last_index), initial=0))
+    cumulative_counts = list(accumulate(padded_values(events_counts, lower_index, last_index), initial=0))
+    edge_durations = padded_values(edge_duration_sums, first_index, last_index + 1)
+    edge_counts = padded_values(edge_events_counts, first_index, last_index + 1)
+    dates = [micros_to_datetime(rollup.minute(index)) for index in range(first_index, last_index + 1)]
+    results_list = []
+    for window_size in window_sizes:
+        shift = max(window_sizes) - window_size
+        for offset, date in enumerate(dates):
+            window_end = offset + max(window_sizes)
+            duration_sum = cumulative_durations[window_end] - cumulative_durations[offset + shift] + \
+                edge_durations[offset]
+            events_count = cumulative_counts[window_end] - cumulative_counts[offset + shift] + edge_counts[offset]
+            results_list.append({'window_size': window_size, 'date': date,
+                                 'average_delivery_time': average_delivery_time(duration_sum, events_count)})
+    return results_list
+
+
+def numpy_window_averages(rollup, window_sizes, start=None, end=None):
+    """
+    :param rollup: MinuteRollup with the per minute totals of the events (not empty)
+    :param window_sizes: list of time windows (in minutes) to be considered on the moving average calculation
+    :param start: first minute (in microseconds since EPOCH) of the output (default: first minute with events)
+    :param end: last minute (in microseconds since EPOCH) of the output (default: last minute with events + 1)
+    :return: tuple with the list of the dates of the output minutes and the list of the averages of every window
+             size (same rules as average_delivery_time), read from the rollup arrays as numpy arrays: the window
+             sums of every window size come from the same cumulative sums
+    """
+    first_index = rollup.first if start is None else (start - rollup.start) // MICROSECONDS_PER_MINUTE
+    last_index = rollup.last + 1 if end is None else (end - rollup.start) // MICROSECONDS_PER_MINUTE
+    if last_index < first_index:
+        return [], [[] for _ in window_sizes]
+    # minutes first_index - max(window_sizes) to last_index of the columns, zeros outside of the arrays
+    max_window_size = max(window_sizes)
+    lower_index = first_index - max_window_size
+    columns = []
+    for column in rollup.columns()[:4]:
+        values = np.frombuffer(column, dtype=np.int64)
+        window_values = np.zeros(last_index + 1 - lower_index, dtype=np.int64)
+        copy_start, copy_end = max(lower_index, 0), min(last_index + 1, len(values))
+        if copy_start < copy_end:
+            window_values[copy_start - lower_index:copy_end - lower_index] = values[copy_start:copy_end]
+        columns.append(window_values)
+    duration_sums, events_counts, edge_duration_sums, edge_events_counts = columns
+    # output minute i has the minutes i - window_size to i - 1 plus the events on the exact minute i
+    indexes = np.arange(max_window_size, last_index + 1 - lower_index)
+    cumulative_durations = np.concatenate((np.zeros(1, dtype=np.int64), np.cumsum(duration_sums)))
+    cumulative_counts = np.concatenate((np.zeros(1, dtype=np.int64), np.cumsum(events_counts)))
+    averages_list = []
+    for window_size in window_sizes:
+        window_duration_sums = cumulative_durations[indexes] - cumulative_durations[indexes - window_size] + \
+            edge_duration_sums[indexes]
+        window_events_counts = np.maximum(cumulative_counts[indexes] - cumulative_counts[indexes - window_size] +
+                                          edge_events_counts[indexes], 1)
+        # same rules as average_delivery_time: an int when the division is exact (0 for empty windows), a float
+        # otherwise
+        exact = (window_duration_sums % window_events_counts == 0).tolist()
+        quotients = (window_duration_sums // window_events_counts).tolist()
+        averages = (window_duration_sums / window_events_counts).tolist()
+        averages_list.append([quotient if is_exact else average
+                              for is_exact, quotient, average in zip(exact, quotients, averages)])
+    minutes = rollup.minute(first_index) + (indexes - max_window_size) * MICROSECONDS_PER_MINUTE
+    return minutes.astype('datetime64[us]').tolist(), averages_list
+
+
+def numpy_minute_moving_average(rollup, window_size, start=None, end=None):
+    """
+    :param rollup: MinuteRollup with the per minute totals of the events (not empty)
+    :param window_size: time window (in minutes) to be considered on the moving average calculation
+    :param start: first minute (in microseconds since EPOCH) of the output (default: first minute with events)
+    :param end: last minute (in microseconds since EPOCH) of the output (default: last minute with events + 1)
+    :return: a list of dict containing the aggregated output (average delivery time per minute);
+             same output as minute_moving_average, but the rollup arrays are read as numpy arrays and the window
+             sums come from their cumulative sums (see numpy_window_averages)
+    """
+    dates, (averages,) = numpy_window_averages(rollup, [window_size], start, end)
+    return [{'date': date, 'average_delivery_time': average} for date, average in zip(dates, averages)]
+
+
+def numpy_multi_window_moving_average(rollup, window_sizes, start=None, end=None):
+    """
+    :param rollup: MinuteRollup with the per minute totals of the events (not empty)
+    :param window_sizes: list of time windows (in minutes) to be considered on the moving average calculation
+    :param start: first minute (in microseconds since EPOCH) of the output (default: first minute with events)
+    :param end: last minute (in microseconds since EPOCH) of the output (default: last minute with events + 1)
+    :return: a list of dict containing the aggregated output of every window size; same output as
+             multi_window_moving_average (see numpy_window_averages)
+    """
+    dates, averages_list = numpy_window_averages(rollup, window_sizes, start, end)
+    return [{'window_size': window_size, 'date': date, 'average_delivery_time': average}
+            for window_size, averages in zip(window_sizes, averages_list) for date, average in zip(dates, averages)]
+
+
+def rollup_metrics_moving_average(rollup, window_sizes, metrics, start=None, end=None):
+    """
+    :param rollup: MinuteRollup with the per minute totals of the events and of their words (not empty)
+    :param window_sizes: list of time windows (in minutes) to be considered on the metrics calculation
+    :param metrics: list of (metric, parameter) tuples of ROLLUP_METRICS (see check_metrics)
+    :param start: first minute (in microseconds since EPOCH) of the output (default: first minute with events)
+    :param end: last minute (in microseconds since EPOCH) of the output (default: last minute with events + 1)
+    :return: a list of dict containing the metrics per minute (tagged with its window_size when there are several
+             window sizes), one series after the other: the average delivery time, the one weighted by the number
+             of words and the seconds per word of each window, from the prefix sums of the rollup arrays shared by
+             every window size (see multi_window_moving_average)
+    """
+    columns = rollup.columns()
+    first_index = rollup.first if start is None else (start - rollup.start) // MICROSECONDS_PER_MINUTE
+    last_index = rollup.last + 1 if end is None else (end - rollup.start) // MICROSECONDS_PER_MINUTE
+    max_window_size = max(window_sizes)
+    lower_index = first_index - max_window_size
+    # prefix sums of the sums of durations, numbers of events, sums of words and weighted durations, and the same
+    # totals of the events on the exact minutes
+    cumulative_sums = [list(accumulate(padded_values(columns[index], lower_index, last_index), initial=0))
+                       for index in (0, 1, 4, 5)]
+    edge_sums = [padded_values(columns[index], first_index, last_index + 1) for index in (2, 3, 6, 7)]
+    dates = [micros_to_datetime(rollup.minute(index)) for index in range(first_index, last_index + 1)]
+    keys = [metric_keys(metric, parameter)[0] for metric, parameter in metrics]
+    results_list = []
+    for window_size in window_sizes:
+        shift = max_window_size - window_size
+        for offset, date in enumerate(dates):
+            duration_sum, events_count, words_sum, weighted_duration_sum = [
+                cumulative[offset + max_window_size] - cumulative[offset + shift] + edge[offset]
+                for cumulative, edge in zip(cumulative_sums, edge_sums)]
+            dict_entry = {'window_size': window_size, 'date': date} if len(window_sizes) > 1 else {'date': date}
+            for key, (metric, _) in zip(keys, metrics):
+                if metric == 'avg':
+                    dict_entry[key] = average_delivery_time(duration_sum, events_count)
+                elif metric == 'weighted_avg':
+                    dict_entry[key] = average_delivery_time(weighted_duration_sum, words_sum)
+                else:
+                    dict_entry[key] = average_delivery_time(duration_sum, words_sum)
+            results_list.append(dict_entry)
+    return results_list
+
+
+# moving average engines for the batch mode, reading the per minute rollup (numpy is only available when installed)
+ENGINES = {'python': minute_moving_average, 'numpy': numpy_minute_moving_average}
+# the same engines computing the series of several window sizes at once
+MULTI_WINDOW_ENGINES = {'python': multi_window_moving_average, 'numpy': numpy_multi_window_moving_average}
+
+
+def check_engine(engine):
+    """
+    :param engine: name of the moving average engine selected by the user
+    :return: an error message if the numpy engine is selected but numpy is not installed
+    """
+    if engine == 'numpy' and np is None:
+        print("Error! numpy engine requires numpy to be installed")
+        sys.exit(1)
+
+
+class SlidingWindow:
+    """
+    Moving average aggregator for events pushed in timestamp order: only the events inside the window are kept
+    (memory depends on the window size, not on the number of events) and a minute is emitted as soon as an
+    event newer than it arrives
+    """
+
+    def __init__(self, window_size, start=None, end=None):
+        """
+        :param window_size: time window (in minutes) to be considered on the moving average calculation
+        :param start: first minute (in microseconds since EPOCH) to be emitted, if before the first event
+        :param end: last minute (in microseconds since EPOCH) to be emitted, if after the last event
+        """
+        self.window = window_size * MICROSECONDS_PER_MINUTE
+        self.start = start
+        self.end = end
+        self.events = deque()
+        self.duration_sum = 0
+        self.iterator = None
+        self.last_timestamp = None
+
+    def push(self, timestamp, duration):
+        """
+        :param timestamp: timestamp of the event in microseconds since EPOCH (not older than the previous pushed one)
+        :param duration: duration of the event
+        :return: a generator of the dict (average delivery time per minute) of the minutes closed by the event
+        """
+        if self.iterator is None:
+            self.iterator = timestamp - timestamp % MICROSECONDS_PER_MINUTE
+            if self.start is not None:
+                self.iterator = min(self.iterator, self.start)
+        while self.iterator < timestamp:
+            yield self.emit()
+        self.events.append((timestamp, duration))
+        self.duration_sum += duration
+        self.last_timestamp = timestamp
+
+    def emit(self):
+        """
+        :return: the dict (average delivery time) of the current minute, moving the window to the next one
+        """
+        window_start = self.iterator - self.window
+        while self.events and self.events[0][0] < window_start:
+            self.duration_sum -= self.events.popleft()[1]
+        dict_entry = {'date': micros_to_datetime(self.iterator),
+                      'average_delivery_time': average_delivery_time(self.duration_sum, len(self.events))}
+        self.iterator = self.iterator + MICROSECONDS_PER_MINUTE
+        return dict_entry
+
+    def close(self):
+        """
+        :return: a generator of the dict of the remaining minutes, up to the newest event timestamp + 1 minute
+                 (truncated to minutes), as moving_average does, or up to the end minute if it is after it
+        """
+        if self.last_timestamp is None:
+            return
+        max_timestamp = self.last_timestamp - self.last_timestamp % MICROSECONDS_PER_MINUTE + MICROSECONDS_PER_MINUTE
+        if self.end is not None:
+            max_timestamp = max(max_timestamp, self.end)
+        while self.iterator <= max_timestamp:
+            yield self.emit()
+
+
+def stream_moving_average(events, window_size, start=None, end=None):
+    """
+    :param events: iterable of dict sorted per timestamp (e.g. the generator returned by stream_filter_events)
+    :param window_size: time window (in minutes) to be considered on the moving average calculation
+    :param start: first minute (in microseconds since EPOCH) of the output, if before the first event
+    :param end: last minute (in microseconds since EPOCH) of the output, if after the last event
+    :return: a generator of dict containing the aggregated output (average delivery time per minute);
+             an error message if no event meets the filter condition(s)
+    """
+    sliding_window = SlidingWindow(window_size, start, end)
+    for event in events:
+        yield from sliding_window.push(event['timestamp'], event['duration'])
+    if sliding_window.last_timestamp is None:
+        print("Error! no results found for the selected filters")
+        sys.exit(1)
+    yield from sliding_window.close()
+
+
+class TailWindow:
+    """
+    Moving average aggregator for live events, which can arrive out of order up to lateness: events are kept as per
+    minute totals (only the minutes of the window and the ones still open, so memory does not grow over time) and a
+    minute is emitted as soon as the newest event is more than lateness after it; events older than the emitted
+    minutes are dropped
+    """
+
+    def __init__(self, window_size, lateness):
+        """
+        :param window_size: time window (in minutes) to be considered on the moving average calculation
+        :param lateness: maximum delay (in seconds) of an event after newer ones
+        """
+        self.window_size = window_size
+        self.lateness = lateness * 1000000
+        # minute (in microseconds since EPOCH) -> [sum of durations, number of events and the same on the exact minute]
+        self.minutes = {}
+        # next minute to be emitted (None until the first one) and first minute with events until then
+        self.next_minute = None
+        self.first_minute = None
+        self.max_timestamp = None
+        # totals of the minutes next_minute - window_size - 1 to next_minute - 2 (the last closed window)
+        self.duration_sum = 0
+        self.events_count = 0
+        self.dropped_events = 0
+
+    def push(self, timestamp, duration):
+        """
+        :param timestamp: timestamp of the event in microseconds since EPOCH
+        :param duration: duration of the event
+        :return: a generator of the dict (average delivery time per minute) of the minutes closed by the event;
+                 the event is dropped (and counted) if it belongs to an already emitted minute
+        """
+        if self.next_minute is not None and timestamp <= self.next_minute - MICROSECONDS_PER_MINUTE:
+            self.dropped_events += 1
+            return
+        minute = timestamp - timestamp % MICROSECONDS_PER_MINUTE
+        totals = self.minutes.get(minute)
+        if totals is None:
+            totals = self.minutes[minute] = [0, 0, 0, 0]
+        totals[0] += duration
+        totals[1] += 1
+        if timestamp == minute:
+            totals[2] += duration
+            totals[3] += 1
+        if self.next_minute is None:
+            self.first_minute = minute if self.first_minute is None else min(self.first_minute, minute)
+        self.max_timestamp = timestamp if self.max_timestamp is None else max(self.max_timestamp, timestamp)
+        yield from self.emit_closed(self.max_timestamp - self.lateness)
+
+    def emit_closed(self, watermark):
+        """
+        :param watermark: every event with timestamp lower than the watermark has arrived
+        :return: a generator of the dict of the minutes lower than the watermark not emitted yet
+        """
+        if self.next_minute is None:
+            if self.first_minute is None or self.first_minute >= watermark:
+                return
+            self.next_minute = self.first_minute
+        while self.next_minute < watermark:
+            minute = self.next_minute
+            # the previous minute is closed and enters the window, the minute before the window leaves it
+            entering_totals = self.minutes.get(minute - MICROSECONDS_PER_MINUTE)
+            if entering_totals is not None:
+                self.duration_sum += entering_totals[0]
+                self.events_count += entering_totals[1]
+            leaving_totals = self.minutes.pop(minute - (self.window_size + 1) * MICROSECONDS_PER_MINUTE, None)
+            if leaving_totals is not None:
+                self.duration_sum -= leaving_totals[0]
+                self.events_count -= leaving_totals[1]
+            totals = self.minutes.get(minute, [0, 0, 0, 0])
+            yield {'date': micros_to_datetime(minute),
+                   'average_delivery_time': average_delivery_time(self.duration_sum + totals[2],
+                                                                  self.events_count + totals[3])}
+            self.next_minute = minute + MICROSECONDS_PER_MINUTE
+
+    def close(self):
+        """
+        :return: a generator of the dict of the remaining minutes, up to the newest event timestamp + 1 minute
+                 (truncated to minutes), e.g. at the end of the input
+        """
+        if self.max_timestamp is None:
+            return
+        last_minute = self.max_timestamp - self.max_timestamp % MICROSECONDS_PER_MINUTE + MICROSECONDS_PER_MINUTE
+        yield from self.emit_closed(last_minute + 1)
+
+
+async def read_lines(input_file, poll_interval):
+    """
+    :param input_file: path of the file to be followed or - for the standard input
+    :param poll_interval: seconds to wait before reading the file again when there is nothing new on it
+    :return: an async generator of the complete lines of the input: the lines of the file, including the ones
+             appended after its end is reached (it never stops), or of the standard input until it is closed
+    """
+    if input_file == '-':
+        loop = asyncio.get_running_loop()
+        while True:
+            line = await loop.run_in_executor(None, sys.stdin.readline)
+            if not line:
+                return
+            yield line
+    with open(input_file) as f:
+        partial_line = ''
+        while True:
+            line = f.readline()
+            if not line:
+                await asyncio.sleep(poll_interval)
+                continue
+            partial_line += line
+            if partial_line.endswith('\n'):
+                yield partial_line
+                partial_line = ''
+
+
+async def tail_events(input_file, window_size, lateness, output_file, dict_keys_list, validation, client_name,
+                      source_language, target_language, poll_interval=POLL_INTERVAL):
+    """
+    :param input_file: path of the file to be followed or - for the standard input
+    :param window_size: time window (in minutes) to be considered on the moving average calculation
+    :param lateness: maximum delay (in seconds) of an event after newer ones (see TailWindow)
+    :param output_file: path to where the results are exported (None for unbabel_cli_output.json)
+    :param dict_keys_list: keys that the dict entries must have
+    :param validation: strict, sample or off (see validate_events)
+    :param client_name: client name to filter events
+    :param source_language: source language to filter events
+    :param target_language: target language to filter events
+    :param poll_interval: seconds to wait before reading the input file again when there is nothing new on it
+    :return: (executes check extension and check output file)
+             the dict of each minute written (and flushed) to the output file as soon as the minute closes;
+             a warning message for every invalid or dropped (too late) event;
+             the remaining minutes are written when the standard input is closed
+    """
+    if input_file != '-':
+        check_extension(input_file, 'input')
+        if not check_existence(input_file):
+            print('Error! input file ' + input_file + ' does not exist')
+            sys.exit(1)
+    if output_file is None:
+        output_file = "unbabel_cli_output.json"
+    else:
+        check_output_file(output_file)
+    tail_window = TailWindow(window_size, lateness)
+    index = 0
+    try:
+        with open(output_file, 'w') as outfile:
+            async for line in read_lines(input_file, poll_interval):
+                checked = validation == 'strict' or (validation == 'sample' and index % VALIDATION_SAMPLE_RATE == 0)
+                index += 1
+                try:
+                    event = json_loads(line)
+                    if not isinstance(event, dict):
+                        reason = 'missing keys'
+                    else:
+                        reason = check_event(event, dict_keys_list) if checked else check_event_timestamp(event)
+                except ValueError:
+                    reason = 'invalid json'
+                if reason is not None:
+                    print("Warning! event rejected (" + reason + "): " + line.strip())
+                    continue
+                if (client_name is not None and event['client_name'] != client_name) or \
+                        (source_language is not None and event['source_language'] != source_language) or \
+                        (target_language is not None and event['target_language'] != target_language):
+                    continue
+                dropped_events = tail_window.dropped_events
+                for dict_entry in tail_window.push(event['timestamp'], event['duration']):
+                    outfile.write(encode_record(dict_entry) + '\n')
+                outfile.flush()
+                if tail_window.dropped_events > dropped_events:
+                    print("Warning! event dropped (older than the lateness): " + line.strip())
+            for dict_entry in tail_window.close():
+                outfile.write(encode_record(dict_entry) + '\n')
+    except IOError:
+        print("Error! cannot open/write output file")
+        sys.exit(1)
+
+
+def check_group_by(group_by):
+    """
+    :param group_by: comma separated event keys selected by the user to group the events
+                     (e.g. client_name,target_language)
+    :return: the list of keys;
+             an error message if a key is not one of GROUP_BY_KEYS or is repeated
+    """
+    group_keys = group_by.split(',')
+    for key in group_keys:
+        if key not in GROUP_BY_KEYS:
+            print("Error! events can only be grouped by " + ', '.join(GROUP_BY_KEYS) + ": " + key)
+            sys.exit(1)
+    if len(set(group_keys)) != len(group_keys):
+        print("Error! group by keys must not be repeated: " + group_by)
+        sys.exit(1)
+    return group_keys
+
+
+def group_moving_average(events, window_size, group_keys, start=None, end=None):
+    """
+    :param events: iterable of dict sorted per timestamp (e.g. the list returned by filter_events or the generator
+                   returned by stream_filter_events)
+    :param window_size: time window (in minutes) to be considered on the moving average calculation
+    :param group_keys: event keys which define the groups (see check_group_by)
+    :param start: first minute (in microseconds since EPOCH) of the output of every group, if before its first event
+    :param end: last minute (in microseconds since EPOCH) of the output of every group, if after its last event
+    :return: a generator of dict containing the aggregated output of every group (average delivery time per minute
+             tagged with the group keys), computed in a single pass with one SlidingWindow per group;
+             an error message if no event meets the filter condition(s)
+    """
+    sliding_windows = {}
+    for event in events:
+        group = tuple(event[key] for key in group_keys)
+        sliding_window = sliding_windows.get(group)
+        if sliding_window is None:
+            sliding_window = sliding_windows[group] = SlidingWindow(window_size, start, end)
+        for dict_entry in sliding_window.push(event['timestamp'], event['duration']):
+            yield dict(zip(group_keys, group), **dict_entry)
+    if not sliding_windows:
+        print("Error! no results found for the selected filters")
+        sys.exit(1)
+    for group in sorted(sliding_windows):
+        for dict_entry in sliding_windows[group].close():
+            yield dict(zip(group_keys, group), **dict_entry)
+
+
+def check_metrics(metrics):
+    """
+    :param metrics: comma separated metrics selected by the user (e.g. avg,p50,p90,p99,max,breach>=30)
+    :return: the list of (metric, parameter) tuples: (avg, None), (weighted_avg, None), (seconds_per_word, None),
+             (percentile, p), (max, None) or (breach, threshold);
+             None if only avg was selected (the moving average of the per minute rollups);
+             an error message if a metric is unknown, a percentile is not in ]0, 100], a threshold is not an int or a
+             metric is repeated
+    """
+    metrics_list = []
+    for metric in metrics.split(','):
+        if metric in ('avg', 'weighted_avg', 'seconds_per_word', 'max'):
+            metrics_list.append((metric, None))
+        elif re.fullmatch(r'p\d+(\.\d+)?', metric) and 0 < float(metric[1:]) <= 100:
+            percentile = float(metric[1:])
+            metrics_list.append(('percentile', int(percentile) if percentile.is_integer() else percentile))
+        elif re.fullmatch(r'breach>=\d+', metric):
+            metrics_list.append(('breach', int(metric[len('breach>='):])))
+        else:
+            print("Error! metrics can only be avg, weighted_avg, seconds_per_word, pN (0 < N <= 100), max or breach>=N "
+                  "(N an int): " + metric)
+            sys.exit(1)
+    if len(set(metrics_list)) != len(metrics_list):
+        print("Error! metrics must not be repeated: " + metrics)
+        sys.exit(1)
+    return None if metrics_list == [('avg', None)] else metrics_list
+
+
+def check_metrics_mode(metrics, reader, stream, workers, follow_state, tail, engine='python'):
+    """
+    :param metrics: list of (metric, parameter) tuples (see check_metrics)
+    :param reader: input reader selected by the user (lines or mmap)
+    :param stream: if stream mode was selected
+    :param workers: number of worker processes selected by the user (None if not selected)
+    :param follow_state: path of the follow state file selected by the user (None if not selected)
+    :param tail: if tail mode was selected
+    :param engine: moving average engine selected by the user
+    :return: an error message if metrics other than avg were combined with stream, follow state, tail or the numpy
+             engine (the metrics are only computed in python);
+             an error message if metrics other than ROLLUP_METRICS were combined with the mmap reader or workers
+             (they need the durations of the events, not only the per minute rollups)
+    """
+    if stream or follow_state is not None or tail:
+        print("Error! metrics other than avg cannot be combined with stream, follow state or tail")
+        sys.exit(1)
+    if engine != 'python':
+        print("Error! metrics other than avg cannot be combined with the " + engine + " engine")
+        sys.exit(1)
+    if (reader == 'mmap' or workers is not None) and not rollup_metrics(metrics):
+        print("Error! metrics other than " + ', '.join(ROLLUP_METRICS) + " cannot be combined with mmap reader or "
+              "workers")
+        sys.exit(1)
+
+
+def rollup_metrics(metrics):
+    """
+    :param metrics: list of (metric, parameter) tuples (see check_metrics)
+    :return: true if every metric can be computed from the per minute rollups (see ROLLUP_METRICS)
+    """
+    return all(metric in ROLLUP_METRICS for metric, _ in metrics)
+
+
+def word_metrics(metrics):
+    """
+    :param metrics: list of (metric, parameter) tuples (see check_metrics), None if only avg was selected
+    :return: true if a metric needs the number of words of the events (see WORD_METRICS)
+    """
+    return metrics is not None and any(metric in WORD_METRICS for metric, _ in metrics)
+
+
+def metric_keys(metric, parameter):
+    """
+    :param metric: avg, percentile, max or breach (see check_metrics)
+    :param parameter: percentile or threshold of the metric (None for avg and max)
+    :return: the keys of the metric in the output records
+    """
+    if metric == 'avg':
+        return ['average_delivery_time']
+    if metric == 'weighted_avg':
+        return ['weighted_average_delivery_time']
+    if metric == 'seconds_per_word':
+        return ['seconds_per_word']
+    if metric == 'percentile':
+        return ['p' + str(parameter) + '_delivery_time']
+    if metric == 'max':
+        return ['max_delivery_time']
+    return ['breaches_' + str(parameter), 'breach_ratio_' + str(parameter)]
+
+
+class FenwickTree:
+    """
+    Binary indexed tree of counts per rank (e.g. of the compressed durations of a window): a count is updated, the
+    counts of the lower ranks are summed and the rank of the k-th smallest value is found in O(log(size))
+    """
+
+    def __init__(self, size):
+        """
+        :param size: number of ranks (0 to size - 1)
+        """
+        self.size = size
+        self.tree = array('q', bytes((size + 1) * 8))
+        # highest power of two not greater than size (first step of the search of find)
+        self.top = 1 << (size.bit_length() - 1) if size else 0
+
+    def add(self, rank, delta):
+        """
+        :param rank: rank whose count is updated
+        :param delta: value added to the count of the rank
+        :return: the nodes covering the rank updated
+        """
+        index = rank + 1
+        while index <= self.size:
+            self.tree[index] += delta
+            index += index & -index
+
+    def count_below(self, rank):
+        """
+        :param rank: rank (up to size)
+        :return: the sum of the counts of the ranks lower than rank
+        """
+        total = 0
+        while rank > 0:
+            total += self.tree[rank]
+            rank -= rank & -rank
+        return total
+
+    def find(self, k):
+        """
+        :param k: position (from 1 to the sum of the counts) of a value in sorted order
+        :return: the rank of the k-th smallest value
+        """
+        index = 0
+        step = self.top
+        while step:
+            if index + step <= self.size and self.tree[index + step] < k:
+                index += step
+                k -= self.tree[index]
+            step >>= 1
+        return index
+
+
+class MetricsWindow(SlidingWindow):
+    """
+    Sliding window of events pushed in timestamp order which also keeps the counts of the durations inside the
+    window in a FenwickTree (durations are compressed to their rank among the given ones), so the percentiles, the
+    maximum and the breach counts of each minute cost O(log(distinct durations)) instead of sorting the window, and
+    the running sums of the words and the weighted durations of the window when a metric needs them
+    """
+
+    def __init__(self, window_size, metrics, durations, start=None, end=None):
+        """
+        :param window_size: time window (in minutes) to be considered on the moving average calculation
+        :param metrics: list of (metric, parameter) tuples (see check_metrics)
+        :param durations: every duration which can be pushed (e.g. the ones of the events of the group)
+        :param start: first minute (in microseconds since EPOCH) to be emitted, if before the first event
+        :param end: last minute (in microseconds since EPOCH) to be emitted, if after the last event
+        """
+        super().__init__(window_size, start, end)
+        self.metrics = metrics
+        self.values = sorted(set(durations))
+        self.ranks = {value: rank for rank, value in enumerate(self.values)}
+        self.counts = FenwickTree(len(self.values))
+        # number of words of the events of the window (in the same order), None if no metric needs them
+        self.words = deque() if word_metrics(metrics) else None
+        self.words_sum = 0
+        self.weighted_duration_sum = 0
+
+    def push(self, timestamp, duration, nr_words=0):
+        """
+        :param timestamp: timestamp of the event in microseconds since EPOCH (not older than the previous pushed one)
+        :param duration: duration of the event (one of the durations of the window)
+        :param nr_words: number of words of the event (ignored if no metric needs them)
+        :return: a generator of the dict (metrics per minute) of the minutes closed by the event
+        """
+        yield from super().push(timestamp, duration)
+        self.counts.add(self.ranks[duration], 1)
+        if self.words is not None:
+            self.words.append(nr_words)
+            self.words_sum += nr_words
+            self.weighted_duration_sum += duration * nr_words
+
+    def emit(self):
+        """
+        :return: the dict (metrics) of the current minute, moving the window to the next one
+        """
+        window_start = self.iterator - self.window
+        while self.events and self.events[0][0] < window_start:
+            duration = self.events.popleft()[1]
+            self.duration_sum -= duration
+            self.counts.add(self.ranks[duration], -1)
+            if self.words is not None:
+                nr_words = self.words.popleft()
+                self.words_sum -= nr_words
+                self.weighted_duration_sum -= duration * nr_words
+        events_count = len(self.events)
+        dict_entry = {'date': micros_to_datetime(self.iterator)}
+        for metric, parameter in self.metrics:
+            keys = metric_keys(metric, parameter)
+            if metric == 'avg':
+                dict_entry[keys[0]] = average_delivery_time(self.duration_sum, events_count)
+            elif metric == 'weighted_avg':
+                dict_entry[keys[0]] = average_delivery_time(self.weighted_duration_sum, self.words_sum)
+            elif metric == 'seconds_per_word':
+                dict_entry[keys[0]] = average_delivery_time(self.duration_sum, self.words_sum)
+            elif metric == 'percentile':
+                # nearest rank: the smallest duration with at least parameter % of the window at or below it
+                rank = max(-(-parameter * events_count // 100), 1)
+                dict_entry[keys[0]] = self.values[self.counts.find(rank)] if events_count else 0
+            elif metric == 'max':
+                dict_entry[keys[0]] = self.values[self.counts.find(events_count)] if events_count else 0
+            else:
+                breaches = events_count - self.counts.count_below(bisect_left(self.values, parameter))
+                dict_entry[keys[0]] = breaches
+                dict_entry[keys[1]] = breaches / events_count if events_count else 0
+        self.iterator = self.iterator + MICROSECONDS_PER_MINUTE
+        return dict_entry
+
+
+def metrics_moving_average(events_list, window_size, metrics, group_keys=(), start=None, end=None):
+    """
+    :param events_list: list of dict sorted per timestamp (e.g. the list returned by filter_events)
+    :param window_size: time window (in minutes) to be considered on the metrics calculation
+    :param metrics: list of (metric, parameter) tuples (see check_metrics)
+    :param group_keys: event keys which define the groups (see check_group_by), none by default
+    :param start: first minute (in microseconds since EPOCH) of the output of every group, if before its first event
+    :param end: last minute (in microseconds since EPOCH) of the output of every group, if after its last event
+    :return: a generator of dict containing the metrics per minute of every group (tagged with the group keys), in
+             the same order as group_moving_average, computed with one MetricsWindow per group;
+             an error message if no event meets the filter condition(s)
+    """
+    # the durations of each group, compressed by its MetricsWindow
+    durations = {}
+    for event in events_list:
+        durations.setdefault(tuple(event[key] for key in group_keys), set()).add(event['duration'])
+    if not durations:
+        print("Error! no results found for the selected filters")
+        sys.exit(1)
+    metrics_windows = {group: MetricsWindow(window_size, metrics, group_durations, start, end)
+                       for group, group_durations in durations.items()}
+    for event in events_list:
+        group = tuple(event[key] for key in group_keys)
+        for dict_entry in metrics_windows[group].push(event['timestamp'], event['duration'],
+                                                      event.get('nr_words') or 0):
+            yield dict(zip(group_keys, group), **dict_entry)
+    for group in sorted(metrics_windows):
+        for dict_entry in metrics_windows[group].close():
+            yield dict(zip(group_keys, group), **dict_entry)
+
+
+def split_input_file(input_file, chunks_number):
+    """
+    :param input_file: path of the file to be analysed
+    :param chunks_number: number of chunks to split the file into
+    :return: list of (start, end) byte offsets of the chunks, all of them starting at the beginning of a line
+    """
+    file_size = os.path.getsize(input_file)
+    offsets = [0]
+    with open(input_file, 'rb') as f:
+        for index in range(1, chunks_number):
+            f.seek(file_size * index // chunks_number)
+            # the line crossing the split point belongs to the previous chunk
+            f.readline()
+            offsets.append(max(f.tell(), offsets[-1]))
+    offsets.append(file_size)
+    return [(start, end) for start, end in zip(offsets, offsets[1:]) if start < end]
+
+
+def read_file_range(input_file, start, end):
+    """
+    :param input_file: path of the file to be analysed
+    :param start: byte offset of the first line to be read (beginning of a line)
+    :param end: byte offset after which no line starts to be read
+    :return: a generator of the lines (bytes) of the range, decoded by validate_events
+    """
+    with open(input_file, 'rb') as f:
+        f.seek(start)
+        position = start
+        for line in iter_lines(f):
+            if position >= end:
+                break
+            position += len(line) + 1
+            yield line
+
+
+def aggregate_file_range(input_file, start, end, dict_keys_list, validation, client_name, source_language,
+                         target_language, words=False):
+    """
+    :param input_file: path of the file to be analysed
+    :param start: byte offset of the first line to be read
+    :param end: byte offset after which no line starts to be read
+    :param dict_keys_list: keys that the dict entries must have
+    :param validation: strict, sample or off (see validate_events)
+    :param client_name: client name to filter events
+    :param source_language: source language to filter events
+    :param target_language: target language to filter events
+    :param words: if the number of words of the events is checked and summed too (see word_metrics)
+    :return: (executed by the worker processes)
+             the MinuteRollup of the filtered events of the range,
+             the Counter of rejected events and the number of valid events
+    """
+    rejections = Counter()
+    valid_events = [0]
+
+    def count_valid_events(events):
+        for event in events:
+            valid_events[0] += 1
+            yield event
+
+    events = validate_events(read_file_range(input_file, start, end), dict_keys_list, validation, rejections, words)
+    events = stream_filter_events(count_valid_events(events), client_name, source_language, target_language)
+    return aggregate_minutes(events, words), rejections, valid_events[0]
+
+
+def parallel_aggregate_events(input_file, workers, dict_keys_list, validation, client_name, source_language,
+                              target_language, words=False):
+    """
+    :param input_file: path of the file to be analysed
+    :param workers: number of worker processes (the file is split into as many chunks, on line boundaries)
+    :param dict_keys_list: keys that the dict entries must have
+    :param validation: strict, sample or off (see validate_events)
+    :param client_name: client name to filter events
+    :param source_language: source language to filter events
+    :param target_language: target language to filter events
+    :param words: if the number of words of the events is checked and summed too (see word_metrics)
+    :return: (executes check extension and report rejections)
+             a message error if the input file does not exist;
+             a IOError if the json file cannot be open/read;
+             an error message if no event meets the filter condition(s);
+             the MinuteRollup of the filtered events (merged from the ones of the workers), otherwise
+    """
+    check_extension(input_file, 'input')
+    if not check_existence(input_file):
+        print('Error! input file ' + input_file + ' does not exist')
+        sys.exit(1)
+    try:
+        arguments = [(input_file, start, end, dict_keys_list, validation, client_name, source_language,
+                      target_language, words) for start, end in split_input_file(input_file, workers)]
+        with Pool(workers) as pool:
+            partials = pool.starmap(aggregate_file_range, arguments)
+    except IOError:
+        print("Error! cannot open/read input file")
+        sys.exit(1)
+    rejections = Counter()
+    for _, chunk_rejections, _ in partials:
+        rejections.update(chunk_rejections)
+    report_rejections(rejections, sum(valid_events for _, _, valid_events in partials))
+    rollup = merge_rollups(rollup for rollup, _, _ in partials)
+    if not rollup:
+        print("Error! no results found for the selected filters")
+        sys.exit(1)
+    return rollup
+
+
+def check_uncompressed_input(input_file, mode):
+    """
+    :param input_file: path of the input file
+    :param mode: name of the selected mode (workers, follow state or tail)
+    :return: an error message if the input file is compressed (the mode needs to seek on it)
+    """
+    if input_compression(input_file) is not None:
+        print("Error! " + mode + " cannot be used with a compressed input file")
+        sys.exit(1)
+
+
+def check_workers(workers, group_by_keys):
+    """
+    :param workers: number of worker processes selected by the user
+    :param group_by_keys: event keys selected to group the events (None if not selected)
+    :return: an error message if the number of workers is not a positive integer;
+             an error message if group by was also selected (not supported by the workers)
+    """
+    if workers <= 0:
+        print("Error! number of workers must be greater than 0")
+        sys.exit(1)
+    if group_by_keys is not None:
+        print("Error! workers cannot be combined with group by")
+        sys.exit(1)
+
+
+def file_fingerprint(input_file):
+    """
+    :param input_file: path of the file to be analysed
+    :return: dict with the absolute path, size, modification time and content hash (blake2b) of the file
+    """
+    file_stat = os.stat(input_file)
+    content_hash = hashlib.blake2b(digest_size=16)
+    with open(input_file, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            content_hash.update(block)
+    return {'path': os.path.abspath(input_file), 'size': file_stat.st_size, 'mtime_ns': file_stat.st_mtime_ns,
+            'content_hash': content_hash.hexdigest()}
+
+
+def cache_entry_path(cache_dir, input_file, validation, words=False, reader='lines'):
+    """
+    :param cache_dir: path of the cache directory
+    :param input_file: path of the file to be analysed
+    :param validation: strict, sample or off (the valid events depend on it)
+    :param words: if the rollups have the sums of words (the valid events depend on it too)
+    :param reader: lines or mmap (see check_reader), each reader has its own entry
+    :return: path of the cache entry of the input file
+    """
+    key = hashlib.blake2b((os.path.abspath(input_file) + '\n' + validation + ('\nwords' if words else '') +
+                           '\n' + reader).encode(), digest_size=16)
+    return os.path.join(cache_dir, key.hexdigest() + '.rollup')
+
+
+def load_cached_rollups(cache_dir, input_file, validation, words=False, reader='lines'):
+    """
+    :param cache_dir: path of the cache directory
+    :param input_file: path of the file to be analysed
+    :param validation: strict, sample or off (see validate_events)
+    :param words: if the rollups must have the sums of words (see word_metrics)
+    :param reader: lines or mmap, the reader which aggregated the rollups (see check_reader)
+    :return: None if there is no valid cache entry for the input file (its size, modification time or content
+             changed, or the entry cannot be read);
+             the list returned by aggregate_groups, the Counter of rejected events and the number of valid events
+             stored by store_cached_rollups, otherwise (the entry becomes the most recently used)
+    """
+    entry_path = cache_entry_path(cache_dir, input_file, validation, words, reader)
+    try:
+        with open(entry_path, 'rb') as f:
+            header = json.loads(f.readline())
+            data = memoryview(f.read())
+        file_stat = os.stat(input_file)
+        if header['version'] != CACHE_VERSION or header['words'] != words or header['reader'] != reader or \
+                header['size'] != file_stat.st_size or header['mtime_ns'] != file_stat.st_mtime_ns or \
+                header['content_hash'] != file_fingerprint(input_file)['content_hash']:
+            return None
+        groups = []
+        offset = 0
+        for client_name, source_language, target_language, minutes_number, data_size in header['groups']:
+            rollup = SparseRollup.from_bytes(minutes_number, data[offset:offset + data_size], words)
+            groups.append({'client_name': client_name, 'source_language': source_language,
+                           'target_language': target_language, 'rollup': rollup})
+            offset += data_size
+        # least recently used entries are the first ones to be evicted
+        os.utime(entry_path)
+    except (OSError, ValueError, KeyError):
+        return None
+    return groups, Counter(header['rejections']), header['valid_events']
+
+
+def store_cached_rollups(cache_dir, cache_size, input_file, validation, groups, rejections, valid_events_count,
+                         words=False, reader='lines'):
+    """
+    :param cache_dir: path of the cache directory (created if it does not exist)
+    :param cache_size: maximum size (in megabytes) of the cache directory
+    :param input_file: path of the analysed file
+    :param validation: strict, sample or off (see validate_events)
+    :param groups: list returned by aggregate_groups
+    :param rejections: Counter of rejected events
+    :param valid_events_count: number of valid events
+    :param words: if the rollups have the sums of words (see word_metrics)
+    :param reader: lines or mmap, the reader which aggregated the rollups (see check_reader)
+    :return: the rollups stored on the cache entry of the input file (a json header line followed by the arrays),
+             evicting the least recently used entries to keep the cache under cache_size;
+             the cache is skipped (no error) if it cannot be written
+    """
+    header = dict(file_fingerprint(input_file), version=CACHE_VERSION, validation=validation, words=words,
+                  reader=reader, rejections=dict(rejections), valid_events=valid_events_count, groups=[])
+    data = []
+    for group in groups:
+        rollup = group['rollup']
+        data.append(rollup.to_bytes())
+        header['groups'].append([group['client_name'], group['source_language'], group['target_language'],
+                                 len(rollup), len(data[-1])])
+    entry_path = cache_entry_path(cache_dir, input_file, validation, words, reader)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(entry_path + '.tmp', 'wb') as f:
+            f.write(json.dumps(header).encode() + b'\n')
+            for group_data in data:
+                f.write(group_data)
+        os.replace(entry_path + '.tmp', entry_path)
+        evict_cache(cache_dir, cache_size)
+    except OSError:
+        pass
+
+
+def evict_cache(cache_dir, cache_size):
+    """
+    :param cache_dir: path of the cache directory
+    :param cache_size: maximum size (in megabytes) of the cache directory
+    :return: the least recently used entries (oldest modification time) removed until the cache fits cache_size
+    """
+    entries = []
+    for entry in os.scandir(cache_dir):
+        if entry.name.endswith('.rollup'):
+            entry_stat = entry.stat()
+            entries.append((entry_stat.st_mtime_ns, entry_stat.st_size, entry.path))
+    total_size = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total_size <= cache_size * 1024 * 1024:
+            break
+        os.remove(path)
+        total_size -= size
+
+
+def index_path(input_file):
+    """
+    :param input_file: path of the input file
+    :return: path of the sidecar offset index of the input file
+    """
+    return input_file + INDEX_EXTENSION
+
+
+def write_offset_index(input_file):
+    """
+    :param input_file: path of an uncompressed input file, sorted by timestamp
+    :return: (executes check extension)
+             a message error if the input file does not exist or cannot be read;
+             an error message if the events of the input file are not sorted by timestamp;
+             the sidecar offset index written (see INDEX_HEADER): the byte offset of the first line of every minute
+             with events (lines which cannot be read or have an invalid timestamp are skipped)
+    """
+    check_extension(input_file, 'input')
+    if not check_existence(input_file):
+        print('Error! input file ' + input_file + ' does not exist')
+        sys.exit(1)
+    minutes = array('q')
+    offsets = array('q')
+    last_timestamp = None
+    try:
+        stat = os.stat(input_file)
+        with open(input_file, 'rb') as f:
+            offset = 0
+            for line in iter_lines(f):
+                line_offset = offset
+                offset += len(line) + 1
+                try:
+                    event = json_loads(line)
+                except ValueError:
+                    continue
+                if not isinstance(event, dict) or check_event_timestamp(event) is not None:
+                    continue
+                timestamp = event['timestamp']
+                if last_timestamp is not None and timestamp < last_timestamp:
+                    print("Error! offset index requires events sorted by timestamp: " +
+                          str(micros_to_datetime(timestamp)) + " comes after " +
+                          str(micros_to_datetime(last_timestamp)))
+                    sys.exit(1)
+                last_timestamp = timestamp
+                minute = timestamp - timestamp % MICROSECONDS_PER_MINUTE
+                if not minutes or minutes[-1] != minute:
+                    minutes.append(minute)
+                    offsets.append(line_offset)
+        if sys.byteorder == 'big':
+            minutes.byteswap()
+            offsets.byteswap()
+        with open(index_path(input_file) + '.tmp', 'wb') as f:
+            f.write(INDEX_HEADER.pack(INDEX_MAGIC, stat.st_size, stat.st_mtime_ns, len(minutes)))
+            minutes.tofile(f)
+            offsets.tofile(f)
+        os.replace(index_path(input_file) + '.tmp', index_path(input_file))
+    except IOError:
+        print("Error! cannot read input file or write its offset index")
+        sys.exit(1)
+
+
+def load_offset_index(input_file):
+    """
+    :param input_file: path of the input file
+    :return: tuple with the arrays of minutes and of offsets of the sidecar offset index of the input file;
+             None if there is no index, or it is not valid or older than the input file (size or modification time)
+    """
+    if input_compression(input_file) is not None:
+        return None
+    try:
+        stat = os.stat(input_file)
+        with open(index_path(input_file), 'rb') as f:
+            magic, size, mtime_ns, count = INDEX_HEADER.unpack(f.read(INDEX_HEADER.size))
+            if magic != INDEX_MAGIC or size != stat.st_size or mtime_ns != stat.st_mtime_ns:
+                return None
+            minutes = array('q')
+            offsets = array('q')
+            minutes.fromfile(f, count)
+            offsets.fromfile(f, count)
+    except (OSError, EOFError, struct.error):
+        return None
+    if sys.byteorder == 'big':
+        minutes.byteswap()
+        offsets.byteswap()
+    return minutes, offsets
+
+
+def index_offset(offset_index, timestamp):
+    """
+    :param offset_index: tuple returned by load_offset_index
+    :param timestamp: timestamp (in microseconds since EPOCH) of the first event to be read
+    :return: byte offset of the first line of the minute of the timestamp, or of the next minute with events
+             (binary search on the minutes of the index); None if every indexed minute is before the timestamp
+    """
+    minutes, offsets = offset_index
+    index = bisect_left(minutes, timestamp - timestamp % MICROSECONDS_PER_MINUTE)
+    if index < len(offsets):
+        return offsets[index]
+    return None
+
+
+def range_stream_events(input_file, first_minute, last_minute, window_size):
+    """
+    :param input_file: path of the file to be analysed
+    :param first_minute: first minute of the output (None for no lower bound)
+    :param last_minute: last minute of the output (None for no upper bound)
+    :param window_size: time window (in minutes) to be considered on the moving average calculation
+    :return: tuple with a generator of lines (see stream_lines) and true if the input file has an offset index (its
+             events are sorted); with an index, the reading starts on the first line needed by the first minute
+    """
+    offset_index = None if first_minute is None and last_minute is None else load_offset_index(input_file)
+    if offset_index is None:
+        return stream_lines(input_file), False
+    if first_minute is None:
+        return stream_lines(input_file), True
+    offset = index_offset(offset_index, first_minute - window_size * MICROSECONDS_PER_MINUTE)
+    if offset is None:
+        return iter([]), True
+    return stream_lines(input_file, offset), True
+
+
+def check_time_range_mode(workers, follow_state, tail):
+    """
+    :param workers: number of worker processes selected by the user (None if not selected)
+    :param follow_state: path of the follow state file selected by the user (None if not selected)
+    :param tail: if tail mode was selected
+    :return: an error message if start or end were combined with workers, follow state or tail
+    """
+    if workers is not None or follow_state is not None or tail:
+        print("Error! start and end cannot be combined with workers, follow state or tail")
+        sys.exit(1)
+
+
+class EventStoreError(Exception):
+    """
+    Error of an EventStore (raised instead of exiting, as the command line does)
+    """
+
+
+class EventStore:
+    """
+    Events loaded once, as per minute rollups of every client name, source and target language, to answer moving
+    average queries with any window size, filters and time range without reading the input file again. The merged
+    rollup of each combination of filters is kept after its first query
+    """
+
+    def __init__(self, groups, rejections=None, valid_events_count=None):
+        """
+        :param groups: list of dict with the client name, languages and SparseRollup ('rollup' key) of every group
+                       (see aggregate_groups)
+        :param rejections: Counter with the number of rejected events per rejection reason
+        :param valid_events_count: number of valid events (default: the number of events of the rollups)
+        """
+        self.groups = groups
+        self.rejections = Counter() if rejections is None else rejections
+        if valid_events_count is None:
+            valid_events_count = sum(sum(group['rollup'].events_counts) for group in groups)
+        self.valid_events_count = valid_events_count
+        self.rollups = {}
+
+    @classmethod
+    def from_events(cls, events, validation='strict', dict_keys_list=EVENT_KEYS):
+        """
+        :param events: iterable of dict or of json lines (e.g. the lines of an input file, see validate_events)
+        :param validation: strict, sample or off (see validate_events)
+        :param dict_keys_list: keys that the dict entries must have
+        :return: EventStore of the valid events (the rejected ones are counted in its rejections)
+        """
+        rejections = Counter()
+        return cls(aggregate_groups(validate_events(events, dict_keys_list, validation, rejections)), rejections)
+
+    @classmethod
+    def from_file(cls, input_file, validation='strict', dict_keys_list=EVENT_KEYS):
+        """
+        :param input_file: path of a json file (can be compressed, see DECOMPRESSORS)
+        :param validation: strict, sample or off (see validate_events)
+        :param dict_keys_list: keys that the dict entries must have
+        :return: EventStore of the valid events of the input file;
+                 an EventStoreError if the input file is not a json file, does not exist or cannot be read
+        """
+        compression = input_compression(input_file)
+        if compression is None and not input_file.lower().endswith('.json'):
+            raise EventStoreError('input file must be a json file')
+        if compression == '.zst' and zstandard is None:
+            raise EventStoreError('zstd compressed input file requires zstandard to be installed')
+        if not check_existence(input_file):
+            raise EventStoreError('input file ' + input_file + ' does not exist')
+        try:
+            with open_input(input_file) as f:
+                return cls.from_events(iter_lines(f), validation, dict_keys_list)
+        except INPUT_ERRORS as error:
+            raise EventStoreError('cannot open/read input file ' + input_file) from error
+
+    def rollup(self, client=None, source=None, target=None):
+        """
+        :param client: client name to filter events
+        :param source: source language to filter events
+        :param target: target language to filter events
+        :return: the MinuteRollup of the events which meet the filter condition(s) (merged on the first query);
+                 an EventStoreError if no event meets them
+        """
+        key = (client, source, target)
+        rollup = self.rollups.get(key)
+        if rollup is None:
+            selected_rollups = [group['rollup'] for group in self.groups
+                                if all(value is None or group[group_key] == value
+                                       for group_key, value in zip(GROUP_BY_KEYS, key))]
+            if not selected_rollups:
+                filters = [group_key.replace('_', ' ') + ' ' + str(value)
+                           for group_key, value in zip(GROUP_BY_KEYS, key) if value is not None]
+                raise EventStoreError('no results found for ' + ', '.join(filters) if filters else 'no events loaded')
+            rollup = self.rollups[key] = merge_rollups(selected_rollups)
+        return rollup
+
+    def moving_average(self, window, client=None, source=None, target=None, start=None, end=None):
+        """
+        :param window: time window (in minutes) to be considered on the moving average calculation
+        :param client: client name to filter events
+        :param source: source language to filter events
+        :param target: target language to filter events
+        :param start: first date (datetime or iso format string) of the output (default: first minute with events)
+        :param end: last date (datetime or iso format string) of the output (default: last minute with events + 1)
+        :return: a list of dict containing the aggregated output (average delivery time per minute), the same as
+                 the command line with the same options, restricted to the minutes of the output without start and
+                 end (so a range far from the events does not output every minute of it; empty if they do not
+                 overlap);
+                 an EventStoreError if the window size is not a positive integer, the dates are invalid, the start is
+                 after the end or no event meets the filter condition(s)
+        """
+        if not isinstance(window, int) or isinstance(window, bool) or window <= 0:
+            raise EventStoreError('window size must be greater than 0')
+        rollup = self.rollup(client, source, target)
+        first_minute = last_minute = None
+        if start is not None:
+            start = query_micros(start)
+            # first minute at or after start
+            first_minute = start + (-start) % MICROSECONDS_PER_MINUTE
+        if end is not None:
+            end = query_micros(end)
+            last_minute = end - end % MICROSECONDS_PER_MINUTE
+        if first_minute is not None and last_minute is not None and first_minute > last_minute:
+            raise EventStoreError('start must not be after end')
+        # clamped to the first minute with events and the last one + 1
+        lower = rollup.minute(rollup.first)
+        upper = rollup.minute(rollup.last) + MICROSECONDS_PER_MINUTE
+        first_minute = lower if first_minute is None else max(first_minute, lower)
+        last_minute = upper if last_minute is None else min(last_minute, upper)
+        if first_minute > last_minute:
+            return []
+        # the numpy engine gives the same output, faster on long ranges
+        return ENGINES['python' if np is None else 'numpy'](rollup, window, first_minute, last_minute)
+
+
+def query_micros(date):
+    """
+    :param date: datetime or iso format string (e.g. 2018-12-26 18:11:00)
+    :return: the date in microseconds since EPOCH;
+             an EventStoreError if the date is not valid or has a timezone (the timestamps of the events are naive)
+    """
+    if isinstance(date, str):
+        try:
+            date = datetime.fromisoformat(date)
+        except ValueError:
+            raise EventStoreError('invalid date ' + date) from None
+    if not isinstance(date, datetime):
+        raise EventStoreError('invalid date ' + repr(date))
+    if date.tzinfo is not None:
+        raise EventStoreError('date must not have a timezone: ' + str(date))
+    return datetime_to_micros(date)
+
+
+class AverageServer(ThreadingHTTPServer):
+    """
+    HTTP server answering moving average queries (GET /average?window=10&client=easyjet) from an EventStore loaded
+    once. The response of each query is kept in a LRU cache; the store is loaded again and the cache cleared when
+    the input file changes (size or modification time)
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, input_file, validation='strict', cache_entries=SERVER_CACHE_ENTRIES):
+        """
+        :param address: (host, port) tuple to listen on (port 0 for any free port)
+        :param input_file: path of the input file
+        :param validation: strict, sample or off (see validate_events)
+        :param cache_entries: maximum number of query responses kept
+        """
+        self.input_file = input_file
+        self.validation = validation
+        self.cache_entries = cache_entries
+        self.responses = OrderedDict()
+        self.lock = threading.Lock()
+        self.store, self.fingerprint = self.load()
+        super().__init__(address, AverageRequestHandler)
+
+    def load(self):
+        """
+        :return: tuple with the EventStore of the input file and its (size, modification time) fingerprint
+        """
+        stat = os.stat(self.input_file)
+        return EventStore.from_file(self.input_file, self.validation), (stat.st_size, stat.st_mtime_ns)
+
+    def current_store(self):
+        """
+        :return: the EventStore of the input file, loaded again (and the cached responses cleared) if it changed
+        """
+        stat = os.stat(self.input_file)
+        if (stat.st_size, stat.st_mtime_ns) != self.fingerprint:
+            with self.lock:
+                stat = os.stat(self.input_file)
+                if (stat.st_size, stat.st_mtime_ns) != self.fingerprint:
+                    self.store, self.fingerprint = self.load()
+                    self.responses.clear()
+        return self.store
+
+    def query(self, window, client=None, source=None, target=None, start=None, end=None):
+        """
+        :param window: time window (in minutes) to be considered on the moving average calculation
+        :param client: client name to filter events
+        :param source: source language to filter events
+        :param target: target language to filter events
+        :param start: first date (iso format string) of the output
+        :param end: last date (iso format string) of the output
+        :return: the json lines (bytes) of the moving average, the same as the output file of the command line;
+                 an EventStoreError if the query is not valid (see EventStore.moving_average)
+        """
+        store = self.current_store()
+        key = (window, client, source, target, start, end)
+        with self.lock:
+            response = self.responses.get(key)
+            if response is not None and store is self.store:
+                self.responses.move_to_end(key)
+                return response
+        results_list = store.moving_average(window, client, source, target, start, end)
+        response = ''.join([encode_record(line) + '\n' for line in results_list]).encode()
+        with self.lock:
+            if store is self.store:
+                self.responses[key] = response
+                if len(self.responses) > self.cache_entries:
+                    self.responses.popitem(last=False)
+        return response
+
+
+class AverageRequestHandler(BaseHTTPRequestHandler):
+    """
+    Request handler of AverageServer: GET /average with the window (required), client, source, target, start and
+    end query parameters; the response is the json lines of the moving average (400 with a json error otherwise)
+    """
+
+    protocol_version = 'HTTP/1.1'
+    # headers and body are separate writes, do not wait for the ack of the first one on kept alive connections
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        """
+        :return: the response of the query
+        """
+        url = urlsplit(self.path)
+        if url.path != '/average':
+            self.send_body(404, {'error': 'not found, use /average?window=10'})
+            return
+        try:
+            self.server.current_store()
+        except (EventStoreError, IOError) as error:
+            self.send_body(500, {'error': 'cannot load input file: ' + str(error)})
+            return
+        parameters = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        unknown_parameters = set(parameters) - {'window', 'client', 'source', 'target', 'start', 'end'}
+        try:
+            if unknown_parameters:
+                raise EventStoreError('unknown parameters ' + ', '.join(sorted(unknown_parameters)))
+            try:
+                window = int(parameters.pop('window'))
+            except (KeyError, ValueError):
+                raise EventStoreError('window must be a positive integer') from None
+            response = self.server.query(window, **parameters)
+        except (EventStoreError, TypeError, ValueError) as error:
+            self.send_body(400, {'error': str(error)})
+            return
+        self.send_body(200, response)
+
+    def send_body(self, status, body):
+        """
+        :param status: HTTP status code
+        :param body: json lines (bytes) or dict sent as json
+        :return: the response sent, with its length (the connection is kept alive)
+        """
+        if isinstance(body, dict):
+            body = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/x-ndjson' if status == 200 else 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        """
+        :return: nothing, requests are not logged
+        """
+
+
+def find_lines_end(input_file, start):
+    """
+    :param input_file: path of the file to be analysed
+    :param start: byte offset from which the file is going to be read
+    :return: the byte offset after the last complete line (ending with a new line) of the file, not lower than start;
+             a line still being written is left for the next read
+    """
+    with open(input_file, 'rb') as f:
+        end = f.seek(0, os.SEEK_END)
+        while end > start:
+            block_start = max(end - (1 << 16), start)
+            f.seek(block_start)
+            block = f.read(end - block_start)
+            new_line = block.rfind(b'\n')
+            if new_line >= 0:
+                return block_start + new_line + 1
+            end = block_start
+    return start
+
+
+def follow_events(state_file, input_file, window_size, output_file, dict_keys_list, validation, client_name,
+                  source_language, target_language):
+    """
+    :param state_file: path of the json file where the progress is kept between runs (created on the first run)
+    :param input_file: path of the file to be analysed (append-only, events appended in timestamp order)
+    :param window_size: time window (in minutes) to be considered on the moving average calculation
+    :param output_file: path to where the results are exported (None for unbabel_cli_output.json)
+    :param dict_keys_list: keys that the dict entries must have
+    :param validation: strict, sample or off (see validate_events)
+    :param client_name: client name to filter events
+    :param source_language: source language to filter events
+    :param target_language: target language to filter events
+    :return: (executes check extension and report rejections)
+             the events appended to the input file since the previous run (from the byte offset kept on the state
+             file) aggregated per minute with the window tail kept on the state file; the output minutes which
+             changed (the last ones of the previous run, which could still get events) are replaced on the output
+             file and the new ones appended;
+             an error message if the state file was created with other options, if the input file got smaller or if
+             an appended event changes an output minute which was already final
+    """
+    options = {'input_file': os.path.abspath(input_file),
+               'output_file': os.path.abspath(output_file or "unbabel_cli_output.json"),
+               'window_size': window_size, 'validation': validation, 'client_name': client_name,
+               'source_language': source_language, 'target_language': target_language}
+    check_extension(input_file, 'input')
+    if not check_existence(input_file):
+        print('Error! input file ' + input_file + ' does not exist')
+        sys.exit(1)
+    if check_existence(state_file):
+        try:
+            with open(state_file) as f:
+                state = json.load(f)
+        except (IOError, ValueError):
+            print("Error! cannot open/read state file " + state_file)
+            sys.exit(1)
+        if any(state.get(key) != value for key, value in options.items()):
+            print("Error! state file " + state_file + " was created with other options: " +
+                  json.dumps({key: state.get(key) for key in options}))
+            sys.exit(1)
+    else:
+        if output_file is not None:
+            check_output_file(output_file)
+        state = dict(options, offset=0, output_offset=0, last_timestamp=None, next_minute=None, minutes=[])
+        # the output file is created empty, the following runs replace its last lines
+        open(options['output_file'], 'w').close()
+    if os.path.getsize(input_file) < state['offset']:
+        print("Error! input file " + input_file + " is smaller than on the previous run")
+        sys.exit(1)
+
+    end = find_lines_end(input_file, state['offset'])
+    rollup = MinuteRollup()
+    for minute, totals in state['minutes']:
+        rollup.add_totals(minute, totals)
+    # minutes before next minute were already exported as final
+    next_minute = state['next_minute']
+    last_timestamp = state['last_timestamp']
+    first_minute = None
+    rejections = Counter()
+    valid_events_count = [0]
+
+    def count_valid_events(events):
+        for event in events:
+            valid_events_count[0] += 1
+            yield event
+
+    events = validate_events(read_file_range(input_file, state['offset'], end), dict_keys_list, validation,
+                             rejections)
+    for event in stream_filter_events(count_valid_events(events), client_name, source_language, target_language):
+        timestamp = event['timestamp']
+        if next_minute is not None and timestamp <= next_minute - MICROSECONDS_PER_MINUTE:
+            print("Error! follow mode requires events appended in timestamp order: " +
+                  str(micros_to_datetime(timestamp)) + " changes an already exported minute")
+            sys.exit(1)
+        rollup.add(timestamp, event['duration'])
+        last_timestamp = timestamp if last_timestamp is None else max(last_timestamp, timestamp)
+        minute = timestamp - timestamp % MICROSECONDS_PER_MINUTE
+        first_minute = minute if first_minute is None else min(first_minute, minute)
+    report_rejections(rejections, valid_events_count[0], allow_empty=True)
+
+    if first_minute is not None:
+        start = first_minute if next_minute is None else next_minute
+        end_minute = last_timestamp - last_timestamp % MICROSECONDS_PER_MINUTE + MICROSECONDS_PER_MINUTE
+        # a minute is final once an event newer than it was read (events with its exact timestamp can still come)
+        next_minute = last_timestamp + (-last_timestamp) % MICROSECONDS_PER_MINUTE
+        final_records = (next_minute - start) // MICROSECONDS_PER_MINUTE
+        try:
+            with open(options['output_file'], 'r+b') as outfile:
+                outfile.truncate(state['output_offset'])
+                outfile.seek(state['output_offset'])
+                for index, line in enumerate(minute_moving_average(rollup, window_size, start, end_minute)):
+                    if index == final_records:
+                        state['output_offset'] = outfile.tell()
+                    outfile.write((encode_record(line) + '\n').encode())
+        except IOError:
+            print("Error! cannot open/write output file")
+            sys.exit(1)
+        # window tail: the minutes still needed by the minutes which are not final
+        state['minutes'] = [[minute, list(totals)] for minute, totals in rollup.items()
+                            if minute >= next_minute - window_size * MICROSECONDS_PER_MINUTE]
+        state['next_minute'] = next_minute
+        state['last_timestamp'] = last_timestamp
+    state['offset'] = end
+    try:
+        with open(state_file + '.tmp', 'w') as f:
+            json.dump(state, f)
+        os.replace(state_file + '.tmp', state_file)
+    except IOError:
+        print("Error! cannot write state file " + state_file)
+        sys.exit(1)
+
+
+def check_follow_state(stream, workers, group_by_keys):
+    """
+    :param stream: if stream mode was selected
+    :param workers: number of worker processes selected by the user (None if not selected)
+    :param group_by_keys: event keys selected to group the events (None if not selected)
+    :return: an error message if follow state was combined with stream, workers or group by
+    """
+    if stream or workers is not None or group_by_keys is not None:
+        print("Error! follow state cannot be combined with stream, workers or group by")
+        sys.exit(1)
+
+
+def check_tail(lateness, stream, workers, group_by_keys, follow_state):
+    """
+    :param lateness: maximum delay (in seconds) of an event selected by the user
+    :param stream: if stream mode was selected
+    :param workers: number of worker processes selected by the user (None if not selected)
+    :param group_by_keys: event keys selected to group the events (None if not selected)
+    :param follow_state: path of the follow state file selected by the user (None if not selected)
+    :return: an error message if the lateness is negative;
+             an error message if tail was combined with stream, workers, group by or follow state
+    """
+    if lateness < 0:
+        print("Error! lateness must not be negative")
+        sys.exit(1)
+    if stream or workers is not None or group_by_keys is not None or follow_state is not None:
+        print("Error! tail cannot be combined with stream, workers, group by or follow state")
+        sys.exit(1)
+
+
+def check_reader(reader, input_file, stream, workers, group_by_keys, follow_state, tail):
+    """
+    :param reader: input reader selected by the user (lines or mmap)
+    :param input_file: path of the input file
+    :param stream: if stream mode was selected
+    :param workers: number of worker processes selected by the user (None if not selected)
+    :param group_by_keys: event keys selected to group the events (None if not selected)
+    :param follow_state: path of the follow state file selected by the user (None if not selected)
+    :param tail: if tail mode was selected
+    :return: an error message if the mmap reader was combined with stream, workers, group by, follow state or tail;
+             an error message if the mmap reader is used with a compressed input file
+    """
+    if reader != 'mmap':
+        return
+    if stream or workers is not None or group_by_keys is not None or follow_state is not None or tail:
+        print("Error! mmap reader cannot be combined with stream, workers, group by, follow state or tail")
+        sys.exit(1)
+    check_uncompressed_input(input_file, 'mmap reader')
+
+
+def check_output_format(output_format, group_by_keys, tail, follow_state, metrics=None, window_sizes=None):
+    """
+    :param output_format: output format selected by the user
+    :param group_by_keys: list of keys of the groups (None when the output is not grouped)
+    :param tail: true if tail mode is selected
+    :param follow_state: path of the state file (None when follow mode is not selected)
+    :param metrics: list of (metric, parameter) tuples (None when only the average is selected)
+    :param window_sizes: list of window sizes (None or a single one when the output is one series)
+    :return: an error message if the msgpack format is selected but msgpack is not installed;
+             an error message if the columnar format is selected with group by, metrics or several window sizes
+             (only one series of averages can be stored);
+             an error message if a format other than jsonl is selected in tail or follow mode (lines are appended
+             to the output file)
+    """
+    if output_format == 'msgpack' and msgpack is None:
+        print("Error! msgpack output format requires msgpack to be installed")
+        sys.exit(1)
+    if output_format == 'columnar' and group_by_keys is not None:
+        print("Error! columnar output format cannot be combined with group by")
+        sys.exit(1)
+    if output_format == 'columnar' and metrics is not None:
+        print("Error! columnar output format only supports the avg metric")
+        sys.exit(1)
+    if output_format == 'columnar' and window_sizes is not None and len(window_sizes) > 1:
+        print("Error! columnar output format cannot be combined with several window sizes")
+        sys.exit(1)
+    if output_format != 'jsonl' and (tail or follow_state is not None):
+        print("Error! tail and follow modes only support the jsonl output format")
+        sys.exit(1)
+
+
+def check_output_file(output_file, output_format='jsonl'):
+    """
+    :param output_file: path to where the results gonna be exported
+    :param output_format: format of the output file (see OUTPUT_EXTENSIONS)
+    :return: (executes de extension checker)
+             an error message if the selected output file already exists (does not overwrite)
+    """
+    check_extension(output_file, 'output', OUTPUT_EXTENSIONS[output_format])
+    if check_existence(output_file):
+        print('Error! output file ' + output_file + ' already exists')
+        sys.exit(1)
+
+
+@lru_cache(maxsize=1024)
+def format_hour(year, month, day, hour):
+    """
+    :param year: year of the date
+    :param month: month of the date
+    :param day: day of the date
+    :param hour: hour of the date
+    :return: the "%Y-%m-%d %H:" prefix of the dates of that hour (cached, the output has one date per minute)
+    """
+    return '%04d-%02d-%02d %02d:' % (year, month, day, hour)
+
+
+def format_date(date):
+    """
+    :param date: datetime to be formatted
+    :return: str(date), built from the cached hour prefix when the date has no seconds
+    """
+    if date.second or date.microsecond or date.tzinfo is not None:
+        return str(date)
+    return format_hour(date.year, date.month, date.day, date.hour) + MINUTE_SUFFIXES[date.minute]
+
+
+@lru_cache(maxsize=64)
+def encode_key(key):
+    """
+    :param key: key of an output dict
+    :return: the json encoded key followed by the key separator
+    """
+    return json.dumps(key) + ': '
+
+
+def encode_record(record):
+    """
+    :param record: dict of an output line
+    :return: the json line of the record (without the line break), the same as json.dumps(record, default=str)
+    """
+    fields = []
+    for key, value in record.items():
+        if type(value) is datetime:
+            fields.append(encode_key(key) + '"' + format_date(value) + '"')
+        elif type(value) is int or (type(value) is float and math.isfinite(value)):
+            fields.append(encode_key(key) + repr(value))
+        else:
+            fields.append(encode_key(key) + json.dumps(value, default=str))
+    return '{' + ', '.join(fields) + '}'
+
+
+def batches(results_list, batch_size=WRITE_BATCH_SIZE):
+    """
+    :param results_list: list or generator of output records
+    :param batch_size: maximum number of records per batch
+    :return: a generator of lists of (at most) batch_size consecutive records
+    """
+    iterator = iter(results_list)
+    batch = list(islice(iterator, batch_size))
+    while batch:
+        yield batch
+        batch = list(islice(iterator, batch_size))
+
+
+@contextmanager
+def replacing_file(output_file, mode='w', **kwargs):
+    """
+    :param output_file: path of the output file
+    :param mode: mode in which the file is opened (see open)
+    :param kwargs: other arguments of open
+    :return: a context manager of a temporary file in the same directory, which replaces the output file once the
+             block completes and is removed otherwise (e.g. an error while the input is read in stream mode), so a
+             partial output file is never left behind nor an existing one overwritten by it
+    """
+    temporary_file = output_file + '.tmp'
+    try:
+        with open(temporary_file, mode, **kwargs) as outfile:
+            yield outfile
+        os.replace(temporary_file, output_file)
+    finally:
+        if os.path.exists(temporary_file):
+            os.remove(temporary_file)
+
+
+def write_jsonl(results_list, output_file):
+    """
+    :param results_list: list or generator of output records
+    :param output_file: path of the output file
+    :return: the records written as json lines, one write per batch of records (see replacing_file)
+    """
+    with replacing_file(output_file) as outfile:
+        for batch in batches(results_list):
+            outfile.write(''.join([encode_record(line) + '\n' for line in batch]))
+
+
+def write_csv(results_list, output_file):
+    """
+    :param results_list: list or generator of output records (all of them with the same keys)
+    :param output_file: path of the output file
+    :return: the records written as csv rows, after a header row with their keys (see replacing_file)
+    """
+    with replacing_file(output_file, newline='') as outfile:
+        writer = csv.writer(outfile, lineterminator='\n')
+        for index, batch in enumerate(batches(results_list)):
+            if index == 0:
+                writer.writerow(list(batch[0]))
+            writer.writerows([[format_date(value) if type(value) is datetime else value for value in line.values()]
+                              for line in batch])
+
+
+def write_columnar(results_list, output_file):
+    """
+    :param results_list: list or generator of output records, one per minute
+    :param output_file: path of the output file
+    :return: the COLUMNAR_HEADER (first date and one minute step) followed by the averages as float64, written to a
+             temporary file which replaces the output file once complete (see replacing_file, a partial file would
+             be read as a valid one);
+             an error message if the records are not one per minute
+    """
+    start = None
+    count = 0
+    with replacing_file(output_file, 'wb') as outfile:
+        outfile.write(COLUMNAR_HEADER.pack(COLUMNAR_MAGIC, 0, MICROSECONDS_PER_MINUTE, 0))
+        for batch in batches(results_list):
+            if start is None:
+                start = datetime_to_micros(batch[0]['date'])
+            for index, line in enumerate(batch, count):
+                if datetime_to_micros(line['date']) != start + index * MICROSECONDS_PER_MINUTE:
+                    print("Error! columnar output format requires one record per minute")
+                    sys.exit(1)
+            averages = array('d', [line['average_delivery_time'] for line in batch])
+            if sys.byteorder == 'big':
+                averages.byteswap()
+            averages.tofile(outfile)
+            count += len(batch)
+        outfile.seek(0)
+        outfile.write(COLUMNAR_HEADER.pack(COLUMNAR_MAGIC, start or 0, MICROSECONDS_PER_MINUTE, count))
+
+
+def read_columnar(input_file):
+    """
+    :param input_file: path of a columnar output file
+    :return: tuple with the first date, the step between dates (timedelta) and the array of averages
+    """
+    with open(input_file, 'rb') as f:
+        magic, start, step, count = COLUMNAR_HEADER.unpack(f.read(COLUMNAR_HEADER.size))
+        if magic != COLUMNAR_MAGIC:
+            raise ValueError(input_file + ' is not a columnar output file')
+        averages = array('d')
+        averages.fromfile(f, count)
+    if sys.byteorder == 'big':
+        averages.byteswap()
+    return micros_to_datetime(start), timedelta(microseconds=step), averages
+
+
+def write_msgpack(results_list, output_file):
+    """
+    :param results_list: list or generator of output records
+    :param output_file: path of the output file
+    :return: the records written as consecutive msgpack maps (dates as strings, see replacing_file)
+    """
+    packer = msgpack.Packer()
+    with replacing_file(output_file, 'wb') as outfile:
+        for batch in batches(results_list):
+            outfile.write(b''.join([packer.pack({key: format_date(value) if type(value) is datetime else value
+                                                 for key, value in line.items()}) for line in batch]))
+
+
+OUTPUT_WRITERS = {'jsonl': write_jsonl, 'csv': write_csv, 'columnar': write_columnar, 'msgpack': write_msgpack}
+
+
+def perform_export(results_list, output_file, output_format='jsonl'):
+    """
+    :param results_list: list (or generator, written as it is consumed) of dict containing the aggregated output
+                         (average delivery time per minute)
+    :param output_file: path to where the results gonna be exported
+    :param output_format: format of the output file (see OUTPUT_WRITERS)
+    :return: export results to unbabel_cli_output.json (or the extension of the output format), if the user did
+             not select an output file path (overwrite if the file already exists);
+             exports to the user selection (after executing the output file checker), otherwise;
+             an IOError message if it cannot open/write the output file
+    """
+    if output_file is None:
+        output_file = "unbabel_cli_output" + OUTPUT_EXTENSIONS[output_format]
+    else:
+        check_output_file(output_file, output_format)
+    try:
+        OUTPUT_WRITERS[output_format](results_list, output_file)
+    except IOError:
+        print("Error! cannot open/write output file")
+        sys.exit(1)
+
+
+def max_rss():
+    """
+    :return: maximum resident set size (in bytes) of the process so far; None if it is not available
+    """
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on macos
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+class PipelineStats:
+    """
+    Measures of each stage of a run (see --stats): wall time, CPU time (including the one of the worker processes),
+    records in and out, records per second and peak memory (the peak of the python allocations traced by tracemalloc
+    during the stage and the maximum resident set size of the process at its end).
+    Nothing is measured when it is disabled, so that the stages of the main block are always declared
+    """
+
+    def __init__(self, enabled=True):
+        """
+        :param enabled: if the stages are measured (the memory allocations are traced from now on)
+        """
+        self.enabled = enabled
+        self.stages = []
+        self.start = time.perf_counter()
+        if enabled and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextmanager
+    def stage(self, name):
+        """
+        :param name: name of the stage
+        :return: a context manager yielding the dict of the measures of the stage, whose records_in and records_out
+                 are set by the caller (directly or with count); the measures are appended to the stages when it
+                 exits, even on an error
+        """
+        measures = {'stage': name, 'records_in': None, 'records_out': None}
+        if not self.enabled:
+            yield measures
+            return
+        tracemalloc.reset_peak()
+        wall_start = time.perf_counter()
+        cpu_start = sum(os.times()[:4])
+        try:
+            yield measures
+        finally:
+            measures['wall_time'] = time.perf_counter() - wall_start
+            measures['cpu_time'] = sum(os.times()[:4]) - cpu_start
+            measures['records_per_second'] = (measures['records_in'] / measures['wall_time']
+                                              if measures['records_in'] is not None and measures['wall_time'] else
+                                              None)
+            measures['peak_memory'] = tracemalloc.get_traced_memory()[1]
+            measures['max_rss'] = max_rss()
+            self.stages.append(measures)
+
+    def count(self, records, measures, key):
+        """
+        :param records: iterable of records (events or output records)
+        :param measures: dict of the measures of a stage (see stage)
+        :param key: records_in or records_out
+        :return: a generator of the records, counted on measures[key] as they are consumed;
+                 the records themselves, if the stats are disabled
+        """
+        if not self.enabled:
+            return records
+        measures[key] = measures[key] or 0
+
+        def counted():
+            for record in records:
+                measures[key] += 1
+                yield record
+        return counted()
+
+    def report(self, file=None):
+        """
+        :param file: file where the report is written (default: standard error)
+        :return: the measures of the stages, the total wall time and the maximum resident set size written as one
+                 json line, so that a job scheduler can collect them
+        """
+        file = sys.stderr if file is None else file
+        file.write(json.dumps({'stages': self.stages, 'wall_time': time.perf_counter() - self.start,
+                               'max_rss': max_rss()}) + '\n')
+        file.flush()
+
+
+if __name__ == '__main__' and sys.argv[1:2] == ['index']:
+    # unbabel_cli index --input_file events.json: write the sidecar offset index used by --start
+    parser = argparse.ArgumentParser(prog=sys.argv[0] + ' index')
+    parser.add_argument('--input_file', required=True, type=str, dest="input_file",
+                        help="path to a json file, sorted by timestamp, to be indexed")
+
+    args = parser.parse_args(sys.argv[2:])
+
+    check_uncompressed_input(args.input_file, 'offset index')
+    write_offset_index(args.input_file)
+    sys.exit(0)
+
+
+if __name__ == '__main__' and sys.argv[1:2] == ['serve']:
+    # unbabel_cli serve --input_file events.json: answer moving average queries over HTTP
+    parser = argparse.ArgumentParser(prog=sys.argv[0] + ' serve')
+    parser.add_argument('--input_file', required=True, type=str, dest="input_file",
+                        help="path to a json file containing the stream of events to be analysed")
+    parser.add_argument("--host", default=SERVER_HOST, type=str, dest="host",
+                        help="address to listen on (default: " + SERVER_HOST + ")")
+    parser.add_argument("--port", default=SERVER_PORT, type=int, dest="port",
+                        help="port to listen on (default: " + str(SERVER_PORT) + ")")
+    parser.add_argument("--cache_entries", default=SERVER_CACHE_ENTRIES, type=int, dest="cache_entries",
+                        help="number of query results kept in memory (default: " + str(SERVER_CACHE_ENTRIES) + ")")
+    parser.add_argument("--validate", default="strict", choices=["strict", "sample", "off"], dest="validate",
+                        help="check every event (strict), one event out of " + str(VALIDATION_SAMPLE_RATE) +
+                             " (sample) or none (off); rejected events are skipped")
+
+    args = parser.parse_args(sys.argv[2:])
+
+    try:
+        server = AverageServer((args.host, args.port), args.input_file, args.validate, args.cache_entries)
+    except EventStoreError as error:
+        print("Error! " + str(error))
+        sys.exit(1)
+    except OSError as error:
+        print("Error! cannot listen on " + args.host + ":" + str(args.port) + ": " + str(error))
+        sys.exit(1)
+    print("Serving http://" + args.host + ":" + str(server.server_address[1]) + "/average?window=10")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    sys.exit(0)
+
+
+if __name__ == '__main__':
+    # initialize keys which define the dict structure
+    dict_keys = EVENT_KEYS
+
+    # create parser to read arguments from command line
+    parser = argparse.ArgumentParser()
+    # add the input arguments
+    parser.add_argument('--input_file', required=True, type=str, dest="input_file",
+                        help="path to a json file containing the stream of events to be analysed (can be compressed: "
+                             ".json.gz, .json.bz2, .json.xz or .json.zst)")
+    parser.add_argument('--window_size', required=True, type=str, dest="window_size",
+                        help="time window (in minutes) to be considered on the moving average calculation, or comma "
+                             "separated time windows (e.g. 1,5,15,60) whose series are computed in a single pass")
+    parser.add_argument('--output_file', default=None, type=str, dest="output_file",
+                        help="path to where the aggregated output is going to be export (json file)")
+    parser.add_argument('--client_name', default=None, type=str, dest="client_name",
+                        help="specify a client name in order to calculated his KPI")
+    parser.add_argument("--source_language", default=None, type=str, dest="source_language",
+                        help="specify a source language in order to calculate its KPI ")
+    parser.add_argument("--target_language", default=None, type=str, dest="target_language",
+                        help="specify a target language in order to calculate its KPI")
+    parser.add_argument("--stream", action="store_true", dest="stream",
+                        help="process the input file line by line with bounded memory (events must be sorted by "
+                             "timestamp)")
+    parser.add_argument("--group_by", default=None, type=str, dest="group_by",
+                        help="comma separated keys (" + ",".join(GROUP_BY_KEYS) + ") in order to calculate the KPI of "
+                             "every group in a single run")
+    parser.add_argument("--workers", default=None, type=int, dest="workers",
+                        help="number of processes used to read, check, filter and aggregate per minute the input file")
+    parser.add_argument("--follow_state", "--follow-state", default=None, type=str, dest="follow_state",
+                        help="path to a json state file: only the events appended to the input file since the "
+                             "previous run are processed and the output file is updated")
+    parser.add_argument("--tail", action="store_true", dest="tail",
+                        help="follow the input file (or the standard input with --input_file -) and export each "
+                             "minute as soon as it closes")
+    parser.add_argument("--lateness", default=0, type=int, dest="lateness",
+                        help="maximum delay (in seconds) of an event after newer ones in tail mode, older events are "
+                             "dropped (default: 0)")
+    parser.add_argument("--no_cache", "--no-cache", action="store_true", dest="no_cache",
+                        help="do not read nor write the per minute rollups cache of the input file")
+    parser.add_argument("--cache_dir", default=CACHE_DIR, type=str, dest="cache_dir",
+                        help="directory of the per minute rollups cache (default: " + CACHE_DIR + ")")
+    parser.add_argument("--cache_size", default=CACHE_SIZE, type=int, dest="cache_size",
+                        help="maximum size (in megabytes) of the cache directory, least recently used entries are "
+                             "evicted (default: " + str(CACHE_SIZE) + ")")
+    parser.add_argument("--engine", default="python", choices=sorted(ENGINES), dest="engine",
+                        help="moving average engine used in batch mode (numpy requires numpy to be installed)")
+    parser.add_argument("--validate", default="strict", choices=["strict", "sample", "off"], dest="validate",
+                        help="check every event (strict), one event out of " + str(VALIDATION_SAMPLE_RATE) +
+                             " (sample) or none (off); rejected events are reported and skipped")
+    parser.add_argument("--reader", default="lines", choices=["lines", "mmap"], dest="reader",
+                        help="read the input file line by line into dicts (lines) or memory-map it and read only the "
+                             "fields needed by the moving average (mmap)")
+    parser.add_argument("--start", default=None, type=str, dest="start",
+                        help="first date of the output (e.g. 2018-12-26 18:15:00), only the events it needs are read")
+    parser.add_argument("--end", default=None, type=str, dest="end",
+                        help="last date of the output (e.g. 2018-12-26 19:15:00), only the events it needs are read")
+    parser.add_argument("--sorted", action="store_true", dest="sorted",
+                        help="the input file is sorted by timestamp: stop reading it after --end")
+    parser.add_argument("--output_format", default="jsonl", choices=sorted(OUTPUT_WRITERS), dest="output_format",
+                        help="format of the output file: json lines, csv, columnar (first date, step and float64 "
+                             "averages) or msgpack (requires msgpack to be installed)")
+    parser.add_argument("--memory_limit", "--memory-limit", default=None, type=int, dest="memory_limit",
+                        help="megabytes of events kept in memory to sort an unsorted input file in stream mode (a "
+                             "reorder buffer when it is almost sorted, an external merge sort on temporary files "
+                             "otherwise)")
+    parser.add_argument("--metrics", default="avg", type=str, dest="metrics",
+                        help="comma separated metrics of each window: avg, weighted_avg (weighted by the number of "
+                             "words), seconds_per_word, pN (percentile, e.g. p50,p90,p99), max and breach>=N "
+                             "(number and fraction of deliveries of N or more) (default: avg)")
+    parser.add_argument("--stats", action="store_true", dest="stats",
+                        help="write the wall time, CPU time, records in and out, records per second and peak memory "
+                             "of each stage as a json line on the standard error (tracing the memory slows the run)")
+    parser.add_argument("--profile", default=None, type=str, dest="profile",
+                        help="path to where a cProfile dump of the run is written (e.g. out.prof)")
+
+    args = parser.parse_args()
+
+    # the report and the profile are written on exit, whichever mode ends the run
+    stats = PipelineStats(args.stats)
+    if args.stats:
+        atexit.register(stats.report)
+    if args.profile is not None:
+        profiler = cProfile.Profile()
+        atexit.register(profiler.dump_stats, args.profile)
+        profiler.enable()
+
+    window_sizes = check_window_sizes(args.window_size)
+    if args.memory_limit is not None:
+        check_memory_limit(args.memory_limit, args.stream)
+    if len(window_sizes) > 1:
+        check_window_sizes_mode(args.stream, args.follow_state, args.tail)
+    # the window size of the single series, or the largest one (the events it needs are needed by every series)
+    window_size = max(window_sizes)
+    group_by_keys = check_group_by(args.group_by) if args.group_by is not None else None
+    metrics = check_metrics(args.metrics)
+    if metrics is not None:
+        check_metrics_mode(metrics, args.reader, args.stream, args.workers, args.follow_state, args.tail, args.engine)
+    # nr_words is only checked and summed when a metric needs it
+    words = word_metrics(metrics)
+    check_output_format(args.output_format, group_by_keys, args.tail, args.follow_state, metrics, window_sizes)
+    check_reader(args.reader, args.input_file, args.stream, args.workers, group_by_keys, args.follow_state, args.tail)
+    first_minute, last_minute = check_time_range(args.start, args.end)
+    time_range = first_minute is not None or last_minute is not None
+    if time_range:
+        check_time_range_mode(args.workers, args.follow_state, args.tail)
+
+    if args.tail:
+        check_tail(args.lateness, args.stream, args.workers, group_by_keys, args.follow_state)
+        check_uncompressed_input(args.input_file, 'tail')
+        # live averages, until the standard input is closed (or forever when following a file)
+        with stats.stage('tail_events'):
+            try:
+                asyncio.run(tail_events(args.input_file, window_size, args.lateness, args.output_file, dict_keys,
+                                        args.validate, args.client_name, args.source_language,
+                                        args.target_language))
+            except KeyboardInterrupt:
+                pass
+        sys.exit(0)
+
+    if args.follow_state is not None:
+        check_follow_state(args.stream, args.workers, group_by_keys)
+        check_uncompressed_input(args.input_file, 'follow state')
+        # read only the events appended since the previous run, update the last minutes of the output file
+        with stats.stage('follow_events'):
+            follow_events(args.follow_state, args.input_file, window_size, args.output_file, dict_keys,
+                          args.validate, args.client_name, args.source_language, args.target_language)
+        sys.exit(0)
+
+    if args.stream:
+        # chain reading, checking, filtering, aggregation and export: one event in memory at a time,
+        # plus the ones inside the window(s), so the stages run interleaved and are measured as one
+        with stats.stage('stream') as stage:
+            events, _ = range_stream_events(args.input_file, first_minute, last_minute, window_size)
+            events = stream_check_events(stats.count(events, stage, 'records_in'), dict_keys, args.validate,
+                                         check_order=args.memory_limit is None)
+            if args.memory_limit is not None:
+                # the events are sorted keeping at most the memory limit of them in memory
+                events = external_sort_events(compact_events(events), args.memory_limit)
+            if time_range:
+                # the events are sorted: the reading stops after the end
+                events = range_events(events, first_minute, last_minute, window_size, True)
+            events = stream_filter_events(events, args.client_name, args.source_language, args.target_language)
+            if group_by_keys is not None:
+                results = group_moving_average(events, window_size, group_by_keys, first_minute, last_minute)
+            else:
+                results = stream_moving_average(events, window_size, first_minute, last_minute)
+            if time_range:
+                results = range_results(results, first_minute, last_minute)
+            perform_export(stats.count(results, stage, 'records_out'), args.output_file, args.output_format)
+        sys.exit(0)
+
+    if args.workers is not None:
+        check_workers(args.workers, group_by_keys)
+        check_uncompressed_input(args.input_file, 'workers')
+        # each worker aggregates per minute a chunk of the input file, the windows are computed on the merged minutes
+        check_engine(args.engine)
+        with stats.stage('parallel_aggregate_events') as stage:
+            rollup = parallel_aggregate_events(args.input_file, args.workers, dict_keys, args.validate,
+                                               args.client_name, args.source_language, args.target_language, words)
+            stage['records_out'] = len(rollup)
+        with stats.stage('moving_average') as stage:
+            stage['records_in'] = len(rollup)
+            if metrics is not None:
+                results = rollup_metrics_moving_average(rollup, window_sizes, metrics)
+            elif len(window_sizes) > 1:
+                results = MULTI_WINDOW_ENGINES[args.engine](rollup, window_sizes)
+            else:
+                results = ENGINES[args.engine](rollup, window_size)
+            stage['records_out'] = len(results)
+        with stats.stage('perform_export') as stage:
+            stage['records_in'] = stage['records_out'] = len(results)
+            perform_export(results, args.output_file, args.output_format)
+        sys.exit(0)
+
+    # check required args values
+    check_engine(args.engine)
+    if metrics is not None and not rollup_metrics(metrics):
+        # import events (only the ones needed by the time range), one at a time, and keep only the fields used by
+        # the KPI
+        rejections = Counter()
+        with stats.stage('import_events') as stage:
+            events, sorted_input = range_stream_events(args.input_file, first_minute, last_minute, window_size)
+            events = validate_events(stats.count(events, stage, 'records_in'), dict_keys, args.validate, rejections,
+                                     words)
+            if time_range:
+                events = range_events(events, first_minute, last_minute, window_size, sorted_input or args.sorted)
+            events = list(compact_events(events, words))
+            stage['records_out'] = len(events)
+        report_rejections(rejections, len(events), allow_empty=time_range)
+        if not events:
+            print("Error! no events found between start and end")
+            sys.exit(1)
+        # filter events based on optional args
+        with stats.stage('filter_events') as stage:
+            stage['records_in'] = len(events)
+            events = filter_events(events, args.client_name, args.source_language, args.target_language)
+            stage['records_out'] = len(events)
+        # sort events based on timestamp (needed by the sliding window of each group, or of the single series)
+        with stats.stage('sort_events_timestamp') as stage:
+            stage['records_in'] = stage['records_out'] = len(events)
+            events = sort_events_timestamp(events)
+        # calculates the metrics of every group, exported as they are computed
+        with stats.stage('moving_average') as stage:
+            stage['records_in'] = len(events)
+
+            def moving_average(series_window_size):
+                return metrics_moving_average(events, series_window_size, metrics, group_by_keys or (), first_minute,
+                                              last_minute)
+            if len(window_sizes) > 1:
+                # the sorted events are shared by the series of every window size
+                results = window_series(moving_average, window_sizes)
+            else:
+                results = moving_average(window_size)
+            if time_range:
+                results = range_results(results, first_minute, last_minute)
+            perform_export(stats.count(results, stage, 'records_out'), args.output_file, args.output_format)
+    else:
+        # per minute rollups of every client and language pair, from the cache when the input file did not change
+        series_rollup = None
+        cached_rollups = None
+        if not args.no_cache:
+            with stats.stage('load_cached_rollups'):
+                cached_rollups = load_cached_rollups(args.cache_dir, args.input_file, args.validate, words,
+                                                     args.reader)
+        if cached_rollups is None:
+            rejections = Counter()
+            if args.reader == 'mmap':
+                # read, check and aggregate per minute the events without building their dicts
+                with stats.stage('mmap_aggregate_groups') as stage:
+                    groups, valid_events_count = mmap_aggregate_groups(args.input_file, dict_keys, args.validate,
+                                                                       rejections, words)
+                    stage['records_in'] = valid_events_count + sum(rejections.values())
+                    stage['records_out'] = len(groups)
+                report_rejections(rejections, valid_events_count)
+            elif group_by_keys is None and (args.no_cache or time_range):
+                # no cache entry is stored, so only the events of the selected filters are aggregated, one at a time,
+                # on the per minute rollup of the single series (the groups are only counted, for the filter errors)
+                with stats.stage('aggregate_minutes') as stage:
+                    events, sorted_input = range_stream_events(args.input_file, first_minute, last_minute,
+                                                               window_size)
+                    events = validate_events(stats.count(events, stage, 'records_in'), dict_keys, args.validate,
+                                             rejections, words)
+                    if time_range:
+                        events = range_events(events, first_minute, last_minute, window_size,
+                                              sorted_input or args.sorted)
+                    groups_counts = Counter()
+
+                    def count_groups(events):
+                        for event in events:
+                            groups_counts[(event['client_name'], event['source_language'],
+                                           event['target_language'])] += 1
+                            yield event
+                    series_rollup = aggregate_minutes(stream_filter_events(count_groups(events), args.client_name,
+                                                                           args.source_language,
+                                                                           args.target_language), words)
+                    groups = [dict(zip(GROUP_BY_KEYS, group)) for group in sorted(groups_counts)]
+                    stage['records_out'] = len(series_rollup)
+                valid_events_count = sum(groups_counts.values())
+                report_rejections(rejections, valid_events_count, allow_empty=time_range)
+            else:
+                # import events (only the ones needed by the time range), one at a time, and add each one to the
+                # per minute rollup of its group (in any order) as it is read, so the events are not kept
+                with stats.stage('aggregate_groups') as stage:
+                    events, sorted_input = range_stream_events(args.input_file, first_minute, last_minute,
+                                                               window_size)
+                    events = validate_events(stats.count(events, stage, 'records_in'), dict_keys, args.validate,
+                                             rejections, words)
+                    if time_range:
+                        events = range_events(events, first_minute, last_minute, window_size,
+                                              sorted_input or args.sorted)
+                    groups = aggregate_groups(events, words)
+                    stage['records_out'] = len(groups)
+                valid_events_count = sum(group['rollup'].events_count() for group in groups)
+                report_rejections(rejections, valid_events_count, allow_empty=time_range)
+            # the rollups of a time range do not have every event of the input file
+            if not args.no_cache and (args.reader == 'mmap' or not time_range):
+                with stats.stage('store_cached_rollups'):
+                    store_cached_rollups(args.cache_dir, args.cache_size, args.input_file, args.validate, groups,
+                                         rejections, valid_events_count, words, args.reader)
+        else:
+            groups, rejections, valid_events_count = cached_rollups
+            report_rejections(rejections, valid_events_count)
+        if not groups:
+            print("Error! no events found between start and end")
+            sys.exit(1)
+        # filter groups based on optional args
+        with stats.stage('filter_events') as stage:
+            stage['records_in'] = len(groups)
+            groups = filter_events(groups, args.client_name, args.source_language, args.target_language)
+            stage['records_out'] = len(groups)
+        # calculates the KPI on the merged rollups of the selected groups (every minute of the time range, if any)
+        with stats.stage('moving_average') as stage:
+            def moving_average(series_rollup):
+                if metrics is not None:
+                    # the averages weighted by the words come from the same rollup
+                    return rollup_metrics_moving_average(series_rollup, window_sizes, metrics, first_minute,
+                                                         last_minute)
+                if len(window_sizes) > 1:
+                    # the merged rollup and its prefix sums are shared by the series of every window size
+                    return MULTI_WINDOW_ENGINES[args.engine](series_rollup, window_sizes, first_minute, last_minute)
+                return ENGINES[args.engine](series_rollup, window_size, first_minute, last_minute)
+            if group_by_keys is not None:
+                # one series per group, on the rollups of its client and language pairs merged (one at a time)
+                lower = None if first_minute is None else first_minute - window_size * MICROSECONDS_PER_MINUTE
+                stage['records_in'] = 0
+                results = []
+                for group, rollup in merge_groups(groups, group_by_keys):
+                    # only the groups with events needed by the time range (the rollups can have every event)
+                    if time_range and not rollup.events_count(lower, last_minute):
+                        continue
+                    stage['records_in'] += len(rollup)
+                    results.extend(group_record(dict_entry, group_by_keys, group)
+                                   for dict_entry in moving_average(rollup))
+                if not results:
+                    print("Error! no events found between start and end")
+                    sys.exit(1)
+            elif series_rollup is not None:
+                stage['records_in'] = len(series_rollup)
+                results = moving_average(series_rollup)
+            else:
+                rollup = merge_rollups(group['rollup'] for group in groups)
+                stage['records_in'] = len(rollup)
+                results = moving_average(rollup)
+            stage['records_out'] = len(results)
+        # exports results to the output file
+        with stats.stage('perform_export') as stage:
+            stage['records_in'] = stage['records_out'] = len(results)
+            perform_export(results, args.output_file, args.output_format)